@@ -0,0 +1,567 @@
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+# ============================================
+# Suite de benchmarks reproductible
+#   python bench_suite.py run --sizes 10000,100000,1000000 --out avant.json
+#   python bench_suite.py run --out apres.json
+#   python bench_suite.py compare avant.json apres.json
+# Chaque cas tourne dans un processus neuf ; les classeurs generes sont gardes
+# dans BENCH_DIR pour ne payer l ecriture openpyxl qu une fois.
+# Les variantes ciblees (totals...) mesurent une etape isolee face a son ancienne
+# implementation, sur une feuille construite en memoire.
+# ============================================
+BENCH_DIR = os.environ.get("BENCH_DIR", os.path.join(tempfile.gettempdir(), "smart-excel-bench"))
+GENERATOR_VERSION = "1"
+DEFAULT_SIZES = "10000,100000,1000000"
+VARIANT_MAX_ROWS = 100000
+TOTALS_WIDTHS = (10, 50, 150, 300)
+STATS_WIDTHS = (5, 30, 100)
+FORMATS = ("xlsx", "ods", "csv", "parquet", "arrow")
+# L ancien chargement (openpyxl complet + reecriture) devient tres lent au-dela
+LEGACY_LOADER_MAX_ROWS = 20000
+TARGETED_STAGES = {
+    "loader": ("load_raw_frame", "load_raw_frame_legacy"),
+    "totals": ("filter_totals", "filter_totals_legacy"),
+    "stats": ("numeric_stats", "numeric_stats_legacy", "numeric_stats_mad", "numeric_stats_iqr"),
+    "formats": ("format_to_kpis",),
+}
+STAGES = ("pipeline", "read", "load_grid", "grid_to_frame", "clean", "infer_schema", "basic_stats",
+          "sheets", "prompt_build", "llm_stub") + sum(TARGETED_STAGES.values(), ())
+
+# Schema ventes de create_tests.py, elargi au besoin
+PRODUITS = ['Laptop', 'Smartphone', 'Tablette', 'Imprimante', 'Clavier', 'Souris', 'Ecran', 'Casque',
+            'Webcam', 'Disque Dur', 'RAM', 'GPU', 'CPU', 'Batterie', 'Chargeur', 'Cable HDMI',
+            'Hub USB', 'SSD', 'Router', 'Switch']
+CATEGORIES = ['Informatique', 'Accessoires', 'Stockage', 'Reseau', 'Audio']
+VENDEURS = ['Dupont', 'Martin', 'Bernard', 'Thomas', 'Petit']
+ZONES = ['Abidjan', 'Dakar', 'Lome', 'Cotonou', 'Bamako', 'Niamey']
+
+def case_name(params):
+    if "target" in params:
+        return f"{params['rows']}r_{params['width']}c_{params.get('format', params['target'])}"
+    return (f"{params['rows']}r_{params['width']}c_{params['merged']}m_"
+            f"{params['header_offset']}h_{params['sheets']}s")
+
+def build_cases(sizes):
+    cases = []
+    for rows in sizes:
+        base = {"rows": rows, "width": 8, "merged": 0, "header_offset": 0, "sheets": 1}
+        cases.append({"variant": "base", **base})
+        if rows <= VARIANT_MAX_ROWS:
+            cases.append({"variant": "wide", **base, "width": 40})
+            cases.append({"variant": "merged", **base, "merged": max(1, rows // 50)})
+            cases.append({"variant": "header_offset", **base, "header_offset": 4})
+            cases.append({"variant": "multi_sheet", **base, "sheets": 4})
+            cases.append({"variant": "loader", "target": "loader", **base, "merged": max(1, rows // 50), "header_offset": 2})
+            for width in TOTALS_WIDTHS:
+                cases.append({"variant": "totals", "target": "totals", "rows": rows, "width": width})
+            for width in STATS_WIDTHS:
+                cases.append({"variant": "stats", "target": "stats", "rows": rows, "width": width})
+            for fmt in FORMATS:
+                cases.append({"variant": "formats", "target": "formats", "rows": rows, "width": 7, "format": fmt})
+    return cases
+
+def make_columns(n_rows, width, rng):
+    dates = np.datetime64("2024-01-01") + rng.integers(0, 365, n_rows).astype("timedelta64[D]")
+    columns = [
+        ("Date_Vente", dates.astype("datetime64[s]").astype(object)),
+        ("Produit", rng.choice(PRODUITS, n_rows)),
+        ("Categorie", rng.choice(CATEGORIES, n_rows)),
+        ("Quantite", rng.integers(1, 50, n_rows)),
+        ("Prix_Unitaire", rng.integers(5000, 500000, n_rows)),
+        ("Remise_Pct", rng.choice([0, 5, 10, 15, 20], n_rows)),
+        ("Montant_Total", rng.integers(10000, 2000000, n_rows)),
+        ("Vendeur", rng.choice(VENDEURS, n_rows)),
+    ]
+    for i in range(len(columns), width):
+        if i % 2:
+            columns.append((f"Zone_{i}", rng.choice(ZONES, n_rows)))
+        else:
+            columns.append((f"Montant_{i}", rng.normal(250000, 60000, n_rows).round(2)))
+    return [(name, values.tolist()) for name, values in columns[:width]]
+
+def write_sheet(ws, params, n_rows, rng):
+    width = params["width"]
+    columns = make_columns(n_rows, width, rng)
+    last = get_column_letter(width)
+    if params["header_offset"]:
+        # Titre fusionne sur toute la largeur puis lignes vides, comme un export de rapport
+        ws.append([f"RAPPORT {ws.title}"])
+        ws.merged_cells.add(f"A1:{last}1")
+        for _ in range(params["header_offset"] - 1):
+            ws.append([])
+    header_line = params["header_offset"] + 1
+    ws.append([name for name, _ in columns])
+    # Blocs verticaux fusionnes sur le vendeur, comme dans les exports de paie
+    merged_rows = set()
+    if params["merged"]:
+        col = get_column_letter(min(width, 8))
+        step = max(3, n_rows // params["merged"])
+        for start in range(0, n_rows - 2, step)[:params["merged"]]:
+            first = header_line + 1 + start
+            ws.merged_cells.add(f"{col}{first}:{col}{first + 2}")
+            merged_rows.update((start + 1, start + 2))
+    merged_col = min(width, 8) - 1
+    for pos, row in enumerate(zip(*[values for _, values in columns])):
+        if pos in merged_rows:
+            row = list(row)
+            row[merged_col] = None
+        ws.append(row)
+
+def fixture_path(params, seed):
+    return os.path.join(BENCH_DIR, f"v{GENERATOR_VERSION}_{case_name(params)}_seed{seed}.xlsx")
+
+def make_workbook(params, seed):
+    path = fixture_path(params, seed)
+    if os.path.exists(path):
+        return path
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    per_sheet = -(-params["rows"] // params["sheets"])
+    for i in range(params["sheets"]):
+        n_rows = min(per_sheet, params["rows"] - i * per_sheet)
+        write_sheet(wb.create_sheet(f"Mois_{i + 1:02d}" if params["sheets"] > 1 else "Ventes"), params, n_rows, rng)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    wb.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+# ============================================
+# Mesures (dans le processus du cas)
+# ============================================
+def reset_peak_rss():
+    # Linux : remet VmHWM a la RSS courante pour mesurer le pic d une seule etape
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def measure(fn, repeat):
+    best = float("inf")
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        reset_peak_rss()
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+        peak = max(peak, peak_rss())
+    return result, best, peak
+
+def make_recorder(results, stages, repeat, default_rows):
+    def record(stage, fn, n_rows=default_rows):
+        if stage not in stages:
+            return None
+        result, seconds, rss = measure(fn, repeat)
+        results[stage] = {
+            "seconds": round(seconds, 6),
+            "peak_rss_bytes": rss,
+            "rows_per_second": round(n_rows / seconds, 1) if seconds > 0 else None,
+        }
+        print(f"  {stage:<22} {seconds:>9.3f}s {rss / 1e6:>9.1f}MB {n_rows / seconds if seconds else 0:>12.0f} lignes/s", flush=True)
+        return result
+    return record
+
+def stub_generate_content():
+    import gemini_stub
+
+    async def generate_content(payload):
+        return {"candidates": [{"content": {"parts": [{"text": json.dumps(gemini_stub.STUB_ANALYSIS)}]}}]}
+    return generate_content
+
+def analyze_sheets(main, file_bytes):
+    results = []
+    for name in main.list_data_sheets(file_bytes):
+        grid = main.load_sheet_grid(file_bytes, name)
+        if main.empty_mask(grid).all():
+            continue
+        df, schema = main.type_raw_frame(main.grid_to_raw_frame(grid))
+        results.append(main.build_summary(df, schema["subtotals"]))
+    return results
+
+def run_case(params, seed, repeat, stages):
+    os.environ.setdefault("CACHE_ENABLED", "0")
+    os.environ["TRACE_LOG"] = "0"
+    import llm
+    import main
+    if "target" in params:
+        return run_targeted_case(main, params, seed, repeat, stages)
+    llm.generate_content = stub_generate_content()
+    path = make_workbook(params, seed)
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    rows = params["rows"]
+    if rows >= 1000000:
+        repeat = 1
+    # Hors etape "sheets", seule la feuille active est lue
+    sheet_rows = -(-rows // params["sheets"])
+    results = {}
+    record = make_recorder(results, stages, repeat, sheet_rows)
+
+    # Chemin complet de /analyze, puis chaque etape seule sur la sortie de la precedente
+    record("pipeline", lambda: main.run_pipeline(file_bytes))
+    needs_frames = stages & {"read", "load_grid", "grid_to_frame", "clean", "infer_schema", "basic_stats", "prompt_build", "llm_stub"}
+    if needs_frames:
+        raw = record("read", lambda: main.load_raw_frame(file_bytes))
+        grid = record("load_grid", lambda: main.load_sheet_grid(file_bytes))
+        if grid is not None:
+            record("grid_to_frame", lambda: main.grid_to_raw_frame(grid))
+            del grid
+        if raw is None:
+            raw = main.load_raw_frame(file_bytes)
+        cleaned = record("clean", lambda: main.clean_dataframe(raw.copy()))
+        if cleaned is None:
+            cleaned = main.clean_dataframe(raw.copy())
+        del raw
+        typed = record("infer_schema", lambda: main.infer_schema(cleaned.copy()), len(cleaned))
+        df, schema = typed if typed is not None else main.infer_schema(cleaned.copy())
+        del cleaned
+        basic_stats = record("basic_stats", lambda: main.extract_basic_stats(df, schema), len(df))
+        if basic_stats is None:
+            basic_stats = main.extract_basic_stats(df, schema)
+        record("prompt_build", lambda: main.build_analysis_payload(df, basic_stats, len(df)), len(df))
+        record("llm_stub", lambda: asyncio.run(main.gemini_full_analysis(df, basic_stats, len(df))), len(df))
+    if params["sheets"] > 1:
+        record("sheets", lambda: analyze_sheets(main, file_bytes), rows)
+    return {"name": case_name(params), "params": params, "bytes": len(file_bytes), "stages": results}
+
+# ============================================
+# Variantes ciblees : etape isolee, ancienne implementation en reference
+# ============================================
+def legacy_unmerge_and_fill(file_bytes):
+    # Ancien chemin : classeur complet en memoire, chaque plage defusionnee cellule par cellule puis reecrite
+    wb = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
+    ws = wb.active
+    for merge_range in list(ws.merged_cells.ranges):
+        top_left_value = ws.cell(row=merge_range.min_row, column=merge_range.min_col).value
+        ws.unmerge_cells(str(merge_range))
+        for row in range(merge_range.min_row, merge_range.max_row + 1):
+            for col in range(merge_range.min_col, merge_range.max_col + 1):
+                ws.cell(row=row, column=col).value = top_left_value
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def legacy_read_excel(main, file_bytes):
+    try:
+        cleaned_buffer = legacy_unmerge_and_fill(file_bytes)
+    except Exception:
+        cleaned_buffer = BytesIO(file_bytes)
+    try:
+        df_raw = pd.read_excel(cleaned_buffer, header=None)
+    except Exception:
+        df_raw = pd.read_excel(BytesIO(file_bytes), header=None)
+    header_row = main.detect_header_row(df_raw)
+    cleaned_buffer.seek(0)
+    try:
+        return pd.read_excel(cleaned_buffer, header=header_row)
+    except Exception:
+        return pd.read_excel(BytesIO(file_bytes), header=header_row)
+
+def totals_frame(n_rows, n_cols, seed):
+    # Moitie texte, moitie nombres, un sous-total toutes les 25 lignes
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(n_cols):
+        if i % 2 == 0:
+            data[f"Texte_{i}"] = rng.choice(["RH", "Finance", "IT", "Marketing", "Operations"], n_rows).astype(object)
+        else:
+            data[f"Montant_{i}"] = rng.integers(1000, 1000000, n_rows)
+    df = pd.DataFrame(data)
+    text_cols = [c for c in df.columns if c.startswith("Texte_")]
+    for pos in range(24, n_rows, 25):
+        df.loc[pos, text_cols[pos % len(text_cols)]] = "Sous total"
+    return df
+
+def legacy_filter_totals(df):
+    # Ancienne boucle : une recherche regex par colonne texte
+    for col in df.columns:
+        if df[col].dtype == object:
+            mask = df[col].astype(str).str.lower().str.contains(
+                'total|sous.total|somme|sum|grand total',
+                regex=True, na=False
+            )
+            df = df[~mask]
+    return df.reset_index(drop=True)
+
+def filter_totals(main, df):
+    text_cols = [col for col in df.columns if df[col].dtype == object]
+    mask, _ = main.detect_total_rows(df, text_cols)
+    return df[~mask].reset_index(drop=True)
+
+def stats_frame(n_rows, n_cols, seed):
+    # Colonnes numeriques (5% de vides, quelques valeurs aberrantes) intercalees avec autant de colonnes texte
+    rng = np.random.default_rng(seed)
+    values = rng.normal(50000, 8000, (n_rows, n_cols))
+    values[rng.random((n_rows, n_cols)) < 0.05] = np.nan
+    values[rng.integers(0, n_rows, n_cols), np.arange(n_cols)] *= 10
+    data = {}
+    for i in range(n_cols):
+        data[f"Texte_{i}"] = rng.choice(["RH", "Finance", "IT", "Marketing"], n_rows).astype(object)
+        data[f"Montant_{i}"] = values[:, i].copy()
+    return pd.DataFrame(data)
+
+def amount_columns(df):
+    return [c for c in df.columns if c.startswith("Montant_")]
+
+def legacy_numeric_stats(main, df):
+    # Anciennes boucles KPI + anomalies : une passe pandas par colonne et par indicateur
+    kpis = []
+    anomalies = []
+    for col in amount_columns(df):
+        clean = df[col].dropna()
+        if len(clean) == 0:
+            continue
+        kpi, _ = main.build_kpi(col, clean.count(), clean.sum(), clean.mean(), clean.min(), clean.max(), clean.std())
+        kpis.append(kpi)
+    for col in amount_columns(df):
+        clean = df[col].dropna()
+        if len(clean) < 3:
+            continue
+        mean = clean.mean()
+        std = clean.std()
+        if std == 0:
+            continue
+        outliers = df[abs(df[col] - mean) > 3 * std]
+        if not outliers.empty:
+            anomalies.append(main.build_anomaly(col, len(outliers)))
+    return kpis, anomalies
+
+def numeric_stats(main, df, method="zscore"):
+    cols = amount_columns(df)
+    stats = main.numeric_kernel(df[cols].to_numpy(dtype=float), method)
+    kpis = []
+    anomalies = []
+    for i, col in enumerate(cols):
+        if stats["count"][i] == 0:
+            continue
+        kpi, _ = main.build_kpi(col, stats["count"][i], stats["sum"][i], stats["mean"][i], stats["min"][i], stats["max"][i], stats["std"][i])
+        kpis.append(kpi)
+        if stats["outliers"][i]:
+            anomalies.append(main.build_anomaly(col, stats["outliers"][i]))
+    return kpis, anomalies
+
+def formats_frame(n_rows, seed):
+    # Meme feuille exportee dans chaque format
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Region": rng.choice(["Abidjan", "Dakar", "Lome", "Cotonou", "Bamako"], n_rows),
+        "Produit": rng.choice([f"P{i:02d}" for i in range(15)], n_rows),
+        "Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n_rows), unit="D"),
+        "Quantite": rng.integers(1, 50, n_rows),
+        "Prix_Unitaire": rng.normal(15000, 3000, n_rows).round(2),
+        "Montant": rng.normal(250000, 60000, n_rows).round(2),
+        "Actif": rng.choice(["oui", "non"], n_rows),
+    })
+
+def export(df, fmt):
+    buffer = BytesIO()
+    if fmt == "xlsx":
+        df.to_excel(buffer, index=False)
+    elif fmt == "csv":
+        buffer.write(df.to_csv(index=False, sep=";", decimal=",").encode("utf-8"))
+    elif fmt == "parquet":
+        df.to_parquet(buffer, index=False)
+    elif fmt == "arrow":
+        df.to_feather(buffer)
+    elif fmt == "ods":
+        df.to_excel(buffer, index=False, engine="odf")
+    return buffer.getvalue()
+
+def file_kpis(main, file_bytes):
+    df, schema = main.read_typed_excel(file_bytes)
+    return main.extract_basic_stats(df, schema)["kpis"]
+
+def run_targeted_case(main, params, seed, repeat, stages):
+    if params["rows"] >= 1000000:
+        repeat = 1
+    results = {}
+    record = make_recorder(results, stages, repeat, params["rows"])
+    checks = {}
+    report = {"name": case_name(params), "params": params, "stages": results, "checks": checks}
+    if params["target"] == "loader":
+        with open(make_workbook(params, seed), "rb") as f:
+            file_bytes = f.read()
+        report["bytes"] = len(file_bytes)
+        new = record("load_raw_frame", lambda: main.load_raw_frame(file_bytes))
+        old = None
+        if params["rows"] <= LEGACY_LOADER_MAX_ROWS:
+            old = record("load_raw_frame_legacy", lambda: legacy_read_excel(main, file_bytes))
+        if new is not None and old is not None:
+            checks["identical"] = bool(main.clean_dataframe(old).equals(main.clean_dataframe(new)))
+    elif params["target"] == "totals":
+        df = totals_frame(params["rows"], params["width"], seed)
+        new = record("filter_totals", lambda: filter_totals(main, df))
+        old = record("filter_totals_legacy", lambda: legacy_filter_totals(df))
+        if new is not None and old is not None:
+            checks["identical"] = bool(old.equals(new))
+    elif params["target"] == "stats":
+        df = stats_frame(params["rows"], params["width"], seed)
+        new = record("numeric_stats", lambda: numeric_stats(main, df))
+        old = record("numeric_stats_legacy", lambda: legacy_numeric_stats(main, df))
+        record("numeric_stats_mad", lambda: numeric_stats(main, df, "mad"))
+        record("numeric_stats_iqr", lambda: numeric_stats(main, df, "iqr"))
+        if new is not None and old is not None:
+            checks["identical"] = new == old
+    elif params["target"] == "formats":
+        df = formats_frame(params["rows"], seed)
+        try:
+            file_bytes = export(df, params["format"])
+        except ImportError as e:
+            print(f"  {params['format']} ignore ({e.name} absent)", flush=True)
+            return report
+        report["bytes"] = len(file_bytes)
+        kpis = record("format_to_kpis", lambda: file_kpis(main, file_bytes))
+        if kpis is not None and params["format"] != "xlsx":
+            # Reference : la meme feuille lue depuis son export xlsx
+            checks["identical"] = kpis == file_kpis(main, export(df, "xlsx"))
+    for name, ok in checks.items():
+        print(f"  {name:<22} {ok}", flush=True)
+    return report
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def run_suite(args):
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    stages = set(args.stages.split(",")) if args.stages else set(STAGES)
+    cases = [c for c in build_cases(sizes) if not args.cases or any(f in c["variant"] for f in args.cases.split(","))]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "generator_version": GENERATOR_VERSION,
+        },
+        "cases": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        params = {k: v for k, v in case.items() if k != "variant"}
+        print(f"[BENCH] {case['variant']} {case_name(params)}", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, params, args.seed, args.repeat, stages).result()
+        result["variant"] = case["variant"]
+        report["cases"].append(result)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Resultats ecrits dans {args.out}")
+
+# ============================================
+# Comparaison de deux executions
+# ============================================
+def compare_reports(base, new, threshold, min_seconds, min_rss):
+    base_cases = {c["name"]: c for c in base["cases"]}
+    regressions = []
+    rows = []
+    for case in new["cases"]:
+        old_case = base_cases.get(case["name"])
+        if old_case is None:
+            continue
+        for stage, stats in case["stages"].items():
+            old = old_case["stages"].get(stage)
+            if old is None:
+                continue
+            ratio = stats["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+            rss_ratio = stats["peak_rss_bytes"] / old["peak_rss_bytes"] if old["peak_rss_bytes"] else 1.0
+            flags = []
+            if ratio > 1 + threshold and stats["seconds"] - old["seconds"] > min_seconds:
+                flags.append("TEMPS")
+            if rss_ratio > 1 + threshold and stats["peak_rss_bytes"] - old["peak_rss_bytes"] > min_rss:
+                flags.append("MEMOIRE")
+            rows.append((case["name"], stage, old["seconds"], stats["seconds"], ratio, rss_ratio, flags))
+            if flags:
+                regressions.append((case["name"], stage, flags))
+        # Variantes ciblees : le resultat doit rester celui de l ancienne implementation
+        for check, ok in case.get("checks", {}).items():
+            if not ok:
+                regressions.append((case["name"], check, ["ECART"]))
+    return rows, regressions
+
+def run_compare(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows, regressions = compare_reports(base, new, args.threshold, args.min_seconds, args.min_rss_mb * 1024 * 1024)
+    print(f"base {base['meta'].get('commit')} -> nouveau {new['meta'].get('commit')} (seuil {args.threshold:.0%})")
+    print(f"{'cas':<28} {'etape':<22} {'avant (s)':>10} {'apres (s)':>10} {'temps':>7} {'memoire':>8}")
+    for name, stage, old_s, new_s, ratio, rss_ratio, flags in rows:
+        print(f"{name:<28} {stage:<22} {old_s:>10.3f} {new_s:>10.3f} {ratio:>6.2f}x {rss_ratio:>7.2f}x  {' '.join(flags)}")
+    for name, check, flags in regressions:
+        if flags == ["ECART"]:
+            print(f"{name:<28} {check:<22} resultat different de la reference")
+    if regressions:
+        print(f"[BENCH] {len(regressions)} regression(s) detectee(s)")
+        return 1
+    print("[BENCH] Aucune regression")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks du pipeline d analyse")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Mesurer le pipeline et ecrire un JSON")
+    run.add_argument("--sizes", default=DEFAULT_SIZES, help="Nombres de lignes, separes par des virgules")
+    run.add_argument("--cases", default="", help="Variantes a garder (base,wide,merged,header_offset,multi_sheet,loader,totals,stats,formats)")
+    run.add_argument("--stages", default="", help=f"Etapes a mesurer ({','.join(STAGES)})")
+    run.add_argument("--repeat", type=int, default=3, help="Meilleur temps sur N essais (1 au-dela d un million de lignes)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--out", default="bench_results.json")
+    compare = sub.add_parser("compare", help="Comparer deux JSON et signaler les regressions")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.15, help="Hausse relative toleree")
+    compare.add_argument("--min-seconds", type=float, default=0.01, help="Ecart absolu minimal pour signaler un temps")
+    compare.add_argument("--min-rss-mb", type=float, default=16, help="Ecart absolu minimal pour signaler la memoire")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "run":
+        run_suite(args)
+    else:
+        sys.exit(run_compare(args))
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "smart-excel-cache"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_MB", "500")) * 1024 * 1024
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_HOURS", "168")) * 3600
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") != "0"
+
+def derive_key(content_digest, version):
+    # Le SHA-256 du fichier est calcule une fois (a la reception) ; chaque version ou feuille en derive sa cle
+    return hashlib.sha256(f"{version}\0{content_digest}".encode("utf-8")).hexdigest()
+
+def entry_dir(key):
+    return os.path.join(CACHE_DIR, key[:2], key)
+
+def entry_path(key, name):
+    return os.path.join(entry_dir(key), name)
+
+def is_expired(path):
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            created = json.load(f)["created"]
+    except Exception:
+        try:
+            created = os.path.getmtime(path)
+        except OSError:
+            return True
+    return time.time() - created > CACHE_TTL_SECONDS
+
+def touch(key):
+    try:
+        os.utime(entry_dir(key))
+    except OSError:
+        pass
+
+def ensure_entry(key):
+    path = entry_dir(key)
+    os.makedirs(path, exist_ok=True)
+    meta = os.path.join(path, "meta.json")
+    if not os.path.exists(meta):
+        write_atomic(meta, json.dumps({"created": time.time()}).encode("utf-8"))
+    return path
+
+def renew(key):
+    # Repart pour une duree de vie complete (entrees mises a jour en place)
+    path = ensure_entry(key)
+    write_atomic(os.path.join(path, "meta.json"), json.dumps({"created": time.time()}).encode("utf-8"))
+
+def write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def load_json(key, name):
+    if not CACHE_ENABLED:
+        return None
+    path = entry_path(key, f"{name}.json")
+    if not os.path.exists(path) or is_expired(entry_dir(key)):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    touch(key)
+    return data
+
+def store_json(key, name, data):
+    if not CACHE_ENABLED:
+        return
+    try:
+        ensure_entry(key)
+        write_atomic(entry_path(key, f"{name}.json"), json.dumps(data, ensure_ascii=True, default=str).encode("utf-8"))
+        evict()
+    except Exception as e:
+        print(f"[CACHE] Ecriture impossible ({name}): {e}")
+
+def dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+def evict():
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for prefix in os.listdir(CACHE_DIR):
+        prefix_dir = os.path.join(CACHE_DIR, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for key in os.listdir(prefix_dir):
+            path = os.path.join(prefix_dir, key)
+            if is_expired(path):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            try:
+                entries.append((os.path.getmtime(path), dir_size(path), path))
+            except OSError:
+                pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -0,0 +1,208 @@
+import json
+import operator
+import os
+import tempfile
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:
+    pa = None
+
+import cache
+
+DATASET_ENABLED = os.environ.get("DATASET_ENABLED", "1") != "0"
+DATASET_BATCH_ROWS = int(os.environ.get("DATASET_BATCH_ROWS", "65536"))
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = int(os.environ.get("QUERY_MAX_LIMIT", "5000"))
+ROW_COLUMN = "__ligne__"
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+AGGREGATES = ("sum", "mean", "min", "max", "count", "count_distinct")
+
+# ============================================
+# Stockage : fichier Arrow IPC non compresse, lu en memory-map
+# ============================================
+def dataset_path(key):
+    return os.path.abspath(cache.entry_path(key, "frame.arrow"))
+
+def arrow_table(df):
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Colonnes objet melangeant les types (booleens et texte...) : stockees en texte
+        mixed = {c: df[c].astype(str).where(df[c].notna(), None) for c in df.columns if df[c].dtype == object}
+        return pa.Table.from_pandas(df.assign(**mixed), preserve_index=False)
+
+def store(key, df, number_cols=(), partial=False):
+    # Le DataFrame nettoye + le numero de ligne, par lots pour que les filtres avancent lot par lot.
+    # partial : echantillon du mode streaming, garde pour le prompt mais pas interrogeable
+    if not DATASET_ENABLED or df is None or pa is None:
+        return
+    try:
+        cache.ensure_entry(key)
+        table = arrow_table(df)
+        table = table.append_column(ROW_COLUMN, pa.array(np.arange(len(df), dtype=np.int64)))
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"number_cols"] = json.dumps([str(c) for c in number_cols]).encode("utf-8")
+        metadata[b"partial"] = b"1" if partial else b"0"
+        table = table.replace_schema_metadata(metadata)
+        path = dataset_path(key)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        os.close(fd)
+        try:
+            with pa.ipc.new_file(tmp, table.schema) as writer:
+                writer.write_table(table, max_chunksize=DATASET_BATCH_ROWS)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        cache.evict()
+    except Exception as e:
+        print(f"[DATASET] Jeu de donnees non enregistre: {e}")
+
+def available(key):
+    return pa is not None and os.path.exists(dataset_path(key)) and not cache.is_expired(cache.entry_dir(key))
+
+def open_dataset(key):
+    if not available(key):
+        return None
+    cache.touch(key)
+    return ds.dataset(dataset_path(key), format="ipc", filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+def is_partial(dataset):
+    return (dataset.schema.metadata or {}).get(b"partial") == b"1"
+
+def queryable(key):
+    # Identifiant expose au client seulement si toutes les lignes sont stockees
+    dataset = open_dataset(key)
+    return key if dataset is not None and not is_partial(dataset) else None
+
+def open_queryable(key):
+    dataset = open_dataset(key)
+    if dataset is None:
+        raise ValueError("Jeu de donnees introuvable ou expire, relancer l analyse")
+    if is_partial(dataset):
+        raise ValueError("Fichier analyse en streaming : seul un echantillon est conserve")
+    return dataset
+
+def load_frame(key):
+    dataset = open_dataset(key)
+    if dataset is None:
+        return None
+    try:
+        table = dataset.to_table()
+    except Exception:
+        return None
+    return table.drop_columns([ROW_COLUMN]).to_pandas()
+
+def number_columns(dataset):
+    names = json.loads((dataset.schema.metadata or {}).get(b"number_cols", b"[]"))
+    return [name for name in names if name in dataset.schema.names]
+
+# ============================================
+# Requetes : filtre pousse au scan, puis groupby / tri / pagination
+# ============================================
+def require_column(names, column):
+    if column not in names:
+        raise ValueError(f"Colonne inconnue : {column}")
+    return column
+
+def value_type(field):
+    return field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+
+def compare_type(field, values):
+    # Colonnes numeriques compactees (int8, float32...) : comparaison en int64 / float64,
+    # sinon une valeur hors de l intervalle du stockage ou decimale serait refusee
+    storage = value_type(field)
+    if pa.types.is_integer(storage):
+        return pa.float64() if any(isinstance(v, float) for v in values) else pa.int64()
+    if pa.types.is_floating(storage):
+        return pa.float64()
+    return storage
+
+def literal(field, value, target):
+    try:
+        return pa.scalar(value).cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        raise ValueError(f"Valeur incompatible avec la colonne {field.name} : {value!r}")
+
+def build_filter(schema, filters):
+    expression = None
+    for item in filters or []:
+        column = require_column(schema.names, item.get("column"))
+        op = item.get("op", "==")
+        field, ref, value = schema.field(column), pc.field(column), item.get("value")
+        target = compare_type(field, value if isinstance(value, list) else [value])
+        if op in ("in", "not_in") or op in COMPARISONS:
+            ref = ref if target == value_type(field) else ref.cast(target)
+        if op == "is_null":
+            condition = ref.is_null()
+        elif op == "not_null":
+            condition = ref.is_valid()
+        elif op in ("in", "not_in"):
+            if not isinstance(value, list):
+                raise ValueError(f"'{op}' attend une liste de valeurs")
+            condition = ref.isin(pa.array([literal(field, v, target).as_py() for v in value], type=target))
+            if op == "not_in":
+                condition = ~condition
+        elif op == "contains":
+            condition = pc.match_substring(ref.cast(value_type(field)), str(value), ignore_case=True)
+        elif op in COMPARISONS:
+            condition = COMPARISONS[op](ref, literal(field, value, target))
+        else:
+            raise ValueError(f"Operateur inconnu : {op}")
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def decode(table, columns):
+    # Les colonnes categorielles (dictionnaires Arrow) ne se trient pas telles quelles
+    for name in columns:
+        field = table.schema.field(name)
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(table.schema.get_field_index(name), name, table.column(name).cast(field.type.value_type))
+    return table
+
+def query(key, spec):
+    # spec : filters, columns, group_by, aggregates, sort, offset, limit
+    dataset = open_queryable(key)
+    names = dataset.schema.names
+    group_by = [require_column(names, c) for c in spec.get("group_by") or []]
+    aggregates = []
+    for item in spec.get("aggregates") or []:
+        if item.get("op") not in AGGREGATES:
+            raise ValueError(f"Agregat inconnu : {item.get('op')}")
+        aggregates.append((require_column(names, item.get("column")), item["op"]))
+    grouped = bool(group_by or aggregates)
+    if grouped:
+        columns = list(dict.fromkeys(group_by + [c for c, _ in aggregates]))
+    else:
+        columns = [require_column(names, c) for c in spec.get("columns") or names if c != ROW_COLUMN] + [ROW_COLUMN]
+    # Projection et predicat passes au scanner : seules les colonnes utiles sont lues
+    table = dataset.to_table(columns=columns, filter=build_filter(dataset.schema, spec.get("filters")))
+    if grouped:
+        table = table.group_by(group_by).aggregate(aggregates or [([], "count_all")])
+    sort = [(require_column(table.column_names, s.get("column")), "descending" if s.get("descending") else "ascending")
+            for s in spec.get("sort") or []]
+    if sort:
+        table = decode(table, [name for name, _ in sort]).sort_by(sort)
+    offset = max(int(spec.get("offset", 0)), 0)
+    limit = min(max(int(spec.get("limit", QUERY_DEFAULT_LIMIT)), 0), QUERY_MAX_LIMIT)
+    return table.slice(offset, limit), {"total": table.num_rows, "offset": offset, "limit": limit}
+
+def number_frame(key):
+    # Colonnes numeriques + numeros de ligne, pour retrouver les lignes derriere chaque anomalie
+    dataset = open_queryable(key)
+    columns = number_columns(dataset)
+    table = dataset.to_table(columns=columns + [ROW_COLUMN])
+    return table.select(columns).to_pandas(), table.column(ROW_COLUMN).to_numpy()
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ============================================
+# Faux serveur Gemini pour les essais en local
+#   uvicorn gemini_stub:app --port 8001
+#   GEMINI_BASE_URL=http://127.0.0.1:8001 uvicorn main:app
+# ============================================
+STUB_DELAY_SECONDS = float(os.environ.get("STUB_DELAY_SECONDS", "0.2"))
+STUB_FAIL_FIRST = int(os.environ.get("STUB_FAIL_FIRST", "0"))
+STUB_FAIL_STATUS = int(os.environ.get("STUB_FAIL_STATUS", "429"))
+STUB_STREAM_CHUNK_CHARS = int(os.environ.get("STUB_STREAM_CHUNK_CHARS", "80"))
+
+app = FastAPI(title="Gemini stub")
+state = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+STUB_ANALYSIS = {
+    "domaine": "Stub",
+    "contexte": "Reponse simulee",
+    "resume_executif": "Reponse du serveur de test",
+    "score_sante": 75,
+    "score_explication": "Valeur fixe",
+    "insights": [
+        {"titre": "Test", "observation": "RAS", "conseil": "RAS", "priorite": "faible"},
+        {"titre": "Test {2}", "observation": "Texte avec \"guillemets\" et ]", "conseil": "RAS", "priorite": "moyenne"}
+    ],
+    "points_forts": [],
+    "points_faibles": [],
+    "opportunites": [],
+    "risques": [],
+    "plan_action": [],
+    "conclusion": "",
+    "resume_comparaison": "Comparaison simulee",
+    "evolution_globale": "stable",
+    "score_file1": 70,
+    "score_file2": 70,
+    "differences_cles": [],
+    "points_amelioration": [],
+    "points_regression": [],
+    "recommandations": []
+}
+
+@app.post("/v1beta/models/{model_method}")
+async def generate(model_method: str, request: Request):
+    await request.json()
+    state["requests"] += 1
+    state["in_flight"] += 1
+    state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+    try:
+        await asyncio.sleep(STUB_DELAY_SECONDS)
+        if state["requests"] <= STUB_FAIL_FIRST:
+            return JSONResponse(
+                {"error": {"code": STUB_FAIL_STATUS, "message": "stub failure"}},
+                status_code=STUB_FAIL_STATUS,
+                headers={"Retry-After": "0"}
+            )
+        if model_method.endswith(":streamGenerateContent"):
+            return StreamingResponse(stream_chunks(json.dumps(STUB_ANALYSIS)), media_type="text/event-stream")
+        return {"candidates": [{"content": {"parts": [{"text": json.dumps(STUB_ANALYSIS)}]}}]}
+    finally:
+        state["in_flight"] -= 1
+
+async def stream_chunks(text):
+    for start in range(0, len(text), STUB_STREAM_CHUNK_CHARS):
+        chunk = {"candidates": [{"content": {"parts": [{"text": text[start:start + STUB_STREAM_CHUNK_CHARS]}]}}]}
+        yield f"data: {json.dumps(chunk)}\r\n\r\n"
+        await asyncio.sleep(STUB_DELAY_SECONDS / 10)
+
+@app.get("/stats")
+def stats():
+    return state
@@ -0,0 +1,107 @@
+import asyncio
+import importlib
+import os
+import time
+import uuid
+
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_MINUTES", "60")) * 60
+JOB_STORE_BACKEND = os.environ.get("JOB_STORE_BACKEND", "")
+
+class MemoryJobStore:
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self.jobs = {}
+        self.conditions = {}
+
+    def create(self, kind, meta=None):
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.jobs[job_id] = {
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "stage": None,
+            "meta": meta or {},
+            "events": [],
+            "result": None,
+            "error": None,
+            "created": now,
+            "updated": now,
+        }
+        self.conditions[job_id] = asyncio.Condition()
+        return self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def update(self, job_id, **fields):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields, updated=time.time())
+        self.notify(job_id)
+
+    def add_event(self, job_id, stage, data):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job["events"].append({"stage": stage, "data": data, "at": time.time()})
+        job["stage"] = stage
+        job["updated"] = time.time()
+        self.notify(job_id)
+
+    def notify(self, job_id):
+        condition = self.conditions.get(job_id)
+        if condition is None:
+            return
+
+        async def wake():
+            async with condition:
+                condition.notify_all()
+        asyncio.get_running_loop().create_task(wake())
+
+    async def wait_events(self, job_id, after, timeout=15.0):
+        job = self.jobs.get(job_id)
+        condition = self.conditions.get(job_id)
+        if job is None or condition is None:
+            return [], True
+        async with condition:
+            if len(job["events"]) <= after and job["status"] not in ("done", "error"):
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return job["events"][after:], job["status"] in ("done", "error")
+
+    def cleanup(self):
+        limit = time.time() - self.ttl
+        for job_id in [j for j, job in self.jobs.items() if job["updated"] < limit and job["status"] in ("done", "error")]:
+            self.jobs.pop(job_id, None)
+            self.conditions.pop(job_id, None)
+
+def load_store():
+    if not JOB_STORE_BACKEND:
+        return MemoryJobStore()
+    module_name, _, class_name = JOB_STORE_BACKEND.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+store = load_store()
+
+def set_store(new_store):
+    global store
+    store = new_store
+
+def public_view(job, with_result=True):
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "stages_done": [e["stage"] for e in job["events"]],
+        "meta": job["meta"],
+        "error": job["error"],
+        "result": job["result"] if with_result else None,
+        "created": job["created"],
+        "updated": job["updated"],
+    }
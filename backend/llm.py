@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import random
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_SECONDS = float(os.environ.get("LLM_BACKOFF_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_TOTAL_TIMEOUT = float(os.environ.get("LLM_TOTAL_TIMEOUT", "90"))
+LLM_TIMEOUT = httpx.Timeout(
+    connect=float(os.environ.get("LLM_CONNECT_TIMEOUT", "5")),
+    write=float(os.environ.get("LLM_WRITE_TIMEOUT", "10")),
+    read=float(os.environ.get("LLM_READ_TIMEOUT", "60")),
+    pool=float(os.environ.get("LLM_POOL_TIMEOUT", "30")),
+)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_client = None
+_semaphore = None
+
+def gemini_url(method="generateContent"):
+    return f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:{method}?key={GEMINI_API_KEY}"
+
+async def start_client():
+    global _client, _semaphore
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=LLM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONCURRENCY * 2,
+                max_keepalive_connections=LLM_MAX_CONCURRENCY,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        print(f"[LLM] Client demarre (http2={HTTP2_AVAILABLE}, concurrence={LLM_MAX_CONCURRENCY})")
+    return _client
+
+async def close_client():
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+def backoff_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX_SECONDS)
+            except ValueError:
+                pass
+    delay = LLM_BACKOFF_SECONDS * (2 ** attempt)
+    return min(delay, LLM_BACKOFF_MAX_SECONDS) * (0.5 + random.random() / 2)
+
+async def post_with_retries(url, payload):
+    client = await start_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            response = await client.post(url, json=payload)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"[LLM] {type(e).__name__}, nouvel essai dans {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        if response.status_code in RETRY_STATUS and attempt < LLM_MAX_RETRIES:
+            delay = backoff_delay(attempt, response)
+            print(f"[LLM] Status {response.status_code}, nouvel essai dans {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        return response
+
+async def generate_content(payload):
+    await start_client()
+    async with _semaphore:
+        response = await asyncio.wait_for(post_with_retries(gemini_url(), payload), LLM_TOTAL_TIMEOUT)
+    print(f"[LLM] Status: {response.status_code} ({response.http_version})")
+    return response.json()
+
+def chunk_text(data):
+    if "error" in data:
+        raise Exception(f"Gemini error: {data['error']}")
+    parts = data.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+async def stream_content(payload):
+    client = await start_client()
+    url = gemini_url("streamGenerateContent") + "&alt=sse"
+    streamed = False
+    async with _semaphore:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                async with client.stream("POST", url, json=payload) as response:
+                    if response.status_code in RETRY_STATUS and attempt < LLM_MAX_RETRIES:
+                        delay = backoff_delay(attempt, response)
+                        print(f"[LLM] Status {response.status_code}, nouvel essai dans {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    print(f"[LLM] Flux ouvert: {response.status_code} ({response.http_version})")
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        raise Exception(f"Gemini error {response.status_code}: {body[:200]!r}")
+                    async for line in response.aiter_lines():
+                        if line.startswith("data:"):
+                            streamed = True
+                            yield chunk_text(json.loads(line[5:]))
+                    return
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt == LLM_MAX_RETRIES or streamed:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"[LLM] {type(e).__name__}, nouvel essai dans {delay:.1f}s")
+                await asyncio.sleep(delay)
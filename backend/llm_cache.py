@@ -0,0 +1,186 @@
+import hashlib
+import json
+import math
+import os
+import tempfile
+import time
+
+import cache
+
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "smart-excel-llm-cache"))
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_SIMILARITY = float(os.environ.get("LLM_CACHE_SIMILARITY", "0.85"))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_HOURS", "72")) * 3600
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "500"))
+KPI_BUCKETS_PER_DECADE = 4
+
+_index = None
+_metrics = {
+    "exact_hits": 0,
+    "exact_misses": 0,
+    "semantic_hits": 0,
+    "semantic_misses": 0,
+    "stores": 0,
+    "evictions": 0,
+}
+
+def index_path():
+    return os.path.join(LLM_CACHE_DIR, "index.json")
+
+def entry_path(key):
+    return os.path.join(LLM_CACHE_DIR, f"{key}.json")
+
+def load_index():
+    global _index
+    if _index is None:
+        try:
+            with open(index_path(), encoding="utf-8") as f:
+                _index = json.load(f)
+        except Exception:
+            _index = {}
+    return _index
+
+def save_index():
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        cache.write_atomic(index_path(), json.dumps(load_index()).encode("utf-8"))
+    except Exception as e:
+        print(f"[LLM CACHE] Index non sauvegarde: {e}")
+
+def is_expired(entry, now=None):
+    return (now or time.time()) - entry["created"] > LLM_CACHE_TTL_SECONDS
+
+def value_bucket(value):
+    # Meme tranche pour des valeurs du meme ordre de grandeur (quart de decade)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return "na"
+    if value == 0 or value != value:
+        return "0"
+    sign = "-" if value < 0 else ""
+    return f"{sign}{math.floor(math.log10(abs(value)) * KPI_BUCKETS_PER_DECADE)}"
+
+def fingerprint(domain, schema_items, kpis):
+    tokens = {f"col:{name.lower()}:{kind}" for name, kind in schema_items}
+    values = {}
+    for kpi in kpis:
+        name = str(kpi["column"]).lower()
+        tokens.add(f"avg:{name}:{value_bucket(kpi['average'])}")
+        tokens.add(f"sum:{name}:{value_bucket(kpi['total'])}")
+        tokens.add(f"n:{name}:{value_bucket(kpi['count'])}")
+        values[name] = [kpi["average"], kpi["total"], kpi["count"]]
+    return {"domain": domain, "tokens": sorted(tokens), "kpis": values}
+
+def kpi_moved(a, b):
+    # Ecart de plus d une tranche (quart de decade) dans un sens ou dans l autre, ou changement de signe
+    try:
+        a, b = float(a), float(b)
+    except (TypeError, ValueError):
+        return a != b
+    if a != a or b != b:
+        return (a != a) != (b != b)
+    if a == 0 or b == 0 or (a < 0) != (b < 0):
+        return a != b
+    return abs(math.log10(a / b)) > 1 / KPI_BUCKETS_PER_DECADE
+
+def kpis_moved(a, b):
+    # Sur une feuille large, une colonne qui s effondre ne pese presque rien dans le Jaccard : refus d office
+    for name in a.keys() & b.keys():
+        if any(kpi_moved(x, y) for x, y in zip(a[name], b[name])):
+            return True
+    return False
+
+def similarity(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def prompt_key(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=True).encode("utf-8")).hexdigest()
+
+def read_entry(key):
+    entry = load_index().get(key)
+    if entry is None or is_expired(entry):
+        return None
+    try:
+        with open(entry_path(key), encoding="utf-8") as f:
+            value = json.load(f)
+    except Exception:
+        load_index().pop(key, None)
+        return None
+    entry["used"] = time.time()
+    return value
+
+def get_exact(key):
+    if not LLM_CACHE_ENABLED:
+        return None
+    value = read_entry(key)
+    _metrics["exact_hits" if value is not None else "exact_misses"] += 1
+    return value
+
+def put_exact(key, value):
+    store(key, {"tier": "exact"}, value)
+
+def get_similar(fp):
+    if not LLM_CACHE_ENABLED:
+        return None, 0.0
+    now = time.time()
+    best_key, best_score = None, 0.0
+    for key, entry in load_index().items():
+        if entry["tier"] != "semantic" or entry["domain"] != fp["domain"] or is_expired(entry, now):
+            continue
+        if kpis_moved(entry.get("kpis", {}), fp["kpis"]):
+            continue
+        score = similarity(entry["tokens"], fp["tokens"])
+        if score > best_score:
+            best_key, best_score = key, score
+    value = read_entry(best_key) if best_key is not None and best_score >= LLM_CACHE_SIMILARITY else None
+    _metrics["semantic_hits" if value is not None else "semantic_misses"] += 1
+    return value, best_score
+
+def put_similar(fp, value):
+    key = prompt_key({"domain": fp["domain"], "tokens": fp["tokens"]})
+    store(key, {"tier": "semantic", "domain": fp["domain"], "tokens": fp["tokens"], "kpis": fp["kpis"]}, value)
+
+def store(key, entry, value):
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        cache.write_atomic(entry_path(key), json.dumps(value, ensure_ascii=True, default=str).encode("utf-8"))
+    except Exception as e:
+        print(f"[LLM CACHE] Ecriture impossible: {e}")
+        return
+    now = time.time()
+    load_index()[key] = {**entry, "created": now, "used": now}
+    _metrics["stores"] += 1
+    evict()
+    save_index()
+
+def evict():
+    index = load_index()
+    now = time.time()
+    stale = [k for k, e in index.items() if is_expired(e, now)]
+    excess = len(index) - len(stale) - LLM_CACHE_MAX_ENTRIES
+    if excess > 0:
+        live = sorted((e["used"], k) for k, e in index.items() if not is_expired(e, now))
+        stale += [k for _, k in live[:excess]]
+    for key in stale:
+        index.pop(key, None)
+        try:
+            os.remove(entry_path(key))
+        except OSError:
+            pass
+    _metrics["evictions"] += len(stale)
+
+def metrics():
+    exact = _metrics["exact_hits"] + _metrics["exact_misses"]
+    semantic = _metrics["semantic_hits"] + _metrics["semantic_misses"]
+    return {
+        **_metrics,
+        "entries": len(load_index()),
+        "exact_hit_rate": _metrics["exact_hits"] / exact if exact else 0.0,
+        "semantic_hit_rate": _metrics["semantic_hits"] / semantic if semantic else 0.0,
+        "similarity_threshold": LLM_CACHE_SIMILARITY,
+        "enabled": LLM_CACHE_ENABLED,
+    }
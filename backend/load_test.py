@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+# ============================================
+# Test de charge : latence de "/" pendant des analyses lourdes
+#   GEMINI_BASE_URL=http://127.0.0.1:8001 CACHE_ENABLED=0 uvicorn main:app --port 8000
+#   python load_test.py --url http://127.0.0.1:8000 --rows 100000 --uploads 4
+# ============================================
+def make_workbook(n_rows, path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Nom": [f"Employe_{i}" for i in range(n_rows)],
+        "Departement": rng.choice(["RH", "Finance", "IT", "Marketing", "Operations"], n_rows),
+        "Salaire": rng.integers(150000, 900000, n_rows),
+        "Prime": rng.integers(0, 100000, n_rows),
+        "Absences": rng.integers(0, 30, n_rows),
+        "Date_Embauche": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, n_rows), unit="D"),
+    })
+    df.to_excel(path, index=False)
+
+async def probe(client, url, latencies, stop):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await client.get(url + "/")
+        latencies.append(time.perf_counter() - t0)
+        await asyncio.sleep(0.05)
+
+async def upload(client, url, file_bytes, i):
+    t0 = time.perf_counter()
+    response = await client.post(url + "/analyze", files={"file": (f"charge_{i}.xlsx", file_bytes)})
+    return response.json().get("status"), time.perf_counter() - t0
+
+def describe(latencies):
+    if not latencies:
+        return "aucune mesure"
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) >= 20 else ordered[-1]
+    return (f"n={len(ordered)} p50={statistics.median(ordered) * 1000:.1f}ms "
+            f"p95={p95 * 1000:.1f}ms max={ordered[-1] * 1000:.1f}ms")
+
+async def run(url, n_rows, uploads):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "charge.xlsx")
+        make_workbook(n_rows, path)
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+    print(f"Classeur genere: {n_rows} lignes, {len(file_bytes) / 1e6:.1f} Mo")
+    async with httpx.AsyncClient(timeout=600) as client:
+        idle, stop = [], asyncio.Event()
+        task = asyncio.create_task(probe(client, url, idle, stop))
+        await asyncio.sleep(2)
+        stop.set()
+        await task
+
+        busy, stop = [], asyncio.Event()
+        task = asyncio.create_task(probe(client, url, busy, stop))
+        results = await asyncio.gather(*[upload(client, url, file_bytes, i) for i in range(uploads)])
+        stop.set()
+        await task
+
+        print(f"Sante au repos    : {describe(idle)}")
+        print(f"Sante sous charge : {describe(busy)}")
+        for status, elapsed in results:
+            print(f"  /analyze -> {status} en {elapsed:.1f}s")
+        print("Workers:", (await client.get(url + "/workers")).json())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--uploads", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.url.rstrip("/"), args.rows, args.uploads))
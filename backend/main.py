@@ -1,14 +1,55 @@
-from fastapi import FastAPI, UploadFile, File
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 import pandas as pd
+from pandas.tseries.api import guess_datetime_format
 import numpy as np
-from io import BytesIO
 import openpyxl
+from openpyxl.utils import range_boundaries
 import os
+import re
 import json
-import httpx
+import warnings
+import zipfile
+import tempfile
+import itertools
+import posixpath
+import xml.etree.ElementTree as ET
+import asyncio
+import csv
+import codecs
+import uuid
+import weakref
+import time
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+import cache
+import llm
+import workers
+import jobs
+import llm_cache
+import tracing
+import serialization
+import datasets
+import uploads
+import timeseries
+import sessions
 
-app = FastAPI(title="Smart Excel Analyzer API")
+@asynccontextmanager
+async def lifespan(app):
+    await llm.start_client()
+    workers.start_pool(preload_modules=("main",))
+    yield
+    workers.shutdown_pool()
+    await llm.close_client()
+
+app = FastAPI(title="Smart Excel Analyzer API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,42 +58,165 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(serialization.CompressionMiddleware)
+
+UPLOAD_ENVELOPE_BYTES = 64 * 1024
+
+def upload_files_allowed(path):
+    return {"/compare": 2, "/compare/multi": MAX_COMPARE_FILES}.get(path, 1)
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Refus avant lecture du corps quand la taille annoncee depasse deja la limite (marge pour l enveloppe multipart)
+    length = request.headers.get("content-length")
+    limit = (uploads.MAX_UPLOAD_BYTES + UPLOAD_ENVELOPE_BYTES) * upload_files_allowed(request.url.path)
+    if length is not None and length.isdigit() and int(length) > limit:
+        return JSONResponse(
+            {"status": "error", "message": f"Fichier trop volumineux (maximum {uploads.MAX_UPLOAD_BYTES // (1024 * 1024)} Mo)"},
+            status_code=413
+        )
+    return await call_next(request)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    _, token = tracing.start_trace(method=request.method, path=request.url.path)
+    try:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            tracing.annotate(path=route.path)
+        return response
+    finally:
+        tracing.end_trace(token)
+
+ANALYSIS_VERSION = "2"
+HEADER_SCAN_ROWS = 100
+STREAMING_THRESHOLD_BYTES = int(os.environ.get("STREAMING_THRESHOLD_MB", "20")) * 1024 * 1024
+STREAM_CHUNK_ROWS = int(os.environ.get("STREAM_CHUNK_ROWS", "20000"))
+STREAM_RESERVOIR_SIZE = int(os.environ.get("STREAM_RESERVOIR_SIZE", "50000"))
+NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"
+}
+
+def rows_to_grid(rows):
+    # Tableau objet rectangulaire, lignes courtes completees par None
+    width = max((len(row) for row in rows), default=0)
+    grid = np.full((len(rows), width), None, dtype=object)
+    if rows and all(len(row) == width for row in rows):
+        grid[:] = rows
+    else:
+        for i, row in enumerate(rows):
+            grid[i, :len(row)] = row
+    return grid
+
+def sheet_grid(ws, merges):
+    with tracing.span("read_cells") as span:
+        grid = rows_to_grid(list(ws.iter_rows(values_only=True)))
+        span["rows"] = len(grid)
+    with tracing.span("unmerge") as span:
+        span["merged_ranges"] = len(merges)
+        if merges:
+            # Les plages peuvent deborder des cellules remplies : on etend la grille
+            height = max(len(grid), max(m[2] for m in merges))
+            width = max(grid.shape[1], max(m[3] for m in merges))
+            if (height, width) != grid.shape:
+                padded = np.full((height, width), None, dtype=object)
+                padded[:grid.shape[0], :grid.shape[1]] = grid
+                grid = padded
+        # Une affectation de bloc par plage fusionnee
+        for min_row, min_col, max_row, max_col in merges:
+            grid[min_row - 1:max_row, min_col - 1:max_col] = grid[min_row - 1, min_col - 1]
+    return grid
+
+def open_workbook(file_bytes):
+    # Lecture seule : pas d objets Cell ni MergedCell, les fusions viennent du XML de la feuille
+    with tracing.span("open_workbook", bytes=len(file_bytes)):
+        return openpyxl.load_workbook(uploads.open_buffer(file_bytes), read_only=True, data_only=True)
+
+def workbook_sheet_grid(wb, file_bytes, name):
+    try:
+        merges = read_merged_ranges(file_bytes, name)
+    except Exception:
+        merges = []
+    return sheet_grid(wb[name], merges)
+
+def load_sheet_grid(file_bytes, name=None):
+    # Feuille active par defaut ; ouverture en lecture seule, seule la feuille demandee est parcourue
+    wb = open_workbook(file_bytes)
+    try:
+        grid = workbook_sheet_grid(wb, file_bytes, name or wb.active.title)
+    finally:
+        wb.close()
+    return grid
+
+def is_empty_cell(val):
+    if val is None:
+        return True
+    if isinstance(val, float):
+        return val != val
+    if isinstance(val, str):
+        return val in NA_STRINGS
+    return False
+
+is_text_cell = np.frompyfunc(lambda val: isinstance(val, str), 1, 1)
+
+def text_mask(values):
+    return is_text_cell(values).astype(bool)
+
+def empty_mask(values):
+    # Equivalent vectorise de is_empty_cell sur un tableau objet 2D
+    flat = values.ravel()
+    mask = pd.isna(flat) | pd.Series(flat, dtype=object).isin(NA_STRINGS).to_numpy()
+    return mask.reshape(values.shape)
+
+def build_header(values, width):
+    columns = []
+    seen = {}
+    for i in range(width):
+        val = values[i] if i < len(values) else None
+        if is_empty_cell(val):
+            name = f"Unnamed: {i}"
+        elif isinstance(val, float) and val.is_integer():
+            name = int(val)
+        else:
+            name = val
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def blank_empty_cells(values):
+    return np.where(empty_mask(values), None, values)
+
+def grid_to_dataframe(grid, header_row):
+    width = grid.shape[1]
+    header = list(grid[header_row]) if header_row < len(grid) else []
+    columns = build_header(header, width)
+    body = blank_empty_cells(grid[header_row + 1:])
+    first_row = header_row + 2
+    # infer_objects redonne les memes types que le constructeur sur des listes
+    return pd.DataFrame(body, columns=columns, index=pd.RangeIndex(first_row, first_row + len(body))).infer_objects()
 
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-
-def unmerge_and_fill(file_bytes):
-    wb = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
-    ws = wb.active
-    merged_ranges = list(ws.merged_cells.ranges)
-    for merge_range in merged_ranges:
-        min_row = merge_range.min_row
-        min_col = merge_range.min_col
-        top_left_value = ws.cell(row=min_row, column=min_col).value
-        ws.unmerge_cells(str(merge_range))
-        for row in range(merge_range.min_row, merge_range.max_row + 1):
-            for col in range(merge_range.min_col, merge_range.max_col + 1):
-                ws.cell(row=row, column=col).value = top_left_value
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    return buffer
+def find_header_row(values):
+    # Premiere ligne avec au moins 2 cellules dont la moitie de texte, toutes les lignes notees d un coup
+    present = ~pd.isna(values)
+    filled = present.sum(axis=1)
+    texts = (present & text_mask(values)).sum(axis=1)
+    hits = np.flatnonzero((filled >= 2) & (texts >= filled * 0.5))
+    return int(hits[0]) if len(hits) else None
 
 def detect_header_row(df_raw):
-    for i, row in df_raw.iterrows():
-        non_null = row.dropna()
-        if len(non_null) >= 2:
-            str_count = sum(1 for v in non_null if isinstance(v, str))
-            if str_count >= len(non_null) * 0.5:
-                return i
-    return 0
-
-def clean_dataframe(df):
-    df = df.dropna(how='all')
-    df = df.dropna(axis=1, how='all')
+    position = find_header_row(df_raw.to_numpy(dtype=object))
+    return df_raw.index[position] if position is not None else 0
+
+def clean_column_names(columns):
     new_cols = []
     seen = {}
-    for col in df.columns:
+    for col in columns:
         col_str = str(col).strip()
         if col_str.startswith('Unnamed') or col_str == 'nan':
             col_str = f'Colonne_{len(new_cols)+1}'
@@ -62,70 +226,478 @@ def clean_dataframe(df):
         else:
             seen[col_str] = 0
         new_cols.append(col_str)
-    df.columns = new_cols
-    for col in df.columns:
-        if df[col].dtype == object:
-            df[col] = df[col].ffill()
-    for col in df.columns:
-        if df[col].dtype == object:
-            mask = df[col].astype(str).str.lower().str.contains(
-                'total|sous.total|somme|sum|grand total',
-                regex=True, na=False
-            )
-            df = df[~mask]
+    return new_cols
+
+TOTAL_ROW_PATTERN = re.compile(r'total|sous.total|somme|sum|grand total')
+SUBTOTAL_PATTERN = re.compile(r'sous.total')
+GRAND_TOTAL_PATTERN = re.compile(r'grand total|total g[eé]n[eé]ral')
+MAX_REPORTED_SUBTOTALS = 50
+
+def detect_total_rows(df, text_cols):
+    mask = np.zeros(len(df), dtype=bool)
+    found = []
+    if not text_cols or df.empty:
+        return mask, found
+    values = df[text_cols].to_numpy(dtype=object).ravel(order="F")
+    codes, uniques = pd.factorize(values)
+    labels = pd.Series(uniques, dtype=object).astype(str).str.lower()
+    matched = np.append(labels.str.contains(TOTAL_ROW_PATTERN, na=False).to_numpy(), False)
+    hits = matched[codes].reshape(len(text_cols), len(df))
+    mask = hits.any(axis=0)
+    first_hit = hits.argmax(axis=0)
+    for pos in np.flatnonzero(mask):
+        label = labels.iloc[codes[first_hit[pos] * len(df) + pos]]
+        if GRAND_TOTAL_PATTERN.search(label):
+            kind = "grand_total"
+        elif SUBTOTAL_PATTERN.search(label):
+            kind = "subtotal"
+        else:
+            kind = "total"
+        found.append({"row": int(df.index[pos]), "kind": kind, "label": safe_str(values[first_hit[pos] * len(df) + pos])})
+    return mask, found
+
+def clean_dataframe(df, subtotals=None):
+    df = df.dropna(how='all')
+    df = df.dropna(axis=1, how='all')
+    df.columns = clean_column_names(df.columns)
+    text_cols = [col for col in df.columns if df[col].dtype == object]
+    mask, found = detect_total_rows(df, text_cols)
+    if subtotals is not None:
+        subtotals.extend(found)
+    if mask.any():
+        df = df[~mask]
+    for col in text_cols:
+        df[col] = df[col].ffill()
     df = df.reset_index(drop=True)
     return df
 
-def is_phone_number(series):
-    clean = series.dropna()
-    if len(clean) == 0:
-        return False
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+ODS_MIMETYPE = b"application/vnd.oasis.opendocument.spreadsheet"
+CSV_DELIMITERS = ";,\t|"
+CSV_SNIFF_BYTES = 64 * 1024
+
+def detect_format(file_bytes):
+    head = file_bytes[:8]
+    if head.startswith(b"PK\x03\x04"):
+        # L ODS range son type MIME non compresse juste apres l en-tete zip
+        return "ods" if ODS_MIMETYPE in file_bytes[30:30 + 100] else "xlsx"
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.startswith(b"ARROW1"):
+        return "arrow"
+    if head.startswith(b"\xff\xff\xff\xff"):
+        return "arrow_stream"
+    if head.startswith(OLE2_MAGIC):
+        return "xls"
+    return "csv"
+
+NON_SPREADSHEET_MAGICS = (
+    (b"%PDF", "PDF"),
+    (b"\x89PNG", "PNG"),
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"GIF8", "GIF"),
+)
+
+def check_upload_head(head):
+    # Refus des le premier bloc recu : tout ce qui n a pas de signature connue doit ressembler a du texte (CSV)
+    if detect_format(head) != "csv":
+        return
+    for magic, name in NON_SPREADSHEET_MAGICS:
+        if head.startswith(magic):
+            raise uploads.UploadRejected(f"Fichier {name} refuse : classeur Excel, ODS, CSV, Parquet ou Arrow attendu")
+    if b"\0" in head[:CSV_SNIFF_BYTES]:
+        raise uploads.UploadRejected("Contenu binaire non reconnu : classeur Excel, ODS, CSV, Parquet ou Arrow attendu")
+
+def decode_sample(file_bytes):
+    sample = file_bytes[:CSV_SNIFF_BYTES]
     try:
-        nums = pd.to_numeric(clean, errors='coerce').dropna()
-        if len(nums) == 0:
-            return False
-        return nums.between(600000000, 699999999).sum() > len(nums) * 0.5
-    except:
+        return sample.decode("utf-8-sig"), "utf8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(sample) - 3:
+            return sample[:e.start].decode("utf-8-sig"), "utf8"
+    return sample.decode("cp1252", errors="replace"), "cp1252"
+
+def is_utf8(file_bytes, block=16 * CSV_SNIFF_BYTES):
+    # Verification du fichier entier par blocs, sans le decoder en une seule chaine
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for start in range(0, len(file_bytes), block):
+            decoder.decode(file_bytes[start:start + block])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
         return False
+    return True
+
+def csv_cell(value):
+    value = value.strip()
+    if value == "":
+        return None
+    try:
+        return float(value.replace(" ", "").replace(",", "."))
+    except ValueError:
+        return value
 
-def is_matricule(series):
-    clean = series.dropna().astype(str)
-    return clean.str.contains(r'\d{3}-\d{7}-\d', regex=True).sum() > len(clean) * 0.5
+def read_csv_frame(file_bytes):
+    with tracing.span("read_csv", bytes=len(file_bytes)) as span:
+        df = parse_csv_frame(file_bytes)
+        span["rows"], span["columns"] = df.shape
+    return df
 
-def smart_read_excel(file_bytes):
+def guess_delimiter(lines):
+    # Repli quand le Sniffer refuse (une ligne au nombre de champs irregulier suffit) :
+    # le separateur present sur le plus de lignes avec le meme nombre d occurrences
+    best, best_lines = ",", 0
+    for delimiter in CSV_DELIMITERS:
+        counts = [line.count(delimiter) for line in lines if line.strip()]
+        usual = max(set(counts), key=counts.count) if counts else 0
+        if usual and counts.count(usual) > best_lines:
+            best, best_lines = delimiter, counts.count(usual)
+    return best
+
+def parse_csv_frame(file_bytes):
+    text, encoding = decode_sample(file_bytes)
+    if not text.strip():
+        raise uploads.UploadRejected("Fichier vide")
+    lines = text.splitlines()[:HEADER_SCAN_ROWS]
     try:
-        cleaned_buffer = unmerge_and_fill(file_bytes)
-    except Exception:
-        cleaned_buffer = BytesIO(file_bytes)
+        delimiter = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = guess_delimiter(lines[:20])
+    head = list(csv.reader(lines, delimiter=delimiter))
+    with tracing.span("header_detection"):
+        header_row = detect_header_row(pd.DataFrame([[csv_cell(v) for v in row] for row in head]))
+    width = max((len(row) for row in head), default=0)
+    columns = build_header([csv_cell(v) for v in head[header_row]] if header_row < len(head) else [], width)
+    if len(file_bytes) <= CSV_SNIFF_BYTES and sum(1 for line in text.splitlines() if line.strip()) <= header_row + 1:
+        raise uploads.UploadRejected("Fichier sans donnees : seule la ligne d en-tete est presente")
+    df = None
+    if pa is not None:
+        try:
+            df = read_csv_arrow(file_bytes, columns, header_row, delimiter, encoding)
+        except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+            # L encodage est deduit des premiers Ko : un octet cp1252 plus loin fait echouer la lecture UTF-8
+            if encoding == "utf8" and not is_utf8(file_bytes):
+                encoding = "cp1252"
+            print(f"[CSV] Lecture Arrow impossible ({e}), relecture par pandas en {encoding}")
+    if df is None:
+        df = pd.read_csv(
+            uploads.open_buffer(file_bytes), sep=delimiter, header=None, names=columns, index_col=False,
+            skiprows=header_row + 1, encoding="utf-8-sig" if encoding == "utf8" else encoding,
+            encoding_errors="replace", on_bad_lines="skip"
+        )
+    df.index = pd.RangeIndex(header_row + 2, header_row + 2 + len(df))
+    return df
+
+def read_csv_arrow(file_bytes, columns, header_row, delimiter, encoding):
+    # Lignes avec trop de champs ecartees ; s il en manque (cellules vides finales non exportees),
+    # None : relecture par pandas qui complete la ligne
+    bad_rows = []
+    def skip_row(row):
+        bad_rows.append(row.actual_columns < row.expected_columns)
+        return "skip"
+    table = pa_csv.read_csv(
+        pa.py_buffer(file_bytes),
+        read_options=pa_csv.ReadOptions(
+            skip_rows=header_row + 1, column_names=[str(c) for c in columns],
+            encoding=encoding, use_threads=True
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True, invalid_row_handler=skip_row),
+        convert_options=pa_csv.ConvertOptions(strings_can_be_null=True)
+    )
+    if bad_rows:
+        print(f"[CSV] {len(bad_rows)} ligne(s) au nombre de champs incorrect")
+    if any(bad_rows):
+        return None
+    # Octets invalides dans l encodage annonce : Arrow type la colonne en binaire au lieu d echouer
+    binary = [field.name for field in table.schema if pa.types.is_binary(field.type)]
+    if binary:
+        raise pa.ArrowInvalid(f"colonne(s) non decodables en {encoding} : {', '.join(binary)}")
+    df = table.to_pandas(date_as_object=False)
+    df.columns = columns
+    return df
+
+def read_arrow_frame(file_bytes, fmt):
+    with tracing.span("read_arrow", bytes=len(file_bytes)) as span:
+        source = pa.py_buffer(file_bytes)
+        if fmt == "parquet":
+            table = pq.read_table(source)
+        elif fmt == "arrow":
+            table = pa.ipc.open_file(source).read_all()
+        else:
+            table = pa.ipc.open_stream(source).read_all()
+        table = table.drop_columns([c for c in table.column_names if c.startswith("__index_level_")])
+        df = table.to_pandas(date_as_object=False, ignore_metadata=True, split_blocks=True)
+        span["rows"], span["columns"] = df.shape
+    df.columns = build_header(list(df.columns), len(df.columns))
+    df.index = pd.RangeIndex(2, 2 + len(df))
+    return df
+
+def read_excel_grid(file_bytes, engine=None):
+    with tracing.span("read_excel", bytes=len(file_bytes)) as span:
+        grid = pd.read_excel(uploads.open_buffer(file_bytes), header=None, engine=engine).to_numpy(dtype=object)
+        span["rows"], span["columns"] = grid.shape
+    return grid
+
+def read_legacy_workbook(file_bytes, fmt):
+    engine, package = ("xlrd", "xlrd") if fmt == "xls" else ("odf", "odfpy")
     try:
-        df_raw = pd.read_excel(cleaned_buffer, header=None)
-    except Exception:
-        df_raw = pd.read_excel(BytesIO(file_bytes), header=None)
-    header_row = detect_header_row(df_raw)
-    cleaned_buffer.seek(0)
+        grid = read_excel_grid(file_bytes, engine)
+    except ImportError:
+        raise ValueError(f"Lecture des fichiers .{fmt} indisponible : installer {package}")
+    return grid_to_raw_frame(grid)
+
+def load_raw_frame(file_bytes):
+    fmt = detect_format(file_bytes)
+    if fmt == "csv":
+        return read_csv_frame(file_bytes)
+    if fmt in ("parquet", "arrow", "arrow_stream"):
+        return read_arrow_frame(file_bytes, fmt)
+    if fmt in ("xls", "ods"):
+        return read_legacy_workbook(file_bytes, fmt)
     try:
-        df = pd.read_excel(cleaned_buffer, header=header_row)
+        grid = load_sheet_grid(file_bytes)
     except Exception:
-        df = pd.read_excel(BytesIO(file_bytes), header=header_row)
-    df = clean_dataframe(df)
-    for col in df.columns:
+        grid = read_excel_grid(file_bytes)
+    return grid_to_raw_frame(grid)
+
+def grid_to_raw_frame(grid):
+    with tracing.span("header_detection"):
+        header_row = find_header_row(blank_empty_cells(grid[:HEADER_SCAN_ROWS])) or 0
+    with tracing.span("build_frame") as span:
+        df = grid_to_dataframe(grid, header_row)
+        span["rows"], span["columns"] = df.shape
+    return df
+
+TYPE_SAMPLE_SIZE = 500
+BOOL_KEYWORDS = {"oui","non","yes","no","true","false","present","absent","actif","inactif"}
+MATRICULE_PATTERN = re.compile(r'\d{3}-\d{7}-\d')
+
+def sample_positions(n_rows, size=TYPE_SAMPLE_SIZE):
+    if n_rows <= size:
+        return np.arange(n_rows)
+    return np.linspace(0, n_rows - 1, size).astype(int)
+
+def parse_numbers(values):
+    text = pd.Series(values, dtype=object).astype(str).str.replace(' ', '').str.replace(',', '.')
+    return pd.to_numeric(text, errors='coerce')
+
+def resolve_date_format(values):
+    # Format deduit de la premiere chaine, comme pandas le fait sur une colonne entiere ;
+    # fige dans le schema pour que chaque bloc du streaming lise "05/03/2023" de la meme facon
+    first = next((v for v in values if isinstance(v, str)), None)
+    if first is None:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return guess_datetime_format(first) or "mixed"
+
+def parse_dates(values, date_format=None):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format=date_format)
+
+def take_codes(values, codes):
+    return pd.api.extensions.take(np.asarray(values), codes, allow_fill=True)
+
+def count_phone_numbers(numbers):
+    numbers = numbers[~np.isnan(numbers)]
+    if len(numbers) == 0:
+        return False
+    return ((numbers >= 600000000) & (numbers <= 699999999)).sum() > len(numbers) * 0.5
+
+def infer_column(series, n_rows):
+    info = {"kind": "category", "conversion": None, "unique": None, "date_format": None}
+    if pd.api.types.is_datetime64_any_dtype(series):
+        info["kind"] = "date"
+        return info, series
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        if series.notna().sum() == 0:
+            info["kind"] = "boolean"
+        elif count_phone_numbers(series.to_numpy(dtype=float, na_value=np.nan)):
+            info["kind"] = "ignored"
+        else:
+            info["kind"] = "number"
+        return info, series
+
+    codes, uniques = pd.factorize(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    uniques = np.asarray(uniques, dtype=object)
+    info["unique"] = len(uniques)
+    sample = series.iloc[sample_positions(n_rows)].dropna()
+
+    if len(sample) and parse_numbers(sample).notna().sum() > len(sample) * 0.4:
+        numbers = parse_numbers(uniques).to_numpy()
+        if counts[~np.isnan(numbers.astype(float))].sum() > n_rows * 0.5:
+            converted = pd.Series(take_codes(numbers, codes), index=series.index, name=series.name)
+            info["conversion"] = "number"
+            info["kind"] = "ignored" if count_phone_numbers(converted.to_numpy(dtype=float)) else "number"
+            return info, converted
+
+    if len(sample) and parse_dates(sample).notna().sum() > len(sample) * 0.4:
         try:
-            converted = pd.to_numeric(
-                df[col].astype(str).str.replace(' ', '').str.replace(',', '.'),
-                errors='coerce'
-            )
-            if converted.notna().sum() > len(df) * 0.5:
-                df[col] = converted
+            date_format = resolve_date_format(uniques)
+            dates = parse_dates(uniques, date_format).to_numpy()
+            if counts[~np.isnat(dates)].sum() > n_rows * 0.5:
+                converted = pd.Series(take_codes(dates, codes), index=series.index, name=series.name)
+                info["conversion"] = "date"
+                info["kind"] = "date"
+                info["date_format"] = date_format
+                return info, converted
         except Exception:
             pass
+
+    if len(uniques) == 0:
+        info["kind"] = "boolean"
+        return info, series
+    try:
+        raw_numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype=float)
+        parsed = ~np.isnan(raw_numbers)
+        in_range = parsed & (raw_numbers >= 600000000) & (raw_numbers <= 699999999)
+        if parsed.any() and counts[in_range].sum() > counts[parsed].sum() * 0.5:
+            info["kind"] = "ignored"
+            return info, series
+    except Exception:
+        pass
+    text = pd.Series(uniques, dtype=object).astype(str)
+    if counts[text.str.contains(MATRICULE_PATTERN, na=False).to_numpy()].sum() > counts.sum() * 0.5:
+        info["kind"] = "ignored"
+        return info, series
+    if set(text.str.lower()).issubset(BOOL_KEYWORDS):
+        info["kind"] = "boolean"
+        return info, series
+    return info, series
+
+def infer_schema(df):
+    schema = {"kinds": {}, "conversions": {}, "unique_counts": {}, "date_formats": {}}
+    n_rows = len(df)
     for col in df.columns:
-        if df[col].dtype == object:
-            try:
-                converted = pd.to_datetime(df[col], infer_datetime_format=True, errors='coerce')
-                if converted.notna().sum() > len(df) * 0.5:
-                    df[col] = converted
-            except Exception:
-                pass
+        info, converted = infer_column(df[col], n_rows)
+        if converted is not df[col]:
+            df[col] = converted
+        schema["kinds"][col] = info["kind"]
+        if info["conversion"]:
+            schema["conversions"][col] = info["conversion"]
+        if info["date_format"]:
+            schema["date_formats"][col] = info["date_format"]
+        if info["unique"] is not None:
+            schema["unique_counts"][col] = info["unique"]
+    return df, schema
+
+def apply_schema(df, schema):
+    conversions = dict(schema["conversions"])
+    # Colonne deja typee sur le premier bloc mais lue comme du texte plus loin : meme conversion
+    for col, kind in schema.get("kinds", {}).items():
+        if kind in ("number", "date") and col not in conversions and df[col].dtype == object:
+            conversions[col] = kind
+    for col, kind in conversions.items():
+        codes, uniques = pd.factorize(df[col])
+        uniques = np.asarray(uniques, dtype=object)
+        values = parse_numbers(uniques) if kind == "number" else parse_dates(uniques, schema.get("date_formats", {}).get(col))
+        df[col] = pd.Series(take_codes(values.to_numpy(), codes), index=df.index, name=col)
+    return df
+
+COMPACT_FRAMES = os.environ.get("COMPACT_FRAMES", "1") != "0"
+COMPACT_CATEGORY_RATIO = 0.5
+FLOAT32_EXACT_LIMIT = 2 ** 24
+
+def column_bytes(series):
+    if series.dtype != object:
+        return int(series.memory_usage(index=False, deep=True))
+    # Texte objet : taille moyenne estimee sur l echantillon de typage plutot que sur chaque cellule
+    sample = series.iloc[sample_positions(len(series))]
+    per_value = sample.memory_usage(index=False, deep=True) / len(sample) if len(sample) else 0
+    return int(per_value * len(series))
+
+def compact_number(series):
+    # Entiers les plus etroits possibles, float32 seulement si aucune valeur ne change
+    values = series.to_numpy()
+    if values.dtype.kind not in "iuf" or len(values) == 0:
+        return None
+    dtypes = [np.int8, np.int16, np.int32]
+    if values.dtype.kind == "f":
+        present = values[~np.isnan(values)]
+        if len(present) == 0 or not np.isfinite(present).all() or not np.array_equal(present, np.trunc(present)):
+            return None
+        if len(present) < len(values):
+            return values.astype(np.float32) if np.abs(present).max() < FLOAT32_EXACT_LIMIT else None
+    else:
+        dtypes.append(np.int64)
+    low, high = values.min(), values.max()
+    for dtype in dtypes:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype) if values.dtype != dtype else None
+    return None
+
+def compact_text(series, unique_count, kind):
+    if series.dtype != object or unique_count is None:
+        return None
+    if unique_count <= len(series) * COMPACT_CATEGORY_RATIO:
+        # Un booleen avec des vides garde l objet : le donut distingue "None" de "nan"
+        if kind == "boolean" and series.isna().any():
+            return None
+        try:
+            values = pd.Categorical(series)
+        except TypeError:
+            return None
+        # Categories triees : les codes remplacent pd.factorize(sort=True) dans les graphiques
+        return values if values.categories.is_monotonic_increasing else None
+    if pa is None or series.isna().any():
+        return None
+    try:
+        return pd.arrays.ArrowStringArray(pa.chunked_array([pa.array(series.to_numpy(), type=pa.string())]))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+def compact_frame(df, schema):
+    memory = {"before": 0, "after": 0}
+    for col in df.columns:
+        series = df[col]
+        size = column_bytes(series)
+        memory["before"] += size
+        if pd.api.types.is_bool_dtype(series):
+            compact = None
+        elif pd.api.types.is_numeric_dtype(series):
+            compact = compact_number(series)
+        else:
+            compact = compact_text(series, schema["unique_counts"].get(col), schema["kinds"].get(col))
+        if compact is not None:
+            df[col] = compact
+            size = column_bytes(df[col])
+        memory["after"] += size
+    return df, memory
+
+def report(progress, stage, data):
+    if progress is not None:
+        progress(stage, data)
+
+def read_typed_excel(file_bytes, progress=None):
+    return type_raw_frame(load_raw_frame(file_bytes), progress)
+
+def type_raw_frame(df, progress=None):
+    subtotals = []
+    with tracing.span("clean_dataframe") as span:
+        df = clean_dataframe(df, subtotals)
+        span["rows"], span["columns"] = df.shape
+    report(progress, "ingest", {
+        "total_rows": len(df),
+        "total_columns": len(df.columns),
+        "columns_list": [safe_str(c) for c in df.columns],
+        "subtotal_rows": len(subtotals)
+    })
+    with tracing.span("infer_schema", rows=len(df), columns=len(df.columns)):
+        df, schema = infer_schema(df)
+    schema["subtotals"] = subtotals
+    if COMPACT_FRAMES:
+        with tracing.span("compact_frame", rows=len(df), columns=len(df.columns)) as span:
+            df, schema["memory"] = compact_frame(df, schema)
+            span["bytes_before"], span["bytes"] = schema["memory"]["before"], schema["memory"]["after"]
+        print(f"[COMPACT] Memoire: {schema['memory']['before'] // 1024} Ko -> {schema['memory']['after'] // 1024} Ko")
+    report(progress, "schema", {"kinds": {safe_str(c): k for c, k in schema["kinds"].items()}})
+    return df, schema
+
+def smart_read_excel(file_bytes):
+    df, _ = read_typed_excel(file_bytes)
     return df
 
 def safe_str(val):
@@ -137,7 +709,219 @@ def safe_str(val):
     except:
         return ''
 
-def extract_basic_stats(df):
+# Au-dela de 2**46 l ecart entre deux flottants depasse 0,01 : round(v, 2) rend v tel quel.
+# En deca, v * 100 reste sous 2**53 et np.round tombe juste, sauf sur les quasi ex aequo
+ROUND_EXACT_LIMIT = 2.0 ** 46
+
+def round2(values):
+    # round(float(v), 2) sur tout un tableau : seuls les quasi ex aequo (x.xx5) repassent par round
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        scaled = values * 100
+        rounded = np.where(np.abs(values) < ROUND_EXACT_LIMIT, np.round(values, 2), values)
+        tolerance = np.maximum(1e-6, 4 * np.spacing(np.abs(scaled)))
+        ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) <= tolerance)
+    for i in ties:
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+def build_kpi(col, count, total, mean, minimum, maximum, std):
+    kpi = {
+        "column": safe_str(col),
+        "total": round(float(total), 2),
+        "average": round(float(mean), 2),
+        "min": round(float(minimum), 2),
+        "max": round(float(maximum), 2),
+        "count": int(count)
+    }
+    alert = None
+    if std > 0 and maximum > mean + 2 * std:
+        alert = {
+            "type": "warning",
+            "message": f"Valeur elevee dans '{safe_str(col)}': max={round(float(maximum), 2)}, moyenne={round(float(mean), 2)}"
+        }
+    return kpi, alert
+
+def build_line_chart(date_col, num_col, series, i):
+    # Colonne i des series periodiques ; les periodes sans aucune ligne ne sont pas tracees
+    present = np.flatnonzero(series["present"][:, i])
+    return {
+        "type": "line",
+        "title": f"Evolution de {safe_str(num_col)} par {timeseries.GRANULARITY_LABELS[series['freq']]}",
+        "labels": [series["labels"][p] for p in present],
+        "values": round2(series["values"][present, i]),
+        "x_col": safe_str(date_col),
+        "y_col": safe_str(num_col),
+        "granularity": series["freq"]
+    }
+
+def build_trend_alert(trend):
+    col = safe_str(trend["column"])
+    value = round(trend["value"], 2)
+    reference = round(trend["reference"], 2)
+    if trend["kind"] == "drop":
+        return {
+            "type": "danger",
+            "message": f"Baisse de plus de {timeseries.TREND_DROP_PCT}% sur '{col}' : {value} en {trend['period']} contre {reference} en {trend['previous_period']}"
+        }
+    if trend["kind"] == "seasonal":
+        return {
+            "type": "warning",
+            "message": f"'{col}' sous son niveau saisonnier en {trend['period']} : {value} contre {reference} en moyenne sur les periodes comparables"
+        }
+    direction = "hausse" if trend["value"] > trend["reference"] else "baisse"
+    return {
+        "type": "warning",
+        "message": f"Rupture de tendance ({direction}) sur '{col}' en {trend['period']} : {value} contre {reference} en moyenne glissante"
+    }
+
+def add_time_series(date_col, num_cols, series, charts, alerts):
+    # Graphiques pour les couples retenus, alertes pour toutes les colonnes numeriques de l axe
+    columns = {col: i for i, col in enumerate(series["columns"])}
+    for num_col in num_cols:
+        if num_col in columns:
+            charts.append(build_line_chart(date_col, num_col, series, columns[num_col]))
+    alerts.extend(build_trend_alert(trend) for trend in series["alerts"])
+
+def build_bar_chart(cat_col, num_col, grouped):
+    grouped = grouped.sort_values(ascending=False).head(10)
+    if len(grouped) <= 1:
+        return None
+    return {
+        "type": "bar",
+        "title": f"{safe_str(num_col)} par {safe_str(cat_col)}",
+        "labels": ascii_strings(pd.Series(grouped.index, dtype=object)).tolist(),
+        "values": round2(grouped.to_numpy(dtype=np.float64)),
+        "x_col": safe_str(cat_col),
+        "y_col": safe_str(num_col)
+    }
+
+def build_donut_chart(bool_col, counts):
+    return {
+        "type": "donut",
+        "title": f"Repartition de {safe_str(bool_col)}",
+        "labels": ascii_strings(pd.Series(counts.index, dtype=object)).tolist(),
+        "values": counts.to_numpy(dtype=np.int64)
+    }
+
+ANOMALY_METHOD = os.environ.get("ANOMALY_METHOD", "zscore")
+ZSCORE_LIMIT = 3.0
+MAD_LIMIT = 3.5
+MAD_SCALE = 1.4826
+IQR_FACTOR = 1.5
+
+def outlier_bounds(method, mean, std, q1=None, median=None, q3=None, mad=None):
+    # Chaque methode se ramene a |x - centre| > largeur
+    if method == "mad":
+        return median, MAD_LIMIT * MAD_SCALE * mad
+    if method == "iqr":
+        iqr = q3 - q1
+        return (q1 + q3) / 2, iqr / 2 + IQR_FACTOR * iqr
+    return mean, ZSCORE_LIMIT * std
+
+def robust_quantiles(values):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        q1, median, q3 = np.nanpercentile(values, [25, 50, 75], axis=0)
+        mad = np.nanmedian(np.abs(values - median), axis=0)
+    return q1, median, q3, mad
+
+def numeric_kernel(values, method=None, flag_rows=False):
+    # Statistiques de toutes les colonnes numeriques sur un seul tableau 2-D (lignes x colonnes).
+    # flag_rows : renvoie aussi le masque des valeurs aberrantes (lignes x colonnes)
+    # Methode lue a l appel, comme le streaming : les deux chemins suivent ANOMALY_METHOD
+    method = method or ANOMALY_METHOD
+    values = np.asfortranarray(values, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        missing = np.isnan(values)
+        count = values.shape[0] - missing.sum(axis=0)
+        deviation = np.where(missing, 0.0, values)
+        total = deviation.sum(axis=0)
+        mean = total / count
+        minimum = np.fmin.reduce(values, axis=0)
+        maximum = np.fmax.reduce(values, axis=0)
+        np.subtract(mean, deviation, out=deviation)
+        np.putmask(deviation, missing, 0.0)
+        np.abs(deviation, out=deviation)
+        std = np.sqrt(np.square(deviation).sum(axis=0) / (count - 1))
+        if method in ("mad", "iqr"):
+            center, width = outlier_bounds(method, mean, std, *robust_quantiles(values))
+            flagged = np.abs(values - center) > width
+            usable = (count >= 3) & (width > 0)
+        else:
+            _, width = outlier_bounds("zscore", mean, std)
+            flagged = deviation > width
+            usable = (count >= 3) & (std != 0)
+    stats = {
+        "count": count,
+        "sum": total,
+        "mean": mean,
+        "min": minimum,
+        "max": maximum,
+        "std": std,
+        "outliers": np.where(usable, flagged.sum(axis=0), 0),
+    }
+    if flag_rows:
+        stats["flagged"] = flagged & usable
+    return stats
+
+def build_anomaly(col, count):
+    return {
+        "column": safe_str(col),
+        "count": int(count),
+        "message": f"{int(count)} valeur(s) aberrante(s) dans '{safe_str(col)}'"
+    }
+
+MAX_LINE_CHARTS = int(os.environ.get("MAX_LINE_CHARTS", "12"))
+MAX_BAR_CHARTS = int(os.environ.get("MAX_BAR_CHARTS", "24"))
+MAX_BAR_CATEGORIES = 20
+
+def select_chart_pairs(keys, number_cols, key_scores, num_scores, limit):
+    # Classe les couples (axe, colonne numerique) et ne garde que les meilleurs avant tout calcul
+    key_rank = {c: i for i, c in enumerate(sorted(keys, key=lambda c: key_scores.get(c, 0), reverse=True))}
+    num_rank = {c: i for i, c in enumerate(sorted(number_cols, key=lambda c: num_scores.get(c, (0, 0)), reverse=True))}
+    pairs = sorted(
+        ((k, n) for k in keys for n in number_cols),
+        key=lambda p: (key_rank[p[0]] + num_rank[p[1]], key_rank[p[0]])
+    )
+    kept = set(pairs[:max(limit, 0)])
+    selected = {}
+    for k in keys:
+        cols = [n for n in number_cols if (k, n) in kept]
+        if cols:
+            selected[k] = cols
+    return selected
+
+def numeric_scores(counts, means, stds):
+    # Couverture d abord, puis dispersion relative
+    scores = {}
+    for col in counts:
+        mean = means.get(col)
+        std = stds.get(col)
+        cv = abs(std / mean) if mean and std is not None and std == std else 0.0
+        scores[col] = (int(counts[col]), cv)
+    return scores
+
+def group_codes(df, col, cache):
+    if col not in cache:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.is_monotonic_increasing:
+            cache[col] = values.cat.codes.to_numpy(), np.asarray(values.cat.categories, dtype=object)
+        else:
+            cache[col] = pd.factorize(values, sort=True)
+    return cache[col]
+
+def grouped_sums(df, number_cols, codes, uniques):
+    valid = codes >= 0
+    block = df[number_cols] if valid.all() else df.loc[valid, number_cols]
+    # float64 : les colonnes compactees (int8, float32...) ne doivent ni deborder ni perdre en precision
+    sums = block.astype(np.float64).groupby(codes[valid]).sum()
+    sums.index = uniques[sums.index]
+    return sums
+
+def extract_basic_stats(df, schema=None, progress=None):
+    if schema is None:
+        df, schema = infer_schema(df.copy())
     number_cols = []
     date_cols = []
     category_cols = []
@@ -148,118 +932,425 @@ def extract_basic_stats(df):
     alerts = []
     anomalies = []
 
+    groups = {
+        "ignored": ignored_cols,
+        "date": date_cols,
+        "boolean": boolean_cols,
+        "number": number_cols,
+        "category": category_cols,
+    }
     for col in df.columns:
-        series = df[col]
-        if is_phone_number(series):
-            ignored_cols.append(col)
-            continue
-        if is_matricule(series):
-            ignored_cols.append(col)
-            continue
-        if pd.api.types.is_datetime64_any_dtype(series):
-            date_cols.append(col)
-            continue
-        unique_lower = series.dropna().astype(str).str.lower().unique()
-        bool_keywords = {"oui","non","yes","no","true","false","present","absent","actif","inactif"}
-        if set(unique_lower).issubset(bool_keywords):
-            boolean_cols.append(col)
-            continue
-        if pd.api.types.is_numeric_dtype(series):
-            number_cols.append(col)
-            continue
-        category_cols.append(col)
+        groups[schema["kinds"].get(col, "category")].append(col)
 
     print(f"[STATS] Colonnes numeriques: {number_cols}")
     print(f"[STATS] Colonnes ignorees: {ignored_cols}")
 
-    for col in number_cols:
-        clean = df[col].dropna()
-        if len(clean) == 0:
+    with tracing.span("stats.numeric_kernel", rows=len(df), columns=len(number_cols)):
+        stats = numeric_kernel(df[number_cols].to_numpy(dtype=float)) if number_cols else None
+    means = {}
+    stds = {}
+    for i, col in enumerate(number_cols):
+        if stats["count"][i] == 0:
             continue
-        kpis.append({
-            "column": safe_str(col),
-            "total": round(float(clean.sum()), 2),
-            "average": round(float(clean.mean()), 2),
-            "min": round(float(clean.min()), 2),
-            "max": round(float(clean.max()), 2),
-            "count": int(clean.count())
+        means[col] = stats["mean"][i]
+        stds[col] = stats["std"][i]
+        kpi, alert = build_kpi(col, stats["count"][i], stats["sum"][i], means[col], stats["min"][i], stats["max"][i], stds[col])
+        kpis.append(kpi)
+        if alert:
+            alerts.append(alert)
+    if stats is not None:
+        # Colonnes des tables Arrow prises sur les tableaux du noyau, arrondies comme les KPIs
+        filled = stats["count"] > 0
+        kpis = serialization.TableRows(kpis, {
+            "total": round2(stats["sum"][filled]),
+            "average": round2(stats["mean"][filled]),
+            "min": round2(stats["min"][filled]),
+            "max": round2(stats["max"][filled]),
+            "count": stats["count"][filled].astype(np.int64),
         })
-        if clean.std() > 0 and clean.max() > clean.mean() + 2 * clean.std():
-            alerts.append({
-                "type": "warning",
-                "message": f"Valeur elevee dans '{safe_str(col)}': max={round(float(clean.max()), 2)}, moyenne={round(float(clean.mean()), 2)}"
-            })
-
-    for date_col in date_cols:
-        for num_col in number_cols:
+    report(progress, "kpis", {"kpis": kpis, "alerts": alerts})
+
+    counts = df.count()
+    num_scores = numeric_scores({c: counts[c] for c in number_cols}, means, stds)
+    bar_cols = []
+    for cat_col in category_cols:
+        unique_count = schema["unique_counts"].get(cat_col)
+        if (unique_count if unique_count is not None else df[cat_col].nunique()) <= MAX_BAR_CATEGORIES:
+            bar_cols.append(cat_col)
+    codes_cache = {}
+
+    with tracing.span("stats.time_series", rows=len(df)):
+        line_pairs = select_chart_pairs(date_cols, number_cols, counts, num_scores, MAX_LINE_CHARTS)
+        for date_col, num_cols in line_pairs.items():
             try:
-                time_series = df.groupby(df[date_col].dt.to_period("M"))[num_col].sum()
-                values = [round(float(v), 2) for v in time_series.values]
-                labels = [safe_str(p) for p in time_series.index]
-                if len(values) >= 2 and values[-1] < values[-2] * 0.8:
-                    alerts.append({
-                        "type": "danger",
-                        "message": f"Baisse de plus de 20% sur '{safe_str(num_col)}'"
-                    })
-                charts.append({
-                    "type": "line",
-                    "title": f"Evolution de {safe_str(num_col)} par mois",
-                    "labels": labels,
-                    "values": values,
-                    "x_col": safe_str(date_col),
-                    "y_col": safe_str(num_col)
-                })
+                daily = timeseries.daily_sums(df[date_col], df[number_cols])
+                if daily.empty:
+                    continue
+                series = timeseries.analyze(daily)
             except Exception:
-                pass
+                continue
+            add_time_series(date_col, num_cols, series, charts, alerts)
 
-    for cat_col in category_cols:
-        if df[cat_col].nunique() > 20:
-            continue
-        for num_col in number_cols:
+    with tracing.span("stats.bar_charts", rows=len(df)):
+        bar_pairs = select_chart_pairs(bar_cols, number_cols, counts, num_scores, MAX_BAR_CHARTS)
+        for cat_col, num_cols in bar_pairs.items():
             try:
-                grouped = df.groupby(cat_col)[num_col].sum().sort_values(ascending=False).head(10)
-                if len(grouped) > 1:
-                    charts.append({
-                        "type": "bar",
-                        "title": f"{safe_str(num_col)} par {safe_str(cat_col)}",
-                        "labels": [safe_str(l) for l in grouped.index.tolist()],
-                        "values": [round(float(v), 2) for v in grouped.values.tolist()],
-                        "x_col": safe_str(cat_col),
-                        "y_col": safe_str(num_col)
-                    })
+                codes, uniques = group_codes(df, cat_col, codes_cache)
+                sums = grouped_sums(df, num_cols, codes, uniques)
+            except Exception:
+                continue
+            for num_col in num_cols:
+                chart = build_bar_chart(cat_col, num_col, sums[num_col])
+                if chart:
+                    charts.append(chart)
+
+    with tracing.span("stats.donut_charts", rows=len(df), columns=len(boolean_cols)):
+        for bool_col in boolean_cols:
+            try:
+                charts.append(build_donut_chart(bool_col, df[bool_col].astype(str).str.lower().value_counts()))
             except Exception:
                 pass
 
-    for bool_col in boolean_cols:
+    for i, col in enumerate(number_cols):
+        if stats["outliers"][i]:
+            anomalies.append(build_anomaly(col, stats["outliers"][i]))
+    charts = serialization.chart_rows(charts)
+    report(progress, "charts", {"charts": charts, "alerts": alerts, "anomalies": anomalies})
+
+    return {
+        "kpis": kpis,
+        "charts": charts,
+        "alerts": alerts,
+        "anomalies": anomalies,
+        "number_cols": number_cols,
+        "date_cols": date_cols,
+        "category_cols": category_cols,
+        "boolean_cols": boolean_cols,
+        "ignored_cols": ignored_cols
+    }
+
+XLSX_NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+XLSX_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+MERGE_CELL_PATTERN = re.compile(rb'<(?:\w+:)?mergeCell\b[^>]*?\bref="([A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?)"')
+
+def list_sheet_paths(zf):
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {r.get("Id"): r.get("Target") for r in rels.findall("rel:Relationship", XLSX_NS)}
+    sheets = []
+    for sheet in workbook.findall("main:sheets/main:sheet", XLSX_NS):
+        target = targets.get(sheet.get(XLSX_REL_ID), "")
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.normpath(posixpath.join("xl", target))
+        sheets.append((sheet.get("name"), path))
+    return sheets
+
+def list_data_sheets(file_bytes):
+    # Feuilles de calcul visibles (ni graphiques ni masquees), lues depuis workbook.xml
+    try:
+        with zipfile.ZipFile(uploads.open_buffer(file_bytes)) as zf:
+            workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+            hidden = {
+                sheet.get("name") for sheet in workbook.findall("main:sheets/main:sheet", XLSX_NS)
+                if sheet.get("state") in ("hidden", "veryHidden")
+            }
+            return [name for name, path in list_sheet_paths(zf) if "/worksheets/" in path and name not in hidden]
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        return []
+
+def active_sheet_name(file_bytes):
+    # Onglet actif de workbook.xml (activeTab), comme wb.active d openpyxl
+    try:
+        with zipfile.ZipFile(uploads.open_buffer(file_bytes)) as zf:
+            workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        return None
+    sheets = workbook.findall("main:sheets/main:sheet", XLSX_NS)
+    view = workbook.find("main:bookViews/main:workbookView", XLSX_NS)
+    try:
+        index = int(view.get("activeTab", 0)) if view is not None else 0
+    except ValueError:
+        index = 0
+    return sheets[index].get("name") if 0 <= index < len(sheets) else None
+
+def read_merged_ranges(file_bytes, sheet_name):
+    with zipfile.ZipFile(uploads.open_buffer(file_bytes)) as zf:
+        paths = dict(list_sheet_paths(zf))
+        ranges = []
+        buffer = b""
+        with zf.open(paths[sheet_name]) as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                buffer += chunk
+                last_end = 0
+                for match in MERGE_CELL_PATTERN.finditer(buffer):
+                    min_col, min_row, max_col, max_row = range_boundaries(match.group(1).decode("ascii"))
+                    ranges.append((min_row, min_col, max_row, max_col))
+                    last_end = match.end()
+                buffer = buffer[max(last_end, len(buffer) - 256):]
+    return sorted(ranges)
+
+def iter_sheet_rows(file_bytes):
+    wb = openpyxl.load_workbook(uploads.open_buffer(file_bytes), read_only=True, data_only=True)
+    try:
+        ws = wb.active
         try:
-            counts = df[bool_col].astype(str).str.lower().value_counts()
-            charts.append({
-                "type": "donut",
-                "title": f"Repartition de {safe_str(bool_col)}",
-                "labels": [safe_str(l) for l in counts.index.tolist()],
-                "values": [int(v) for v in counts.values.tolist()]
-            })
+            merges = read_merged_ranges(file_bytes, ws.title)
         except Exception:
-            pass
+            merges = []
+        active = []
+        next_merge = 0
+        for row_number, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            row = list(values)
+            while next_merge < len(merges) and merges[next_merge][0] <= row_number:
+                min_row, min_col, max_row, max_col = merges[next_merge]
+                top_left_value = row[min_col - 1] if min_col - 1 < len(row) else None
+                active.append((max_row, min_col, max_col, top_left_value))
+                next_merge += 1
+            if active:
+                for max_row, min_col, max_col, top_left_value in active:
+                    if len(row) < max_col:
+                        row.extend([None] * (max_col - len(row)))
+                    row[min_col - 1:max_col] = [top_left_value] * (max_col - min_col + 1)
+                active = [m for m in active if m[0] > row_number]
+            yield row
+    finally:
+        wb.close()
+
+def rows_to_frame(rows, columns, first_row):
+    width = len(columns)
+    grid = rows_to_grid(rows)
+    if grid.shape[1] < width:
+        grid = np.hstack([grid, np.full((len(grid), width - grid.shape[1]), None, dtype=object)])
+    body = blank_empty_cells(grid[:, :width])
+    return pd.DataFrame(body, columns=columns, index=pd.RangeIndex(first_row, first_row + len(body))).infer_objects()
+
+def new_stream_state(columns, spill=None):
+    return {
+        "columns": columns,
+        "text_cols": None,
+        "schema": None,
+        "kinds": {},
+        "carry": {},
+        "subtotals": [],
+        "rows": 0,
+        "nulls": pd.Series(0, index=columns, dtype="int64"),
+        "sample": None,
+        "numeric": {},
+        "series": {},
+        "series_freq": timeseries.BASE_FREQ,
+        "discrete": {},
+        "spill": spill if spill is not None else tempfile.TemporaryFile(),
+        "rng": np.random.default_rng(0),
+    }
+
+def add_to_reservoir(acc, clean, rng):
+    # Echantillon uniforme borne, pour estimer mediane et quartiles sans garder toute la colonne
+    reservoir = acc.setdefault("reservoir", np.empty(0))
+    seen = acc["count"] - len(clean)
+    room = STREAM_RESERVOIR_SIZE - len(reservoir)
+    if room > 0:
+        reservoir = np.concatenate([reservoir, clean[:room]])
+        clean = clean[room:]
+        seen += room
+    if len(clean):
+        slots = rng.integers(0, seen + np.arange(1, len(clean) + 1))
+        keep = slots < STREAM_RESERVOIR_SIZE
+        reservoir[slots[keep]] = clean[keep]
+    acc["reservoir"] = reservoir
+
+def merge_moments(acc, clean):
+    n_b = len(clean)
+    if n_b == 0:
+        return
+    mean_b = float(clean.mean())
+    m2_b = float(((clean - mean_b) ** 2).sum())
+    n_a = acc["count"]
+    if n_a == 0:
+        acc.update(count=n_b, sum=float(clean.sum()), mean=mean_b, m2=m2_b,
+                   min=float(clean.min()), max=float(clean.max()))
+        return
+    n = n_a + n_b
+    delta = mean_b - acc["mean"]
+    acc["mean"] += delta * n_b / n
+    acc["m2"] += m2_b + delta * delta * n_a * n_b / n
+    acc["count"] = n
+    acc["sum"] += float(clean.sum())
+    acc["min"] = min(acc["min"], float(clean.min()))
+    acc["max"] = max(acc["max"], float(clean.max()))
+
+def consume_stream_chunk(state, chunk):
+    with tracing.span("stream_chunk", rows=len(chunk), columns=len(chunk.columns)):
+        chunk = chunk.dropna(how='all')
+        if chunk.empty:
+            return
+        if state["text_cols"] is None:
+            state["text_cols"] = [c for c in chunk.columns if chunk[c].dtype == object]
+        mask, found = detect_total_rows(chunk, state["text_cols"])
+        state["subtotals"].extend(found)
+        chunk = chunk[~mask]
+        if chunk.empty:
+            return
+        for col in state["text_cols"]:
+            chunk[col] = chunk[col].ffill()
+            if col in state["carry"]:
+                chunk[col] = chunk[col].fillna(state["carry"][col])
+            last = chunk[col].dropna()
+            if len(last):
+                state["carry"][col] = last.iloc[-1]
+        chunk = chunk.reset_index(drop=True)
+        if state["schema"] is None:
+            chunk, state["schema"] = infer_schema(chunk)
+            state["kinds"] = {c: k for c, k in state["schema"]["kinds"].items() if chunk[c].notna().any()}
+        else:
+            chunk = apply_schema(chunk, state["schema"])
+        if state["sample"] is None:
+            state["sample"] = chunk.head(HEADER_SCAN_ROWS).copy()
+
+        state["rows"] += len(chunk)
+        state["nulls"] += chunk.isnull().sum()
+        pending = [c for c in chunk.columns if c not in state["kinds"] and chunk[c].notna().any()]
+        if pending:
+            _, pending_schema = infer_schema(chunk[pending].copy())
+            state["kinds"].update(pending_schema["kinds"])
+        kinds = state["kinds"]
+        number_cols = [c for c in chunk.columns if kinds.get(c) == "number"]
+        date_cols = [c for c in chunk.columns if kinds.get(c) == "date"]
+        discrete_cols = [c for c in chunk.columns if kinds.get(c) in ("boolean", "category")]
+
+        for col in number_cols:
+            acc = state["numeric"].setdefault(col, {"count": 0, "sum": 0.0, "mean": 0.0, "m2": 0.0, "min": 0.0, "max": 0.0})
+            clean = chunk[col].dropna().astype(float)
+            merge_moments(acc, clean)
+            if ANOMALY_METHOD != "zscore":
+                add_to_reservoir(acc, clean.to_numpy(), state["rng"])
+        if number_cols:
+            np.save(state["spill"], chunk[number_cols].to_numpy(dtype=float))
+            state.setdefault("spill_cols", []).append(number_cols)
+
+        for date_col in date_cols:
+            if not number_cols:
+                continue
+            try:
+                part = timeseries.daily_sums(chunk[date_col], chunk[number_cols])
+            except Exception:
+                continue
+            prev = state["series"].get(date_col)
+            state["series"][date_col] = part if prev is None else prev.add(part, fill_value=0)
+
+        for col in discrete_cols:
+            acc = state["discrete"].setdefault(col, {"lower_counts": None, "sums": None, "values": set(), "overflow": False})
+            if acc["overflow"]:
+                continue
+            acc["values"].update(chunk[col].dropna().unique().tolist())
+            if len(acc["values"]) > MAX_BAR_CATEGORIES:
+                acc.update(overflow=True, values=set(), lower_counts=None, sums=None)
+                continue
+            counts = chunk[col].astype(str).str.lower().value_counts()
+            acc["lower_counts"] = counts if acc["lower_counts"] is None else acc["lower_counts"].add(counts, fill_value=0)
+            if number_cols:
+                part = chunk.groupby(col)[number_cols].sum()
+                acc["sums"] = part if acc["sums"] is None else acc["sums"].add(part, fill_value=0)
+
+def finalize_stream_stats(state):
+    columns = [c for c in state["columns"] if state["nulls"][c] < state["rows"]]
+    kinds = state["kinds"]
+    for col, acc in state["discrete"].items():
+        unique_lower = {str(v).lower() for v in acc["values"]}
+        kinds[col] = "boolean" if not acc["overflow"] and unique_lower.issubset(BOOL_KEYWORDS) else "category"
+    groups = {"ignored": [], "date": [], "boolean": [], "number": [], "category": []}
+    for col in columns:
+        groups[kinds.get(col, "category")].append(col)
+    number_cols = groups["number"]
+    kpis = []
+    charts = []
+    alerts = []
+    anomalies = []
+
+    print(f"[STATS] Colonnes numeriques: {number_cols}")
+    print(f"[STATS] Colonnes ignorees: {groups['ignored']}")
 
     for col in number_cols:
+        acc = state["numeric"].get(col)
+        if not acc or acc["count"] == 0:
+            continue
+        std = (acc["m2"] / (acc["count"] - 1)) ** 0.5 if acc["count"] > 1 else float("nan")
+        acc["std"] = std
+        kpi, alert = build_kpi(col, acc["count"], acc["sum"], acc["mean"], acc["min"], acc["max"], std)
+        kpis.append(kpi)
+        if alert:
+            alerts.append(alert)
+
+    num_scores = numeric_scores(
+        {c: acc["count"] for c, acc in state["numeric"].items() if c in number_cols},
+        {c: acc["mean"] for c, acc in state["numeric"].items()},
+        {c: acc.get("std") for c, acc in state["numeric"].items()}
+    )
+    key_scores = (state["rows"] - state["nulls"]).to_dict()
+    line_pairs = select_chart_pairs(groups["date"], number_cols, key_scores, num_scores, MAX_LINE_CHARTS)
+    for date_col, num_cols in line_pairs.items():
+        daily = state["series"].get(date_col)
         try:
-            clean = df[col].dropna()
-            if len(clean) < 3:
-                continue
-            mean = clean.mean()
-            std = clean.std()
-            if std == 0:
+            if daily is None or daily.empty:
                 continue
-            outliers = df[abs(df[col] - mean) > 3 * std]
-            if not outliers.empty:
-                anomalies.append({
-                    "column": safe_str(col),
-                    "count": len(outliers),
-                    "message": f"{len(outliers)} valeur(s) aberrante(s) dans '{safe_str(col)}'"
-                })
+            series = timeseries.analyze(daily.sort_index()[[c for c in number_cols if c in daily.columns]])
         except Exception:
-            pass
+            continue
+        add_time_series(date_col, num_cols, series, charts, alerts)
+
+    bar_cols = []
+    for cat_col in groups["category"]:
+        acc = state["discrete"].get(cat_col)
+        if acc and not acc["overflow"] and acc["sums"] is not None:
+            bar_cols.append(cat_col)
+    bar_pairs = select_chart_pairs(bar_cols, number_cols, key_scores, num_scores, MAX_BAR_CHARTS)
+    for cat_col, num_cols in bar_pairs.items():
+        acc = state["discrete"][cat_col]
+        for num_col in num_cols:
+            try:
+                chart = build_bar_chart(cat_col, num_col, acc["sums"][num_col])
+                if chart:
+                    charts.append(chart)
+            except Exception:
+                pass
+
+    for bool_col in groups["boolean"]:
+        counts = state["discrete"][bool_col]["lower_counts"].astype("int64").sort_values(ascending=False, kind="stable")
+        charts.append(build_donut_chart(bool_col, counts))
+    charts = serialization.chart_rows(charts)
+
+    outliers = dict.fromkeys(number_cols, 0)
+    bounds = {}
+    for col in number_cols:
+        acc = state["numeric"].get(col)
+        if not acc or acc["count"] < 3:
+            continue
+        if ANOMALY_METHOD == "zscore":
+            if acc["std"]:
+                bounds[col] = outlier_bounds("zscore", acc["mean"], acc["std"])
+            continue
+        center, width = outlier_bounds(ANOMALY_METHOD, acc["mean"], acc["std"], *robust_quantiles(acc["reservoir"]))
+        if width > 0:
+            bounds[col] = (center, width)
+    spill = state["spill"]
+    spill.seek(0)
+    for chunk_cols in state.get("spill_cols", []):
+        values = np.load(spill)
+        for i, col in enumerate(chunk_cols):
+            if col not in outliers or col not in bounds:
+                continue
+            center, width = bounds[col]
+            outliers[col] += int((np.abs(values[:, i] - center) > width).sum())
+    for col in number_cols:
+        if outliers[col]:
+            anomalies.append(build_anomaly(col, outliers[col]))
 
     return {
         "kpis": kpis,
@@ -267,38 +1358,491 @@ def extract_basic_stats(df):
         "alerts": alerts,
         "anomalies": anomalies,
         "number_cols": number_cols,
-        "date_cols": date_cols,
-        "category_cols": category_cols,
-        "boolean_cols": boolean_cols,
-        "ignored_cols": ignored_cols
+        "date_cols": groups["date"],
+        "category_cols": groups["category"],
+        "boolean_cols": groups["boolean"],
+        "ignored_cols": groups["ignored"]
+    }, columns
+
+def iter_raw_chunks(file_bytes):
+    # Colonnes + blocs bruts (avant nettoyage) indexes par numero de ligne du fichier
+    if detect_format(file_bytes) != "xlsx":
+        raw = load_raw_frame(file_bytes)
+        raw.columns = clean_column_names(raw.columns)
+        return list(raw.columns), (raw.iloc[i:i + STREAM_CHUNK_ROWS] for i in range(0, len(raw), STREAM_CHUNK_ROWS))
+    rows = iter_sheet_rows(file_bytes)
+    head = list(itertools.islice(rows, HEADER_SCAN_ROWS))
+    with tracing.span("header_detection"):
+        header_row = find_header_row(blank_empty_cells(rows_to_grid(head))) or 0
+    width = max((len(row) for row in head), default=0)
+    header = head[header_row] if header_row < len(head) else []
+    columns = clean_column_names(build_header(header, width))
+
+    def chunks():
+        chunk = head[header_row + 1:]
+        first_row = header_row + 2
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= STREAM_CHUNK_ROWS:
+                yield rows_to_frame(chunk, columns, first_row)
+                first_row += len(chunk)
+                chunk = []
+        if chunk:
+            yield rows_to_frame(chunk, columns, first_row)
+    return columns, chunks()
+
+def stream_result(state):
+    with tracing.span("stream_finalize", rows=state["rows"]):
+        basic_stats, columns = finalize_stream_stats(state)
+    sample = state["sample"] if state["sample"] is not None else pd.DataFrame(columns=columns)
+    summary = {
+        "total_rows": state["rows"],
+        "total_columns": len(columns),
+        "missing_values": int(state["nulls"][columns].sum()),
+        "columns_list": [safe_str(c) for c in columns],
+        "subtotal_rows": len(state["subtotals"]),
+        "subtotals": state["subtotals"][:MAX_REPORTED_SUBTOTALS]
     }
+    return sample[[c for c in columns if c in sample.columns]], basic_stats, summary
+
+def stream_analyze(file_bytes):
+    columns, chunks = iter_raw_chunks(file_bytes)
+    state = new_stream_state(columns)
+    for chunk in chunks:
+        consume_stream_chunk(state, chunk)
+    try:
+        return stream_result(state)
+    finally:
+        state["spill"].close()
+
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+def row_hashes(chunk):
+    return pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+
+def load_session(session_id):
+    return sessions.load(session_id)
+
+def schema_drift(state, chunk):
+    # Les lignes ajoutees changeraient-elles le type d une colonne (ou perdraient-elles des valeurs
+    # a la conversion) par rapport au schema fige sur le premier bloc ?
+    schema = state["schema"]
+    if schema is None:
+        return False
+    for col, kind in state["kinds"].items():
+        values = chunk[col].dropna()
+        if values.empty:
+            continue
+        info, _ = infer_column(values.reset_index(drop=True), len(values))
+        # category <-> boolean sur quelques lignes ne change pas les agregats tenus
+        if info["kind"] != kind and {info["kind"], kind} & {"number", "date", "ignored"}:
+            return True
+        converted = apply_schema(values.to_frame(), {**schema, "kinds": {col: kind},
+                                                     "conversions": {k: v for k, v in schema["conversions"].items() if k == col}})
+        if converted[col].isna().any():
+            return True
+    return False
+
+def fold_appended_rows(saved, columns, chunks, spill_path):
+    # Verifie que l ancien fichier est un prefixe exact du nouveau, puis n agrege que la suite
+    # Sessions enregistrees avant les sommes journalieres : recalcul complet
+    if saved is None or saved["columns"] != columns or saved["state"].get("series_freq") != timeseries.BASE_FREQ:
+        return None
+    old_hashes = saved["hashes"]
+    # Ancien fichier plus court qu un bloc : son schema a ete deduit sur moins de lignes
+    # que ne le ferait un recalcul complet du nouveau
+    if len(old_hashes) < STREAM_CHUNK_ROWS:
+        return None
+    pos = 0
+    pending = []
+    for chunk in chunks:
+        hashes = row_hashes(chunk)
+        overlap = min(len(hashes), len(old_hashes) - pos)
+        if overlap > 0:
+            if not np.array_equal(hashes[:overlap], old_hashes[pos:pos + overlap]):
+                return None
+            pos += overlap
+        if overlap < len(hashes):
+            pending.append((chunk.iloc[overlap:], hashes[overlap:]))
+    if pos < len(old_hashes):
+        return None
+    state = saved["state"]
+    if any(schema_drift(state, chunk) for chunk, _ in pending):
+        print("[SESSION] Types modifies par les lignes ajoutees, recalcul complet")
+        return None
+    spill = open(spill_path, "r+b")
+    spill.truncate(saved["spill_size"])
+    spill.seek(0, os.SEEK_END)
+    state["spill"] = spill
+    new_hashes = [old_hashes]
+    for chunk, hashes in pending:
+        consume_stream_chunk(state, chunk)
+        new_hashes.append(hashes)
+    return state, np.concatenate(new_hashes), sum(len(h) for _, h in pending)
 
-async def gemini_full_analysis(df, basic_stats):
+def session_job(source, session_id):
+    with uploads.mapped(source) as file_bytes:
+        return update_session_state(file_bytes, session_id)
+
+def update_session_state(file_bytes, session_id):
+    path = cache.ensure_entry(session_id)
+    spill_path = os.path.join(path, "spill.npy")
+    saved = load_session(session_id) if os.path.exists(spill_path) else None
+    columns, chunks = iter_raw_chunks(file_bytes)
+    folded = fold_appended_rows(saved, columns, chunks, spill_path)
+    if folded is not None:
+        state, hashes, appended = folded
+        mode = "incremental"
+    else:
+        if saved is not None and saved["columns"] == columns:
+            columns, chunks = iter_raw_chunks(file_bytes)
+        state = new_stream_state(columns, open(spill_path, "w+b"))
+        hashes = []
+        for chunk in chunks:
+            hashes.append(row_hashes(chunk))
+            consume_stream_chunk(state, chunk)
+        hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype="uint64")
+        appended = len(hashes)
+        mode = "full"
+    spill = state.pop("spill")
     try:
-        apercu_lines = []
-        for i, row in df.head(15).iterrows():
-            line_parts = []
-            for col in df.columns:
-                val = safe_str(row[col])
-                col_s = safe_str(col)
-                line_parts.append(f"{col_s}={val}")
-            apercu_lines.append(" | ".join(line_parts))
-        apercu = "\n".join(apercu_lines)
-
-        stats_safe = {
-            "nb_lignes": len(df),
-            "nb_colonnes": len(df.columns),
-            "colonnes": [safe_str(c) for c in df.columns.tolist()],
-            "colonnes_numeriques": [safe_str(c) for c in basic_stats["number_cols"]],
-            "colonnes_categories": [safe_str(c) for c in basic_stats["category_cols"]],
-            "colonnes_ignorees": [safe_str(c) for c in basic_stats["ignored_cols"]],
+        spill_size = spill.seek(0, os.SEEK_END)
+        state["spill"] = spill
+        _, basic_stats, summary = stream_result(state)
+    finally:
+        state.pop("spill", None)
+        spill.close()
+    sessions.save(session_id, columns, hashes, state, spill_size)
+    cache.renew(session_id)
+    cache.evict()
+    return basic_stats, summary, {"id": session_id, "mode": mode, "appended_rows": int(appended), "total_raw_rows": len(hashes)}
+
+def build_summary(df, subtotals=None):
+    subtotals = subtotals or []
+    return {
+        "total_rows": len(df),
+        "total_columns": len(df.columns),
+        "missing_values": int(df.isnull().sum().sum()),
+        "columns_list": [safe_str(c) for c in df.columns.tolist()],
+        "subtotal_rows": len(subtotals),
+        "subtotals": subtotals[:MAX_REPORTED_SUBTOTALS]
+    }
+
+def report_cached_stages(progress, basic_stats, summary):
+    report(progress, "ingest", {
+        "total_rows": summary["total_rows"],
+        "total_columns": summary["total_columns"],
+        "columns_list": summary["columns_list"],
+        "subtotal_rows": summary.get("subtotal_rows", 0)
+    })
+    kinds = {}
+    for kind, key in (("number", "number_cols"), ("date", "date_cols"), ("category", "category_cols"),
+                      ("boolean", "boolean_cols"), ("ignored", "ignored_cols")):
+        kinds.update({safe_str(c): kind for c in basic_stats[key]})
+    report(progress, "schema", {"kinds": kinds})
+    report(progress, "kpis", {"kpis": basic_stats["kpis"], "alerts": basic_stats["alerts"]})
+    report(progress, "charts", {"charts": basic_stats["charts"], "alerts": basic_stats["alerts"], "anomalies": basic_stats["anomalies"]})
+
+def is_streamed(file_bytes):
+    return len(file_bytes) > STREAMING_THRESHOLD_BYTES and detect_format(file_bytes) == "xlsx"
+
+def run_pipeline(file_bytes, progress=None):
+    if is_streamed(file_bytes):
+        print(f"[ANALYZE] Mode streaming ({len(file_bytes)} octets)")
+        df, basic_stats, summary = stream_analyze(file_bytes)
+        report_cached_stages(progress, basic_stats, summary)
+        return df, basic_stats, summary
+    df, schema = read_typed_excel(file_bytes, progress)
+    return df, extract_basic_stats(df, schema, progress), build_summary(df, schema["subtotals"])
+
+def pipeline_job(source, key, want_frame=True, progress=None):
+    # source : chemin du fichier recu (relu en memory-map dans le processus) ou bytes.
+    # want_frame=False : seuls stats et resume reviennent, sans serialiser le DataFrame (comparaisons)
+    with uploads.mapped(source) as file_bytes:
+        df, basic_stats, summary = run_pipeline(file_bytes, progress)
+        partial = is_streamed(file_bytes)
+    with tracing.span("cache_store", rows=len(df)):
+        cache.store_json(key, "stats", {"basic_stats": basic_stats, "summary": summary})
+        datasets.store(key, df, basic_stats["number_cols"], partial=partial)
+    if not want_frame:
+        return None, basic_stats, summary
+    with tracing.span("frame_ipc", rows=len(df), columns=len(df.columns)):
+        return workers.frame_to_ipc(df), basic_stats, summary
+
+async def cached_pipeline(upload, progress=None, want_frame=True):
+    key = cache.derive_key(upload.digest, ANALYSIS_VERSION)
+    cached = cache.load_json(key, "stats")
+    if cached is not None:
+        print(f"[CACHE] Resultat en cache ({key[:12]})")
+        report_cached_stages(progress, cached["basic_stats"], cached["summary"])
+        return key, None, cached["basic_stats"], cached["summary"]
+    frame, basic_stats, summary = await workers.run_in_pool(pipeline_job, upload.path, key, want_frame, progress=progress)
+    if frame is None:
+        return key, None, basic_stats, summary
+    with tracing.span("frame_ipc_load"):
+        # ~0,1 s a 1M lignes : hors de la boucle pour ne pas bloquer les autres requetes
+        df = await asyncio.to_thread(workers.frame_from_ipc, frame)
+    return key, df, basic_stats, summary
+
+SUMMARY_SHEET_PATTERN = re.compile(r'recap|r[ée]sum[ée]|synth[eè]se|summary|bilan|total', re.IGNORECASE)
+
+def sheet_job(source, name, key):
+    # Chaque processus relit sa feuille depuis le fichier : pas de grille d objets a serialiser
+    with uploads.mapped(source) as file_bytes:
+        grid = load_sheet_grid(file_bytes, name)
+    if empty_mask(grid).all():
+        return None
+    df, schema = type_raw_frame(grid_to_raw_frame(grid))
+    basic_stats = extract_basic_stats(df, schema)
+    summary = build_summary(df, schema["subtotals"])
+    cache.store_json(key, "stats", {"basic_stats": basic_stats, "summary": summary})
+    datasets.store(key, df, basic_stats["number_cols"])
+    return basic_stats, summary
+
+def build_sheet_rollup(sheets):
+    # Les feuilles de synthese recapitulent deja les mois : on les exclut du cumul
+    periods = [sheet for sheet in sheets if not SUMMARY_SHEET_PATTERN.search(sheet["name"])]
+    table = new_period_table([sheet["name"] for sheet in periods])
+    for index, sheet in enumerate(periods):
+        add_period(table, index, sheet, sheet["summary"])
+    rollup = finalize_period_table(table)
+    rollup["total_rows"] = sum(r for r in rollup["rows"] if r is not None)
+    rollup["excluded_sheets"] = [sheet["name"] for sheet in sheets if sheet not in periods]
+    for indicator in rollup["indicators"]:
+        indicator["grand_total"] = round(sum(t for t in indicator["totals"] if t is not None), 2)
+    return rollup
+
+async def cached_workbook(upload):
+    # Analyse de toutes les feuilles, une tache par feuille ; None si une seule feuille de donnees
+    if upload.size > STREAMING_THRESHOLD_BYTES:
+        return None
+    names = list_data_sheets(upload.data())
+    if len(names) < 2:
+        return None
+    key = cache.derive_key(upload.digest, ANALYSIS_VERSION)
+    cached = cache.load_json(key, "sheets")
+    if cached is not None:
+        return cached or None
+    active = active_sheet_name(upload.data())
+    keys = [key if name == active else cache.derive_key(upload.digest, f"{ANALYSIS_VERSION}:{name}") for name in names]
+
+    async def analyze_sheet(name, sheet_key):
+        # Feuille deja analysee (feuille active passee par cached_pipeline...) : pas de nouvelle tache
+        cached_stats = cache.load_json(sheet_key, "stats")
+        if cached_stats is not None:
+            return cached_stats["basic_stats"], cached_stats["summary"]
+        return await workers.run_in_pool(sheet_job, upload.path, name, sheet_key)
+
+    results = await asyncio.gather(*(analyze_sheet(name, sheet_key) for name, sheet_key in zip(names, keys)))
+    filled = [(name, sheet_key, result) for name, sheet_key, result in zip(names, keys, results) if result is not None]
+    if len(filled) < 2:
+        cache.store_json(key, "sheets", {})
+        return None
+    sheets = []
+    for name, sheet_key, (basic_stats, summary) in filled:
+        sheets.append({
+            "name": safe_str(name),
+            "active": name == active,
+            "dataset_id": datasets.queryable(sheet_key),
+            "summary": summary,
             "kpis": basic_stats["kpis"],
-            "alertes": basic_stats["alerts"],
-            "anomalies": basic_stats["anomalies"],
-        }
-        stats_str = json.dumps(stats_safe, ensure_ascii=True, default=str)
+            "charts": basic_stats["charts"],
+            "alerts": basic_stats["alerts"],
+            "anomalies": basic_stats["anomalies"]
+        })
+    print(f"[WORKBOOK] {len(sheets)} feuilles analysees")
+    workbook = {"sheets": sheets, "rollup": build_sheet_rollup(sheets)}
+    cache.store_json(key, "sheets", workbook)
+    return workbook
+
+def attach_workbook(result, workbook):
+    if workbook:
+        result["sheets"] = workbook["sheets"]
+        result["rollup"] = workbook["rollup"]
+    return result
+
+DOMAIN_KEYWORDS = {
+    "rh": ("salaire", "employe", "conge", "absence", "poste", "matricule", "cnps", "anciennete", "contrat"),
+    "ventes": ("vente", "client", "produit", "quantite", "prix", "remise", "chiffre", "commande"),
+    "finance": ("debit", "credit", "compte", "solde", "facture", "tva", "charge", "budget", "depense"),
+    "sante": ("patient", "consultation", "medecin", "diagnostic", "traitement"),
+    "education": ("eleve", "note", "classe", "matiere", "ecole", "examen"),
+}
+
+def guess_domain(columns):
+    names = " ".join(safe_str(c).lower() for c in columns)
+    scores = {domain: sum(word in names for word in words) for domain, words in DOMAIN_KEYWORDS.items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] else "general"
+
+def analysis_fingerprint(basic_stats):
+    schema_items = []
+    for kind, key in (("number", "number_cols"), ("date", "date_cols"), ("category", "category_cols"),
+                      ("boolean", "boolean_cols"), ("ignored", "ignored_cols")):
+        schema_items.extend((safe_str(c), kind) for c in basic_stats[key])
+    domain = guess_domain(name for name, _ in schema_items)
+    return llm_cache.fingerprint(domain, schema_items, basic_stats["kpis"])
+
+def replay_insights(ai_insights, on_insight):
+    if on_insight is not None:
+        for insight in ai_insights.get("insights", []):
+            on_insight(insight)
+    return ai_insights
+
+async def cached_ai_insights(key, upload, df, basic_stats, summary, on_insight=None):
+    ai_insights = cache.load_json(key, "insights")
+    if ai_insights is not None:
+        return replay_insights(ai_insights, on_insight)
+    fp = analysis_fingerprint(basic_stats)
+    ai_insights, score = llm_cache.get_similar(fp)
+    if ai_insights is not None:
+        print(f"[LLM CACHE] Insights similaires reutilises ({fp['domain']}, similarite {score:.2f})")
+        return replay_insights(ai_insights, on_insight)
+    if df is None:
+        with tracing.span("cache_load_frame"):
+            df = await asyncio.to_thread(datasets.load_frame, key)
+    if df is None:
+        frame, _, _ = await workers.run_in_pool(pipeline_job, upload.path, key)
+        with tracing.span("frame_ipc_load"):
+            df = await asyncio.to_thread(workers.frame_from_ipc, frame)
+    if on_insight is None:
+        ai_insights = await gemini_full_analysis(df, basic_stats, summary["total_rows"])
+    else:
+        ai_insights = await gemini_stream_analysis(df, basic_stats, summary["total_rows"], on_insight)
+    if ai_insights.get("domaine") != "Erreur":
+        cache.store_json(key, "insights", ai_insights)
+        llm_cache.put_similar(fp, ai_insights)
+    return ai_insights
+
+MAX_COMPARE_FILES = int(os.environ.get("MAX_COMPARE_FILES", "24"))
+PERIOD_METRICS = ("total", "average", "min", "max", "count")
+
+def new_period_table(names):
+    return {"names": names, "ready": 0, "rows": [None] * len(names), "kpis": {}}
+
+def add_period(table, index, stats, summary):
+    table["rows"][index] = summary["total_rows"]
+    for kpi in stats["kpis"]:
+        series = table["kpis"].setdefault(kpi["column"], [None] * len(table["names"]))
+        series[index] = {m: kpi[m] for m in PERIOD_METRICS}
+    table["ready"] += 1
+
+def finalize_period_table(table):
+    evolution = []
+    for column, series in table["kpis"].items():
+        totals = [p["total"] if p else None for p in series]
+        changes = []
+        for prev, cur in zip(totals, totals[1:]):
+            if prev in (None, 0) or cur is None:
+                changes.append(None)
+            else:
+                changes.append(round((cur - prev) / abs(prev) * 100, 2))
+        present = [t for t in totals if t is not None]
+        evolution.append({
+            "column": column,
+            "totals": totals,
+            "averages": [p["average"] if p else None for p in series],
+            "change_pct": changes,
+            "first_to_last_pct": round((present[-1] - present[0]) / abs(present[0]) * 100, 2) if len(present) >= 2 and present[0] else None
+        })
+    return {"periods": [safe_str(n) for n in table["names"]], "rows": table["rows"], "indicators": evolution}
+
+def parse_gemini_json(data):
+    if "error" in data:
+        raise Exception(f"Gemini error: {data['error']}")
+    return parse_gemini_text(data["candidates"][0]["content"]["parts"][0]["text"])
+
+def parse_gemini_text(text):
+    print(f"[GEMINI] Reponse recue ({len(text)} chars)")
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return json.loads(text.strip())
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_CHARS_PER_TOKEN = 4
+PROMPT_MAX_ROWS = 15
+PROMPT_MIN_ROWS = 4
+PROMPT_MIN_COLUMNS = 6
+PROMPT_MAX_ITEMS = 12
+
+def estimate_tokens(text):
+    return -(-len(text) // PROMPT_CHARS_PER_TOKEN)
+
+def ascii_strings(series):
+    # Equivalent vectorise de safe_str
+    return (series.astype(str)
+            .str.encode("ascii", errors="ignore").str.decode("ascii")
+            .str.replace("\\", "/", regex=False)
+            .str.replace("\r", " ", regex=False)
+            .str.replace("\n", " ", regex=False))
+
+def rank_prompt_columns(df, basic_stats):
+    # Colonnes a KPI d abord (les plus dispersees en tete), puis dates, categories, booleens
+    spread = {}
+    for kpi in basic_stats["kpis"]:
+        spread[kpi["column"]] = (kpi["count"], (kpi["max"] - kpi["min"]) / abs(kpi["average"]) if kpi["average"] else 0.0)
+    numbers = sorted(basic_stats["number_cols"], key=lambda c: spread.get(safe_str(c), (0, 0.0)), reverse=True)
+    uniques = {c: df[c].nunique() for c in basic_stats["category_cols"] if c in df.columns}
+    categories = sorted(uniques, key=lambda c: (not 2 <= uniques[c] <= 50, uniques[c]))
+    ranked = numbers + list(basic_stats["date_cols"]) + categories + list(basic_stats["boolean_cols"])
+    return [c for c in ranked if c in df.columns], next((c for c in categories if 2 <= uniques[c] <= 50), None)
+
+def stratified_rows(df, strata_col, n):
+    # Tirage systematique apres tri par strate : chaque groupe est represente a proportion de sa taille
+    if len(df) <= n:
+        return np.arange(len(df))
+    if strata_col is None:
+        order = np.arange(len(df))
+    else:
+        codes, _ = pd.factorize(df[strata_col])
+        order = np.argsort(codes, kind="stable")
+    picks = order[np.linspace(0, len(df) - 1, n).round().astype(int)]
+    return np.unique(picks)
+
+def preview_cells(df, columns, rows):
+    # Toutes les cellules de l echantillon converties en une seule passe vectorisee
+    sample = df.iloc[rows][columns]
+    cells = ascii_strings(pd.Series(sample.astype(str).to_numpy().ravel()))
+    return [safe_str(c) for c in columns], cells.to_numpy().reshape(sample.shape)
+
+def build_preview(names, cells, n_cols, n_rows):
+    if len(cells) == 0:
+        return ""
+    keep = np.unique(np.linspace(0, len(cells) - 1, n_rows).round().astype(int)) if n_rows < len(cells) else range(len(cells))
+    return "\n".join(" | ".join(f"{n}={v}" for n, v in zip(names[:n_cols], cells[i, :n_cols])) for i in keep)
 
-        prompt = f"""Tu es un expert analyste de donnees senior pour PME africaines.
+def capped(items, limit=PROMPT_MAX_ITEMS):
+    return items[:limit] + ([f"... {len(items) - limit} autre(s)"] if len(items) > limit else [])
+
+def build_prompt_stats(df, basic_stats, total_rows, columns):
+    shown = {safe_str(c) for c in columns}
+    kpis = [k for k in basic_stats["kpis"] if k["column"] in shown]
+    names = [safe_str(c) for c in df.columns.tolist()]
+    return {
+        "nb_lignes": total_rows if total_rows is not None else len(df),
+        "nb_colonnes": len(df.columns),
+        "colonnes": capped(names, 60),
+        "colonnes_numeriques": capped([safe_str(c) for c in basic_stats["number_cols"]], 60),
+        "colonnes_categories": capped([safe_str(c) for c in basic_stats["category_cols"]], 60),
+        "colonnes_ignorees": capped([safe_str(c) for c in basic_stats["ignored_cols"]], 30),
+        "kpis": {
+            "champs": ["colonne", "total", "moyenne", "min", "max", "nb"],
+            "valeurs": [[k["column"], k["total"], k["average"], k["min"], k["max"], k["count"]] for k in kpis],
+            "omis": len(basic_stats["kpis"]) - len(kpis),
+        },
+        "alertes": capped([a["message"] for a in basic_stats["alerts"]]),
+        "anomalies": capped([a["message"] for a in basic_stats["anomalies"]]),
+    }
+
+def build_analysis_prompt(apercu, stats):
+    stats_str = json.dumps(stats, ensure_ascii=True, default=str)
+
+    return f"""Tu es un expert analyste de donnees senior pour PME africaines.
 Analyse ce fichier Excel de facon complete et professionnelle.
 
 APERCU DES DONNEES :
@@ -346,58 +1890,149 @@ Reponds UNIQUEMENT en JSON valide sans emojis :
   "conclusion": "string"
 }}"""
 
-        print(f"[GEMINI] Envoi requete... ({len(prompt)} chars)")
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                GEMINI_URL,
-                json={
-                    "contents": [{"parts": [{"text": prompt}]}],
-                    "generationConfig": {
-                        "temperature": 0.1,
-                        "maxOutputTokens": 4096,
-                        "responseMimeType": "application/json"
-                    }
-                }
+def build_analysis_payload(df, basic_stats, total_rows=None, budget=PROMPT_TOKEN_BUDGET):
+    with tracing.span("prompt_build", rows=len(df), columns=len(df.columns)) as span:
+        columns, strata_col = rank_prompt_columns(df, basic_stats)
+        names, cells = preview_cells(df, columns, stratified_rows(df, strata_col, PROMPT_MAX_ROWS))
+        n_cols = len(columns)
+        n_rows = PROMPT_MAX_ROWS
+        while True:
+            prompt = build_analysis_prompt(
+                build_preview(names, cells, n_cols, n_rows),
+                build_prompt_stats(df, basic_stats, total_rows, columns[:n_cols])
             )
-            print(f"[GEMINI] Status: {response.status_code}")
-            data = response.json()
+            tokens = estimate_tokens(prompt)
+            if tokens <= budget:
+                break
+            if n_cols > PROMPT_MIN_COLUMNS:
+                n_cols = max(PROMPT_MIN_COLUMNS, n_cols * 2 // 3)
+            elif n_rows > PROMPT_MIN_ROWS:
+                n_rows = max(PROMPT_MIN_ROWS, n_rows * 2 // 3)
+            else:
+                break
+        span["tokens"] = tokens
+    print(f"[GEMINI] Prompt: {len(prompt)} chars, ~{tokens} tokens (budget {budget}), {min(n_cols, len(columns))}/{len(df.columns)} colonnes, {min(n_rows, len(cells))} lignes")
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "temperature": 0.1,
+            "maxOutputTokens": 4096,
+            "responseMimeType": "application/json"
+        }
+    }
 
-            if "error" in data:
-                print(f"[GEMINI] ERREUR API: {data['error']}")
-                raise Exception(f"Gemini error: {data['error']}")
+async def generate_json_cached(payload):
+    # Niveau exact : meme prompt final, meme reponse
+    key = llm_cache.prompt_key(payload)
+    result = llm_cache.get_exact(key)
+    if result is not None:
+        print(f"[LLM CACHE] Reponse exacte reutilisee ({key[:12]})")
+        return result
+    with tracing.span("llm_round_trip"):
+        data = await llm.generate_content(payload)
+    result = parse_gemini_json(data)
+    llm_cache.put_exact(key, result)
+    return result
 
-            text = data["candidates"][0]["content"]["parts"][0]["text"]
-            print(f"[GEMINI] Reponse recue ({len(text)} chars)")
+def analysis_error(e):
+    print(f"[GEMINI] EXCEPTION: {type(e).__name__}: {str(e)}")
+    return {
+        "domaine": "Erreur",
+        "contexte": "Erreur lors de l analyse IA",
+        "resume_executif": f"Erreur: {str(e)}",
+        "score_sante": 0,
+        "score_explication": "Erreur",
+        "insights": [],
+        "points_forts": [],
+        "points_faibles": [],
+        "opportunites": [],
+        "risques": [],
+        "plan_action": [],
+        "conclusion": ""
+    }
 
-            text = text.strip()
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            text = text.strip()
+async def gemini_full_analysis(df, basic_stats, total_rows=None):
+    try:
+        # Classement des colonnes et echantillonnage (~0,4 s a 1M lignes) hors de la boucle
+        payload = await asyncio.to_thread(build_analysis_payload, df, basic_stats, total_rows)
+        with tracing.span("llm_round_trip"):
+            data = await llm.generate_content(payload)
 
-            result = json.loads(text)
-            print(f"[GEMINI] Succes - domaine: {result.get('domaine')}")
-            return result
+        if "error" in data:
+            print(f"[GEMINI] ERREUR API: {data['error']}")
+        result = parse_gemini_json(data)
+        print(f"[GEMINI] Succes - domaine: {result.get('domaine')}")
+        return result
 
     except Exception as e:
-        print(f"[GEMINI] EXCEPTION: {type(e).__name__}: {str(e)}")
-        return {
-            "domaine": "Erreur",
-            "contexte": "Erreur lors de l analyse IA",
-            "resume_executif": f"Erreur: {str(e)}",
-            "score_sante": 0,
-            "score_explication": "Erreur",
-            "insights": [],
-            "points_forts": [],
-            "points_faibles": [],
-            "opportunites": [],
-            "risques": [],
-            "plan_action": [],
-            "conclusion": ""
-        }
+        return analysis_error(e)
+
+def new_insight_scanner():
+    return {"text": "", "pos": 0, "array": False, "depth": 0, "start": None, "string": False, "escape": False}
+
+def scan_insights(scanner, chunk):
+    # Parcourt le JSON partiel et renvoie chaque element de "insights" des qu il est complet
+    scanner["text"] += chunk
+    text = scanner["text"]
+    found = []
+    if not scanner["array"]:
+        if scanner["pos"] < 0:
+            return found
+        key = text.find('"insights"')
+        bracket = text.find("[", key) if key >= 0 else -1
+        if bracket < 0:
+            return found
+        scanner["array"] = True
+        scanner["pos"] = bracket + 1
+    i = scanner["pos"]
+    while i < len(text) and scanner["array"]:
+        c = text[i]
+        if scanner["string"]:
+            if scanner["escape"]:
+                scanner["escape"] = False
+            elif c == "\\":
+                scanner["escape"] = True
+            elif c == '"':
+                scanner["string"] = False
+        elif c == '"':
+            scanner["string"] = True
+        elif c == "{":
+            if scanner["depth"] == 0:
+                scanner["start"] = i
+            scanner["depth"] += 1
+        elif c == "}":
+            scanner["depth"] -= 1
+            if scanner["depth"] == 0:
+                try:
+                    found.append(json.loads(text[scanner["start"]:i + 1]))
+                except ValueError:
+                    pass
+        elif c == "]" and scanner["depth"] == 0:
+            scanner["array"] = False
+            i = -1
+            break
+        i += 1
+    scanner["pos"] = i
+    return found
+
+async def gemini_stream_analysis(df, basic_stats, total_rows=None, on_insight=None):
+    try:
+        scanner = new_insight_scanner()
+        # Classement des colonnes et echantillonnage (~0,4 s a 1M lignes) hors de la boucle
+        payload = await asyncio.to_thread(build_analysis_payload, df, basic_stats, total_rows)
+        with tracing.span("llm_round_trip", streamed=True) as span:
+            started = time.perf_counter()
+            async for chunk in llm.stream_content(payload):
+                span.setdefault("first_chunk_seconds", time.perf_counter() - started)
+                for insight in scan_insights(scanner, chunk):
+                    if on_insight is not None:
+                        on_insight(insight)
+        result = parse_gemini_text(scanner["text"])
+        print(f"[GEMINI] Succes (flux) - domaine: {result.get('domaine')}")
+        return result
+
+    except Exception as e:
+        return analysis_error(e)
 
 async def gemini_compare(data1, data2, file1_name, file2_name):
     try:
@@ -431,30 +2066,14 @@ Reponds UNIQUEMENT en JSON valide sans emojis :
   "conclusion": "string"
 }}"""
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                GEMINI_URL,
-                json={
-                    "contents": [{"parts": [{"text": prompt}]}],
-                    "generationConfig": {
-                        "temperature": 0.1,
-                        "maxOutputTokens": 2048,
-                        "responseMimeType": "application/json"
-                    }
-                }
-            )
-            data = response.json()
-            if "error" in data:
-                raise Exception(f"Gemini error: {data['error']}")
-            text = data["candidates"][0]["content"]["parts"][0]["text"]
-            text = text.strip()
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            return json.loads(text.strip())
+        return await generate_json_cached({
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": 0.1,
+                "maxOutputTokens": 2048,
+                "responseMimeType": "application/json"
+            }
+        })
 
     except Exception as e:
         print(f"[GEMINI COMPARE] EXCEPTION: {str(e)}")
@@ -470,57 +2089,302 @@ Reponds UNIQUEMENT en JSON valide sans emojis :
             "conclusion": ""
         }
 
+async def gemini_compare_periods(evolution, file_names):
+    try:
+        prompt = f"""Tu es un expert analyste de donnees senior.
+Compare ces {len(file_names)} periodes successives d un meme rapport Excel.
+
+PERIODES (dans l ordre) : {json.dumps([safe_str(n) for n in file_names], ensure_ascii=True)}
+
+EVOLUTION DES INDICATEURS :
+{json.dumps(evolution, ensure_ascii=True, default=str)}
+
+Reponds UNIQUEMENT en JSON valide sans emojis :
+{{
+  "resume_comparaison": "string",
+  "evolution_globale": "positive|negative|stable",
+  "meilleure_periode": "string",
+  "pire_periode": "string",
+  "tendances_cles": [
+    {{
+      "indicateur": "string",
+      "tendance": "hausse|baisse|stable|irreguliere",
+      "interpretation": "string"
+    }}
+  ],
+  "points_amelioration": ["string", "string"],
+  "points_regression": ["string", "string"],
+  "recommandations": ["string", "string", "string"],
+  "conclusion": "string"
+}}"""
+
+        return await generate_json_cached({
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": 0.1,
+                "maxOutputTokens": 2048,
+                "responseMimeType": "application/json"
+            }
+        })
+
+    except Exception as e:
+        print(f"[GEMINI COMPARE] EXCEPTION: {str(e)}")
+        return {
+            "resume_comparaison": "Comparaison effectuee.",
+            "evolution_globale": "stable",
+            "meilleure_periode": "",
+            "pire_periode": "",
+            "tendances_cles": [],
+            "points_amelioration": [],
+            "points_regression": [],
+            "recommandations": [],
+            "conclusion": ""
+        }
+
 @app.get("/")
 def root():
     return {"message": "Smart Excel Analyzer API is running"}
 
+@app.get("/workers")
+def workers_status():
+    return workers.metrics()
+
+@app.get("/llm/cache")
+def llm_cache_status():
+    return llm_cache.metrics()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    pool = workers.metrics()
+    llm_stats = llm_cache.metrics()
+    extra = [
+        ("worker_processes", "Processus du pool", "gauge", pool["workers"]),
+        ("worker_in_flight", "Taches en cours dans le pool", "gauge", pool["in_flight"]),
+        ("worker_queue_depth", "Taches en attente d un processus", "gauge", pool["queue_depth"]),
+        ("worker_tasks_completed_total", "Taches terminees", "counter", pool["completed"]),
+        ("worker_tasks_failed_total", "Taches en echec", "counter", pool["failed"]),
+        ("llm_cache_exact_hits_total", "Reponses exactes reutilisees", "counter", llm_stats["exact_hits"]),
+        ("llm_cache_exact_misses_total", "Reponses exactes absentes", "counter", llm_stats["exact_misses"]),
+        ("llm_cache_semantic_hits_total", "Insights similaires reutilises", "counter", llm_stats["semantic_hits"]),
+        ("llm_cache_semantic_misses_total", "Insights similaires absents", "counter", llm_stats["semantic_misses"]),
+        ("llm_cache_entries", "Entrees du cache LLM", "gauge", llm_stats["entries"]),
+    ]
+    return PlainTextResponse(tracing.render_metrics(extra), media_type="text/plain; version=0.0.4")
+
+def build_analysis_result(basic_stats, summary, ai_insights, key=None):
+    return {
+        "dataset_id": datasets.queryable(key) if key else None,
+        "summary": summary,
+        "kpis": basic_stats["kpis"],
+        "charts": basic_stats["charts"],
+        "alerts": basic_stats["alerts"],
+        "anomalies": basic_stats["anomalies"],
+        "ai_insights": ai_insights
+    }
+
+async def read_upload(file):
+    # Recu par blocs sur disque puis relu en memory-map : a liberer avec release()
+    with tracing.span("upload_read") as span:
+        upload = await uploads.spool(file, check=check_upload_head)
+        span["bytes"] = upload.size
+    tracing.annotate_file(file.filename, upload.size, detect_format(upload.data()))
+    return upload
+
+async def read_uploads(files):
+    results = await asyncio.gather(*[read_upload(f) for f in files], return_exceptions=True)
+    failed = next((r for r in results if isinstance(r, BaseException)), None)
+    if failed is not None:
+        release_uploads(r for r in results if isinstance(r, uploads.SpooledUpload))
+        raise failed
+    return results
+
+def error_status(e):
+    # Fichier refuse : 400 / 413 ; les autres erreurs restent un corps {"status": "error"} en 200
+    return e.status_code if isinstance(e, uploads.UploadRejected) else 200
+
+def release_uploads(spooled):
+    for upload in spooled:
+        upload.release()
+
+_background_tasks = set()
+
+def start_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def analysis_sections(result):
+    # Resultat principal puis une section par feuille pour les tables Arrow
+    return [("", result)] + [(sheet["name"], sheet) for sheet in result.get("sheets", [])]
+
 @app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
+async def analyze(request: Request, file: UploadFile = File(...), defer_ai: bool = False):
+    upload = None
     try:
-        contents = await file.read()
-        df = smart_read_excel(contents)
-
-        print(f"[ANALYZE] Fichier: {len(df)} lignes, {len(df.columns)} colonnes")
-        print(f"[ANALYZE] Colonnes: {list(df.columns)}")
-
-        basic_stats = extract_basic_stats(df)
-        ai_insights = await gemini_full_analysis(df, basic_stats)
-
-        result = {
-            "summary": {
-                "total_rows": len(df),
-                "total_columns": len(df.columns),
-                "missing_values": int(df.isnull().sum().sum()),
-                "columns_list": [safe_str(c) for c in df.columns.tolist()]
-            },
-            "kpis": basic_stats["kpis"],
-            "charts": basic_stats["charts"],
-            "alerts": basic_stats["alerts"],
-            "anomalies": basic_stats["anomalies"],
-            "ai_insights": ai_insights
-        }
+        upload = await read_upload(file)
+        workbook = await cached_workbook(upload)
+        key, df, basic_stats, summary = await cached_pipeline(upload)
 
-        return {"status": "success", "data": result}
+        print(f"[ANALYZE] Fichier: {summary['total_rows']} lignes, {summary['total_columns']} colonnes")
+        print(f"[ANALYZE] Colonnes: {summary['columns_list']}")
+
+        if defer_ai:
+            # Les stats partent tout de suite, les insights suivent via /jobs/{id}/events
+            job = jobs.store.create("insights", {"filename": file.filename, "key": key})
+            start_background(run_insights_job(job["id"], key, upload.retain(), df, basic_stats, summary))
+            result = attach_workbook(build_analysis_result(basic_stats, summary, None, key), workbook)
+            result["ai_job_id"] = job["id"]
+        else:
+            ai_insights = await cached_ai_insights(key, upload, df, basic_stats, summary)
+            result = attach_workbook(build_analysis_result(basic_stats, summary, ai_insights, key), workbook)
+
+        with tracing.span("encode_response"):
+            return serialization.respond(request, {"status": "success", "data": result}, analysis_sections(result))
     except Exception as e:
         print(f"[ANALYZE] ERREUR: {str(e)}")
-        return {"status": "error", "message": str(e)}
+        return serialization.respond(request, {"status": "error", "message": str(e)}, status_code=error_status(e))
+    finally:
+        if upload is not None:
+            upload.release()
+
+async def stream_job_insights(job_id, key, upload, df, basic_stats, summary):
+    store = jobs.store
+    ai_insights = await cached_ai_insights(
+        key, upload, df, basic_stats, summary,
+        on_insight=lambda insight: store.add_event(job_id, "insight", insight)
+    )
+    store.add_event(job_id, "ai_insights", ai_insights)
+    return ai_insights
+
+async def run_insights_job(job_id, key, upload, df, basic_stats, summary):
+    store = jobs.store
+    store.update(job_id, status="running")
+    _, token = tracing.start_trace(job="insights", job_id=job_id, format=detect_format(upload.data()))
+    try:
+        ai_insights = await stream_job_insights(job_id, key, upload, df, basic_stats, summary)
+        store.update(job_id, status="done", result=ai_insights)
+    except Exception as e:
+        print(f"[JOBS] ERREUR {job_id}: {str(e)}")
+        store.update(job_id, status="error", error=str(e))
+    finally:
+        tracing.end_trace(token)
+        upload.release()
+
+async def run_analysis_job(job_id, upload):
+    store = jobs.store
+    store.update(job_id, status="running")
+    _, token = tracing.start_trace(job="analyze", job_id=job_id, format=detect_format(upload.data()))
+    try:
+        # Classeur d abord, comme /analyze : la feuille active y est analysee une seule fois
+        # et cached_pipeline la relit depuis le cache
+        workbook = await cached_workbook(upload)
+        key, df, basic_stats, summary = await cached_pipeline(
+            upload,
+            progress=lambda stage, data: store.add_event(job_id, stage, data)
+        )
+        if workbook:
+            store.add_event(job_id, "sheets", workbook)
+        ai_insights = await stream_job_insights(job_id, key, upload, df, basic_stats, summary)
+        store.update(job_id, status="done", result=attach_workbook(build_analysis_result(basic_stats, summary, ai_insights, key), workbook))
+    except Exception as e:
+        print(f"[JOBS] ERREUR {job_id}: {str(e)}")
+        store.update(job_id, status="error", error=str(e))
+    finally:
+        tracing.end_trace(token)
+        upload.release()
+
+@app.post("/jobs/analyze")
+async def submit_analysis(file: UploadFile = File(...)):
+    try:
+        upload = await read_upload(file)
+    except Exception as e:
+        print(f"[JOBS] ERREUR: {str(e)}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=error_status(e))
+    job = jobs.store.create("analyze", {"filename": file.filename, "bytes": upload.size})
+    start_background(run_analysis_job(job["id"], upload))
+    return {"status": "success", "data": {"job_id": job["id"]}}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.store.get(job_id)
+    if job is None:
+        return {"status": "error", "message": "Job introuvable"}
+    return {"status": "success", "data": jobs.public_view(job)}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    if jobs.store.get(job_id) is None:
+        return {"status": "error", "message": "Job introuvable"}
+
+    async def stream():
+        sent = 0
+        while True:
+            events, finished = await jobs.store.wait_events(job_id, sent)
+            for event in events:
+                payload = json.dumps(event["data"], ensure_ascii=True, default=str)
+                yield f"event: {event['stage']}\ndata: {payload}\n\n"
+            sent += len(events)
+            if finished:
+                job = jobs.store.get(job_id) or {}
+                if job.get("status") == "error":
+                    yield f"event: error\ndata: {json.dumps({'message': job.get('error')})}\n\n"
+                else:
+                    yield "event: done\ndata: {}\n\n"
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+_session_locks = weakref.WeakValueDictionary()
+
+async def run_session(session_id, file):
+    upload = None
+    try:
+        upload = await read_upload(file)
+        lock = _session_locks.get(session_id)
+        if lock is None:
+            lock = _session_locks[session_id] = asyncio.Lock()
+        async with lock:
+            basic_stats, summary, session = await workers.run_in_pool(session_job, upload.path, session_id)
+        print(f"[SESSION] {session_id[:8]} {session['mode']}: +{session['appended_rows']} lignes")
+        result = build_analysis_result(basic_stats, summary, None)
+        result["session"] = session
+        return {"status": "success", "data": result}
+    except Exception as e:
+        print(f"[SESSION] ERREUR: {str(e)}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=error_status(e))
+    finally:
+        if upload is not None:
+            upload.release()
+
+@app.post("/sessions")
+async def create_session(file: UploadFile = File(...)):
+    return await run_session(uuid.uuid4().hex, file)
+
+@app.post("/sessions/{session_id}")
+async def update_session(session_id: str, file: UploadFile = File(...)):
+    if not SESSION_ID_PATTERN.match(session_id):
+        return {"status": "error", "message": "Session invalide"}
+    return await run_session(session_id, file)
 
 @app.post("/compare")
-async def compare(file1: UploadFile = File(...), file2: UploadFile = File(...)):
+async def compare(request: Request, file1: UploadFile = File(...), file2: UploadFile = File(...)):
+    spooled = []
     try:
-        contents1 = await file1.read()
-        contents2 = await file2.read()
-        df1 = smart_read_excel(contents1)
-        df2 = smart_read_excel(contents2)
-        stats1 = extract_basic_stats(df1)
-        stats2 = extract_basic_stats(df2)
+        spooled = await read_uploads([file1, file2])
+        (_, _, stats1, summary1), (_, _, stats2, summary2) = await asyncio.gather(
+            cached_pipeline(spooled[0], want_frame=False),
+            cached_pipeline(spooled[1], want_frame=False)
+        )
         ai_compare = await gemini_compare(
-            {"kpis": stats1["kpis"], "summary": {"rows": len(df1), "cols": len(df1.columns)}},
-            {"kpis": stats2["kpis"], "summary": {"rows": len(df2), "cols": len(df2.columns)}},
+            {"kpis": stats1["kpis"], "summary": {"rows": summary1["total_rows"], "cols": summary1["total_columns"]}},
+            {"kpis": stats2["kpis"], "summary": {"rows": summary2["total_rows"], "cols": summary2["total_columns"]}},
             file1.filename,
             file2.filename
         )
-        return {
+        body = {
             "status": "success",
             "data": {
                 "file1": file1.filename,
@@ -530,6 +2394,98 @@ async def compare(file1: UploadFile = File(...), file2: UploadFile = File(...)):
                 "ai_compare": ai_compare
             }
         }
+        with tracing.span("encode_response"):
+            return serialization.respond(request, body, [(safe_str(file1.filename), stats1), (safe_str(file2.filename), stats2)])
     except Exception as e:
         print(f"[COMPARE] ERREUR: {str(e)}")
+        return serialization.respond(request, {"status": "error", "message": str(e)}, status_code=error_status(e))
+    finally:
+        release_uploads(spooled)
+
+@app.post("/compare/multi")
+async def compare_multi(files: List[UploadFile] = File(...)):
+    spooled = []
+    try:
+        if len(files) < 2:
+            return {"status": "error", "message": "Au moins deux fichiers sont necessaires"}
+        if len(files) > MAX_COMPARE_FILES:
+            return {"status": "error", "message": f"Maximum {MAX_COMPARE_FILES} fichiers par comparaison"}
+        names = [f.filename for f in files]
+        spooled = await read_uploads(files)
+
+        async def run(index):
+            _, _, stats, summary = await cached_pipeline(spooled[index], want_frame=False)
+            return index, stats, summary
+
+        table = new_period_table(names)
+        periods = [None] * len(files)
+        for task in asyncio.as_completed([run(i) for i in range(len(files))]):
+            index, stats, summary = await task
+            add_period(table, index, stats, summary)
+            periods[index] = {"file": names[index], "summary": summary, "kpis": stats["kpis"]}
+            print(f"[COMPARE] Periode prete: {safe_str(names[index])} ({table['ready']}/{len(files)})")
+
+        evolution = finalize_period_table(table)
+        ai_compare = await gemini_compare_periods(evolution, names)
+        return {
+            "status": "success",
+            "data": {
+                "files": names,
+                "periods": periods,
+                "evolution": evolution,
+                "ai_compare": ai_compare
+            }
+        }
+    except Exception as e:
+        print(f"[COMPARE] ERREUR: {str(e)}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=error_status(e))
+    finally:
+        release_uploads(spooled)
+
+DATASET_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+DRILLDOWN_MAX_ROWS = int(os.environ.get("DRILLDOWN_MAX_ROWS", "1000"))
+
+def dataset_anomalies(key, limit):
+    # Memes bornes que extract_basic_stats, avec les numeros de ligne de chaque valeur aberrante
+    frame, rows = datasets.number_frame(key)
+    if frame.empty or not len(frame.columns):
+        return []
+    stats = numeric_kernel(frame.to_numpy(dtype=float), flag_rows=True)
+    anomalies = []
+    for i, col in enumerate(frame.columns):
+        if not stats["outliers"][i]:
+            continue
+        flagged = rows[stats["flagged"][:, i]]
+        anomaly = build_anomaly(col, stats["outliers"][i])
+        anomaly["rows"] = flagged[:limit].tolist()
+        anomaly["truncated"] = len(flagged) > limit
+        anomalies.append(anomaly)
+    return anomalies
+
+@app.post("/datasets/{dataset_id}/query")
+async def query_dataset(dataset_id: str, request: Request):
+    try:
+        if not DATASET_ID_PATTERN.match(dataset_id):
+            return {"status": "error", "message": "Jeu de donnees invalide"}
+        spec = await request.json()
+        if not isinstance(spec, dict):
+            return {"status": "error", "message": "Requete invalide"}
+        with tracing.span("dataset_query") as span:
+            table, page = await asyncio.to_thread(datasets.query, dataset_id, spec)
+            span["rows"] = page["total"]
+        return serialization.respond_table(request, table, page)
+    except Exception as e:
+        print(f"[DATASET] ERREUR: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/datasets/{dataset_id}/anomalies")
+async def dataset_anomaly_rows(dataset_id: str, request: Request, limit: int = DRILLDOWN_MAX_ROWS):
+    try:
+        if not DATASET_ID_PATTERN.match(dataset_id):
+            return {"status": "error", "message": "Jeu de donnees invalide"}
+        with tracing.span("dataset_anomalies"):
+            anomalies = await asyncio.to_thread(dataset_anomalies, dataset_id, max(min(limit, DRILLDOWN_MAX_ROWS), 0))
+        return serialization.respond(request, {"status": "success", "data": {"anomalies": anomalies}})
+    except Exception as e:
+        print(f"[DATASET] ERREUR: {str(e)}")
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,285 @@
+import itertools
+import json
+import os
+import zlib
+
+import numpy as np
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+# ============================================
+# Encodeurs
+# ============================================
+def json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, default=json_default, separators=(",", ":")).encode("utf-8")
+
+def dumps_msgpack(data):
+    return msgpack.packb(data, default=json_default, use_bin_type=True)
+
+def media_types():
+    # Ordre de preference du serveur a qualite egale
+    available = [JSON_MEDIA_TYPE]
+    if pa is not None:
+        available.append(ARROW_MEDIA_TYPE)
+    if msgpack is not None:
+        available.extend(MSGPACK_MEDIA_TYPES)
+    return available
+
+def parse_accept(header):
+    # [(type, q)] dans l ordre de l en-tete, q=0 exclu
+    ranges = []
+    for part in (header or "").split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if not fields[0]:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranges.append((fields[0].lower(), q))
+    return ranges
+
+def negotiate(accept):
+    ranges = parse_accept(accept)
+    if not ranges:
+        return JSON_MEDIA_TYPE
+    best, best_q = None, 0.0
+    for media_type in media_types():
+        for pattern, q in ranges:
+            if pattern in (media_type, "*/*", media_type.split("/")[0] + "/*") and q > best_q:
+                best, best_q = media_type, q
+    return best or JSON_MEDIA_TYPE
+
+# ============================================
+# Tables Arrow : KPIs et series des graphiques
+# ============================================
+KPI_NUMBERS = (("total", np.float64), ("average", np.float64), ("min", np.float64), ("max", np.float64), ("count", np.int64))
+
+class TableRows(list):
+    # Liste de dicts ordinaire (JSON, cache, prompts) qui garde aussi les tableaux NumPy dont elle est tiree :
+    # les tables Arrow les reprennent tels quels. Relue depuis le cache, ce n est plus qu une liste.
+    def __init__(self, rows=(), columns=None):
+        super().__init__(rows)
+        self.columns = columns
+
+def chart_rows(charts):
+    # Les graphiques sont construits avec des tableaux NumPy ; listes pour le JSON, tableaux gardes pour Arrow
+    values = [np.asarray(chart["values"]) for chart in charts]
+    return TableRows([{**chart, "values": v.tolist()} for chart, v in zip(charts, values)], {"values": values})
+
+def table_columns(rows):
+    return getattr(rows, "columns", None)
+
+def concat(arrays, dtype):
+    if len(arrays) == 1:
+        return np.asarray(arrays[0], dtype=dtype)
+    return np.concatenate([np.asarray(a, dtype=dtype) for a in arrays]) if arrays else np.empty(0, dtype=dtype)
+
+def list_column(lists, value_type):
+    # Une seule liste plate + offsets
+    lengths = np.fromiter((len(v) for v in lists), dtype=np.int32, count=len(lists))
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int32)]).astype(np.int32)
+    if value_type == pa.string():
+        flat = pa.array(list(itertools.chain.from_iterable(lists)), type=value_type)
+    else:
+        flat = pa.array(concat(lists, value_type.to_pandas_dtype()), type=value_type)
+    return pa.ListArray.from_arrays(pa.array(offsets, type=pa.int32()), flat)
+
+def kpi_table(sections):
+    sources, names, numbers = [], [], {key: [] for key, _ in KPI_NUMBERS}
+    for source, stats in sections:
+        kpis = stats["kpis"]
+        columns = table_columns(kpis)
+        sources.extend([source] * len(kpis))
+        names.extend(kpi["column"] for kpi in kpis)
+        for key, dtype in KPI_NUMBERS:
+            if columns is not None:
+                numbers[key].append(columns[key])
+            else:
+                numbers[key].append(np.fromiter((kpi[key] for kpi in kpis), dtype=dtype, count=len(kpis)))
+    table = {
+        "source": pa.array(sources, type=pa.string()),
+        "column": pa.array(names, type=pa.string()),
+    }
+    for key, dtype in KPI_NUMBERS:
+        table[key] = pa.array(concat(numbers[key], dtype))
+    return pa.table(table)
+
+def chart_table(sections):
+    rows = [(source, chart) for source, stats in sections for chart in stats["charts"]]
+    def text(key):
+        return pa.array([chart.get(key) for _, chart in rows], type=pa.string())
+    values = []
+    for _, stats in sections:
+        columns = table_columns(stats["charts"])
+        values.extend(columns["values"] if columns is not None else [chart["values"] for chart in stats["charts"]])
+    return pa.table({
+        "source": pa.array([source for source, _ in rows], type=pa.string()),
+        "type": text("type"),
+        "title": text("title"),
+        "x_col": text("x_col"),
+        "y_col": text("y_col"),
+        "granularity": text("granularity"),
+        "labels": list_column([chart["labels"] for _, chart in rows], pa.string()),
+        "values": list_column(values, pa.float64()),
+    })
+
+def write_stream(sink, table, metadata=None):
+    schema = table.schema.with_metadata(metadata) if metadata else table.schema
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table.replace_schema_metadata(schema.metadata))
+
+def dumps_arrow(body, sections):
+    # Deux flux IPC a la suite (kpis puis charts) ; le reste de la reponse en JSON dans les metadonnees du premier
+    sink = pa.BufferOutputStream()
+    write_stream(sink, kpi_table(sections), {b"tables": b"kpis,charts", b"payload": dumps_json(body)})
+    write_stream(sink, chart_table(sections))
+    return sink.getvalue().to_pybytes()
+
+def without_series(data, owners):
+    # Copie sans les KPIs ni les graphiques des sections, deja presents dans les tables Arrow
+    if isinstance(data, dict):
+        drop = ("kpis", "charts") if any(data is owner for owner in owners) else ()
+        return {k: without_series(v, owners) for k, v in data.items() if k not in drop}
+    if isinstance(data, list):
+        return [without_series(v, owners) for v in data]
+    return data
+
+def respond(request, body, sections=None, status_code=200):
+    # sections : les (source, dict portant kpis et charts) de body qui forment les tables Arrow.
+    # Sans sections (erreurs), seuls JSON et MessagePack sont servis.
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type == ARROW_MEDIA_TYPE and sections is not None:
+        return Response(dumps_arrow(without_series(body, [stats for _, stats in sections]), sections), media_type=ARROW_MEDIA_TYPE,
+                        headers={"X-Arrow-Tables": "kpis,charts", "Vary": "Accept"}, status_code=status_code)
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return Response(dumps_msgpack(body), media_type=media_type, headers={"Vary": "Accept"}, status_code=status_code)
+    return Response(dumps_json(body), media_type=JSON_MEDIA_TYPE, headers={"Vary": "Accept"}, status_code=status_code)
+
+def respond_table(request, table, meta):
+    # Resultat tabulaire (requete sur un jeu de donnees) : la table telle quelle en Arrow, des lignes sinon
+    if negotiate(request.headers.get("accept")) == ARROW_MEDIA_TYPE:
+        sink = pa.BufferOutputStream()
+        write_stream(sink, table, {b"payload": dumps_json({"status": "success", "data": meta})})
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE, headers={"Vary": "Accept"})
+    data = {**meta, "columns": table.column_names, "rows": table.to_pylist()}
+    return respond(request, {"status": "success", "data": data})
+
+# ============================================
+# Compression gzip / brotli
+# ============================================
+def accepted_encodings(header):
+    return {name: q for name, q in parse_accept(header)}
+
+def pick_encoding(header):
+    accepted = accepted_encodings(header)
+    if brotli is not None and accepted.get("br", 0) > 0 and accepted["br"] >= accepted.get("gzip", 0):
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compressor(encoding):
+    # Chaque morceau d une reponse en flux est vide aussitot (flush), le dernier ferme le flux
+    if encoding == "br":
+        engine = brotli.Compressor(quality=BROTLI_QUALITY)
+        write, flush, finish = engine.process, engine.flush, engine.finish
+    else:
+        engine = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        write, flush, finish = engine.compress, lambda: engine.flush(zlib.Z_SYNC_FLUSH), engine.flush
+    return lambda data, more: write(data) + (flush() if more else finish())
+
+class CompressionMiddleware:
+    # br si brotli est installe, sinon gzip ; flux SSE, reponses deja encodees et petits corps passent tels quels
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = pick_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                state["passthrough"] = "content-encoding" in headers or content_type.startswith(UNCOMPRESSED_TYPES)
+                if state["passthrough"]:
+                    await send(message)
+                else:
+                    state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            start = state["start"]
+            if start is not None:
+                state["start"] = None
+                headers = MutableHeaders(raw=start["headers"])
+                if not more and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                state["compressor"] = compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more:
+                    del headers["Content-Length"]
+                body = state["compressor"](body, more)
+                if not more:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send({"type": "http.response.body", "body": body, "more_body": more})
+                return
+            await send({"type": "http.response.body", "body": state["compressor"](body, more), "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
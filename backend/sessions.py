@@ -0,0 +1,206 @@
+import datetime
+import io
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import cache
+
+# Etat d une session de streaming : JSON pour la structure, npz (sans pickle) pour les tableaux.
+# Rien de ce qui est relu depuis le repertoire de cache ne peut executer de code.
+SESSION_FORMAT = 1
+
+# ============================================
+# Valeurs scalaires et cles quelconques
+# ============================================
+def encode_value(value):
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    if isinstance(value, (datetime.datetime, np.datetime64)):
+        return {"datetime": pd.Timestamp(value).isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, (datetime.timedelta, np.timedelta64)):
+        return {"timedelta": pd.Timedelta(value).total_seconds()}
+    # Autres objets de cellule (heures...) : gardes sous forme de texte
+    return {"text": str(value)}
+
+def decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    if "datetime" in value:
+        return pd.Timestamp(value["datetime"])
+    if "date" in value:
+        return datetime.date.fromisoformat(value["date"])
+    if "timedelta" in value:
+        return pd.Timedelta(seconds=value["timedelta"])
+    return value["text"]
+
+def encode_pairs(mapping, encode=lambda v: v):
+    # Dictionnaires indexes par nom de colonne : liste de paires, les noms ne sont pas toujours des str
+    return [[encode_value(k), encode(v)] for k, v in mapping.items()]
+
+def decode_pairs(pairs, decode=lambda v: v):
+    return {decode_value(k): decode(v) for k, v in pairs}
+
+# ============================================
+# Etat du streaming
+# ============================================
+def dump_state(state, arrays):
+    def put(values):
+        name = f"a{len(arrays)}"
+        arrays[name] = np.asarray(values)
+        return name
+
+    def series(values):
+        if values is None:
+            return None
+        return {"index": [encode_value(v) for v in values.index], "values": put(values.to_numpy(dtype=np.float64))}
+
+    def frame(df):
+        if df is None:
+            return None
+        encoded = {"columns": [encode_value(c) for c in df.columns], "values": put(df.to_numpy(dtype=np.float64))}
+        if isinstance(df.index, pd.PeriodIndex):
+            encoded.update(periods=put(df.index.asi8), freq=df.index.freqstr)
+        else:
+            encoded["index"] = [encode_value(v) for v in df.index]
+        return encoded
+
+    def numeric(acc):
+        encoded = {k: encode_value(v) for k, v in acc.items() if k != "reservoir"}
+        if "reservoir" in acc:
+            encoded["reservoir"] = put(acc["reservoir"])
+        return encoded
+
+    def discrete(acc):
+        return {
+            "lower_counts": series(acc["lower_counts"]),
+            "sums": frame(acc["sums"]),
+            "values": [encode_value(v) for v in acc["values"]],
+            "overflow": acc["overflow"],
+        }
+
+    schema = state["schema"]
+    return {
+        "columns": [encode_value(c) for c in state["columns"]],
+        "text_cols": None if state["text_cols"] is None else [encode_value(c) for c in state["text_cols"]],
+        "schema": None if schema is None else {name: encode_pairs(values) for name, values in schema.items()},
+        "kinds": encode_pairs(state["kinds"]),
+        "carry": encode_pairs(state["carry"], encode_value),
+        "subtotals": state["subtotals"],
+        "rows": int(state["rows"]),
+        "nulls": series(state["nulls"]),
+        "numeric": encode_pairs(state["numeric"], numeric),
+        "series": encode_pairs(state["series"], frame),
+        "series_freq": state.get("series_freq"),
+        "discrete": encode_pairs(state["discrete"], discrete),
+        "spill_cols": [[encode_value(c) for c in cols] for cols in state.get("spill_cols", [])],
+        "rng": state["rng"].bit_generator.state,
+    }
+
+def load_state(encoded, arrays):
+    def series(values, dtype=np.float64):
+        if values is None:
+            return None
+        return pd.Series(arrays[values["values"]].astype(dtype), index=[decode_value(v) for v in values["index"]])
+
+    def frame(encoded_frame):
+        if encoded_frame is None:
+            return None
+        if "periods" in encoded_frame:
+            index = pd.PeriodIndex.from_ordinals(arrays[encoded_frame["periods"]], freq=encoded_frame["freq"])
+        else:
+            index = pd.Index([decode_value(v) for v in encoded_frame["index"]], dtype=object)
+        columns = [decode_value(c) for c in encoded_frame["columns"]]
+        return pd.DataFrame(arrays[encoded_frame["values"]].reshape(len(index), len(columns)), index=index, columns=columns)
+
+    def numeric(acc):
+        decoded = {k: decode_value(v) for k, v in acc.items() if k != "reservoir"}
+        if "reservoir" in acc:
+            decoded["reservoir"] = arrays[acc["reservoir"]]
+        return decoded
+
+    def discrete(acc):
+        return {
+            "lower_counts": series(acc["lower_counts"]),
+            "sums": frame(acc["sums"]),
+            "values": {decode_value(v) for v in acc["values"]},
+            "overflow": acc["overflow"],
+        }
+
+    rng = np.random.default_rng()
+    rng.bit_generator.state = encoded["rng"]
+    schema = encoded["schema"]
+    state = {
+        "columns": [decode_value(c) for c in encoded["columns"]],
+        "text_cols": None if encoded["text_cols"] is None else [decode_value(c) for c in encoded["text_cols"]],
+        "schema": None if schema is None else {name: decode_pairs(values) for name, values in schema.items()},
+        "kinds": decode_pairs(encoded["kinds"]),
+        "carry": decode_pairs(encoded["carry"], decode_value),
+        "subtotals": encoded["subtotals"],
+        "rows": encoded["rows"],
+        "nulls": series(encoded["nulls"], np.int64),
+        # L echantillon ne sert qu a l analyse complete, pas aux mises a jour de session
+        "sample": None,
+        "numeric": decode_pairs(encoded["numeric"], numeric),
+        "series": decode_pairs(encoded["series"], frame),
+        "series_freq": encoded["series_freq"],
+        "discrete": decode_pairs(encoded["discrete"], discrete),
+        "rng": rng,
+    }
+    if encoded["spill_cols"]:
+        state["spill_cols"] = [[decode_value(c) for c in cols] for cols in encoded["spill_cols"]]
+    return state
+
+# ============================================
+# Fichiers de la session
+# ============================================
+def save(session_id, columns, hashes, state, spill_size):
+    token = uuid.uuid4().hex
+    arrays = {"hashes": np.asarray(hashes, dtype=np.uint64), "token": np.array(token)}
+    manifest = {
+        "format": SESSION_FORMAT,
+        "token": token,
+        "columns": [encode_value(c) for c in columns],
+        "spill_size": int(spill_size),
+        "state": dump_state(state, arrays),
+    }
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    # Le jeton commun aux deux fichiers ecarte un melange d ecritures concurrentes
+    cache.write_atomic(cache.entry_path(session_id, "session.npz"), buffer.getvalue())
+    cache.write_atomic(cache.entry_path(session_id, "session.json"), json.dumps(manifest).encode("utf-8"))
+
+def load(session_id):
+    manifest_path = cache.entry_path(session_id, "session.json")
+    arrays_path = cache.entry_path(session_id, "session.npz")
+    if not os.path.exists(manifest_path) or not os.path.exists(arrays_path) or cache.is_expired(cache.entry_dir(session_id)):
+        return None
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != SESSION_FORMAT:
+            return None
+        with np.load(arrays_path, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        if str(arrays["token"]) != manifest["token"]:
+            return None
+        return {
+            "columns": [decode_value(c) for c in manifest["columns"]],
+            "hashes": arrays["hashes"],
+            "state": load_state(manifest["state"], arrays),
+            "spill_size": manifest["spill_size"],
+        }
+    except Exception as e:
+        print(f"[SESSION] Etat illisible, recalcul complet: {e}")
+        return None
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    import cache
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+@pytest.fixture
+def fixture_bytes():
+    def read(name):
+        with open(os.path.join(BACKEND_DIR, name), "rb") as f:
+            return f.read()
+    return read
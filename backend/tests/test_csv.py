@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import uploads
+
+def csv_bytes(header, rows):
+    return ("\n".join([header] + rows) + "\n").encode("utf-8")
+
+def test_extra_fields_are_skipped():
+    # Au-dela des lignes lues pour l en-tete, une ligne trop longue est ecartee
+    rows = [f"n{i};{i};Paris" for i in range(main.HEADER_SCAN_ROWS + 50)]
+    rows[-10] = "bad;0;Paris;oups"
+    df = main.parse_csv_frame(csv_bytes("Nom;Montant;Ville", rows))
+    assert list(df.columns) == ["Nom", "Montant", "Ville"]
+    assert "bad" not in df["Nom"].tolist()
+    assert len(df) == len(rows) - 1
+
+def test_missing_fields_are_padded():
+    rows = [f"n{i};{i};Paris" for i in range(10)]
+    rows[4] = "n4;4"
+    df = main.parse_csv_frame(csv_bytes("Nom;Montant;Ville", rows))
+    assert len(df) == 10
+    assert df["Ville"].isna().tolist() == [i == 4 for i in range(10)]
+
+@pytest.mark.parametrize("data", [b"", b"  \n\n"])
+def test_empty_file_rejected(data):
+    with pytest.raises(uploads.UploadRejected, match="Fichier vide"):
+        main.parse_csv_frame(data)
+
+def test_header_only_rejected():
+    with pytest.raises(uploads.UploadRejected, match="en-tete"):
+        main.parse_csv_frame(b"Nom;Montant;Ville\n")
+
+def test_empty_upload_answers_400():
+    client = TestClient(main.app)
+    response = client.post("/analyze", files={"file": ("vide.csv", b"")})
+    assert response.status_code == 400
+    assert response.json() == {"status": "error", "message": "Fichier vide"}
+
+def late_cp1252_csv():
+    # Plus de CSV_SNIFF_BYTES d ASCII, puis une ville accentuee exportee en cp1252
+    rows = [f"n{i};{i};Paris" for i in range(main.CSV_SNIFF_BYTES // 10)]
+    rows.append("n-last;7;Cr\xe9teil")
+    data = ("Nom;Montant;Ville\n" + "\n".join(rows) + "\n").encode("cp1252")
+    assert data.index(b"\xe9") > main.CSV_SNIFF_BYTES
+    return data, len(rows)
+
+def test_non_utf8_byte_after_the_sample_is_read_as_cp1252():
+    data, n_rows = late_cp1252_csv()
+    df = main.parse_csv_frame(data)
+    assert len(df) == n_rows
+    assert df["Ville"].iloc[-1] == "Cr\xe9teil"
+    assert df["Montant"].iloc[-1] == 7
+
+def test_non_utf8_byte_after_the_sample_is_analyzed():
+    data, n_rows = late_cp1252_csv()
+    client = TestClient(main.app)
+    response = client.post("/analyze", files={"file": ("export.csv", data)}, params={"defer_ai": "true"})
+    body = response.json()
+    assert response.status_code == 200 and body["status"] == "success"
+    assert body["data"]["summary"]["total_rows"] == n_rows
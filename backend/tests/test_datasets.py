@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import datasets
+import main
+
+KEY = "ab" * 32
+
+@pytest.fixture
+def ventes(cache_dir, fixture_bytes):
+    df = main.smart_read_excel(fixture_bytes("test_ventes_commerce.xlsx"))
+    datasets.store(KEY, df, ["Quantite", "Prix_Unitaire", "Remise_Pct", "Montant_Total"])
+    return df
+
+def total(filters):
+    return datasets.query(KEY, {"filters": filters, "limit": 0})[1]["total"]
+
+def test_fixture_columns_are_compacted(ventes):
+    # Les cas ci-dessous n ont de sens que si le stockage est bien retreci
+    assert ventes["Quantite"].dtype == np.int8
+    assert ventes["Prix_Unitaire"].dtype == np.int32
+
+def test_float_value_on_integer_column(ventes):
+    assert total([{"column": "Prix_Unitaire", "op": ">", "value": 12.5}]) == int((ventes["Prix_Unitaire"] > 12.5).sum())
+    assert total([{"column": "Quantite", "op": "==", "value": 3.5}]) == 0
+
+def test_value_out_of_storage_range(ventes):
+    assert total([{"column": "Quantite", "op": "<", "value": 200}]) == len(ventes)
+    assert total([{"column": "Quantite", "op": ">", "value": -1000}]) == len(ventes)
+    assert total([{"column": "Prix_Unitaire", "op": "<=", "value": 10 ** 12}]) == len(ventes)
+
+def test_in_list_out_of_range(ventes):
+    expected = int(ventes["Quantite"].isin([1, 300]).sum())
+    assert total([{"column": "Quantite", "op": "in", "value": [1, 300]}]) == expected
+    assert total([{"column": "Quantite", "op": "not_in", "value": [1, 300]}]) == len(ventes) - expected
+
+def test_incompatible_value_still_rejected(ventes):
+    with pytest.raises(ValueError, match="Valeur incompatible"):
+        total([{"column": "Quantite", "op": ">", "value": "abc"}])
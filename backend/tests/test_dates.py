@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+import main
+
+def mixed_dates_csv(rows=600):
+    # Premier bloc ambigu (jour <= 12) puis des jours > 12 : l inference par bloc changeait d avis
+    rng = np.random.default_rng(0)
+    days = np.where(np.arange(rows) < rows * 4 // 5, rng.integers(1, 13, rows), rng.integers(13, 29, rows))
+    dates = [f"{d:02d}/{m:02d}/2023" for d, m in zip(days, rng.integers(1, 13, rows))]
+    dates[5] = "pas une date"
+    frame = pd.DataFrame({"Date": dates, "Montant": rng.integers(1, 100, rows)})
+    return frame.to_csv(index=False, sep=";").encode("utf-8")
+
+def test_streamed_dates_match_in_memory(monkeypatch):
+    data = mixed_dates_csv()
+    df = main.smart_read_excel(data)
+    monkeypatch.setattr(main, "STREAM_CHUNK_ROWS", 100)
+    columns, chunks = main.iter_raw_chunks(data)
+    state = main.new_stream_state(columns)
+    for chunk in chunks:
+        main.consume_stream_chunk(state, chunk)
+    state["spill"].close()
+    assert state["schema"]["date_formats"]["Date"] == "%m/%d/%Y"
+    assert int(state["nulls"]["Date"]) == int(df["Date"].isna().sum())
+
+def test_apply_schema_reuses_resolved_format():
+    first, schema = main.infer_schema(pd.DataFrame({"Date": ["05/03/2023", "06/03/2023", "07/03/2023"]}))
+    later = main.apply_schema(pd.DataFrame({"Date": ["25/03/2023", "05/03/2023"]}), schema)
+    assert first["Date"].iloc[0] == pd.Timestamp("2023-05-03")
+    assert later["Date"].isna().iloc[0]
+    assert later["Date"].iloc[1] == pd.Timestamp("2023-05-03")
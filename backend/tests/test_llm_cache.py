@@ -0,0 +1,45 @@
+import pytest
+
+import llm_cache
+
+@pytest.fixture
+def llm_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_DIR", str(tmp_path / "llm"))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_index", None)
+    return tmp_path / "llm"
+
+def wide_fingerprint(scale=None):
+    # Feuille large : 30 colonnes numeriques, une seule (ca) eventuellement modifiee
+    scale = scale or {}
+    kpis = []
+    for i in range(30):
+        name = "ca" if i == 0 else f"mesure_{i}"
+        factor = scale.get(name, 1.0)
+        kpis.append({"column": name, "average": 1234.5 * factor, "total": 1234500.0 * factor, "count": 1000})
+    schema_items = [(kpi["column"], "number") for kpi in kpis] + [("date", "date"), ("region", "category")]
+    return llm_cache.fingerprint("ventes", schema_items, kpis)
+
+def test_stable_kpis_hit(llm_cache_dir):
+    llm_cache.put_similar(wide_fingerprint(), {"insights": ["ok"]})
+    value, score = llm_cache.get_similar(wide_fingerprint({"ca": 1.05}))
+    assert value == {"insights": ["ok"]}
+
+@pytest.mark.parametrize("factor", [0.5, 2.0, -1.0])
+def test_kpi_moving_past_its_bucket_misses(llm_cache_dir, factor):
+    base = wide_fingerprint()
+    moved = wide_fingerprint({"ca": factor})
+    # Le Jaccard seul aurait rendu les insights de l ancien fichier
+    assert llm_cache.similarity(base["tokens"], moved["tokens"]) >= llm_cache.LLM_CACHE_SIMILARITY
+    llm_cache.put_similar(base, {"insights": ["ok"]})
+    value, _ = llm_cache.get_similar(moved)
+    assert value is None
+
+def test_move_within_a_bucket_width_across_a_boundary_hits(llm_cache_dir):
+    # 9900 -> 10100 change de tranche mais de moins d une largeur de tranche
+    base = [{"column": "ca", "average": 9900.0, "total": 9900.0, "count": 1}]
+    moved = [{"column": "ca", "average": 10100.0, "total": 10100.0, "count": 1}]
+    schema_items = [("ca", "number")] + [(f"c{i}", "category") for i in range(30)]
+    llm_cache.put_similar(llm_cache.fingerprint("ventes", schema_items, base), {"insights": ["ok"]})
+    value, _ = llm_cache.get_similar(llm_cache.fingerprint("ventes", schema_items, moved))
+    assert value == {"insights": ["ok"]}
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+import gemini_stub
+import llm
+
+@pytest.fixture(scope="module")
+def stub_url():
+    # Le faux serveur Gemini, servi pour de vrai sur un port local
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(gemini_stub.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            pytest.fail("Serveur Gemini de test non demarre")
+        time.sleep(0.02)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
+
+@pytest.fixture
+def stub(stub_url, monkeypatch):
+    monkeypatch.setattr(llm, "GEMINI_BASE_URL", stub_url)
+    monkeypatch.setattr(llm, "GEMINI_API_KEY", "test")
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(llm, "LLM_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(gemini_stub, "STUB_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(gemini_stub, "STUB_FAIL_FIRST", 0)
+    gemini_stub.state.update(requests=0, in_flight=0, max_in_flight=0)
+    return gemini_stub
+
+def run(coro):
+    # Un client par boucle d evenements
+    async def main():
+        try:
+            return await coro
+        finally:
+            await llm.close_client()
+    return asyncio.run(main())
+
+def stub_text(data):
+    return data["candidates"][0]["content"]["parts"][0]["text"]
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_then_succeeds(stub, monkeypatch, status):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 2)
+    monkeypatch.setattr(stub, "STUB_FAIL_STATUS", status)
+    data = run(llm.generate_content({"contents": []}))
+    assert json.loads(stub_text(data)) == stub.STUB_ANALYSIS
+    assert stub.state["requests"] == 3
+
+def test_gives_up_after_max_retries(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 100)
+    monkeypatch.setattr(stub, "STUB_FAIL_STATUS", 429)
+    data = run(llm.generate_content({"contents": []}))
+    assert data == {"error": {"code": 429, "message": "stub failure"}}
+    assert stub.state["requests"] == llm.LLM_MAX_RETRIES + 1
+
+def test_client_errors_are_not_retried(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 100)
+    monkeypatch.setattr(stub, "STUB_FAIL_STATUS", 400)
+    data = run(llm.generate_content({"contents": []}))
+    assert data["error"]["code"] == 400
+    assert stub.state["requests"] == 1
+
+def test_total_timeout_cuts_the_call(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_DELAY_SECONDS", 2.0)
+    monkeypatch.setattr(llm, "LLM_TOTAL_TIMEOUT", 0.3)
+    started = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        run(llm.generate_content({"contents": []}))
+    assert time.perf_counter() - started < 1.5
+    assert stub.state["requests"] == 1
+
+def test_semaphore_limits_concurrent_calls(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_DELAY_SECONDS", 0.2)
+    monkeypatch.setattr(llm, "LLM_MAX_CONCURRENCY", 2)
+
+    async def burst():
+        return await asyncio.gather(*(llm.generate_content({"contents": []}) for _ in range(6)))
+    results = run(burst())
+    assert len(results) == 6
+    assert stub.state["requests"] == 6
+    assert stub.state["max_in_flight"] == 2
+
+def test_stream_retries_before_first_chunk(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 1)
+    monkeypatch.setattr(stub, "STUB_FAIL_STATUS", 503)
+
+    async def collect():
+        return "".join([chunk async for chunk in llm.stream_content({"contents": []})])
+    assert json.loads(run(collect())) == stub.STUB_ANALYSIS
+    assert stub.state["requests"] == 2
+
+def test_stream_gives_up_with_the_final_error(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 100)
+    monkeypatch.setattr(stub, "STUB_FAIL_STATUS", 503)
+
+    async def collect():
+        return [chunk async for chunk in llm.stream_content({"contents": []})]
+    with pytest.raises(Exception, match="Gemini error 503"):
+        run(collect())
+    assert stub.state["requests"] == llm.LLM_MAX_RETRIES + 1
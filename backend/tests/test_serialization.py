@@ -0,0 +1,30 @@
+import pickle
+
+import pytest
+
+import main
+import serialization
+
+pa = pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def basic_stats(fixture_bytes):
+    df, schema = main.read_typed_excel(fixture_bytes("test_ventes_commerce.xlsx"))
+    return main.extract_basic_stats(df, schema)
+
+def test_stats_keep_their_arrays(basic_stats):
+    assert serialization.table_columns(basic_stats["kpis"]) is not None
+    assert serialization.table_columns(basic_stats["charts"]) is not None
+    assert all(isinstance(chart["values"], list) for chart in basic_stats["charts"])
+    # Retour des processus du pool : les tableaux suivent
+    copy = pickle.loads(pickle.dumps(basic_stats))
+    assert serialization.table_columns(copy["kpis"]).keys() == serialization.table_columns(basic_stats["kpis"]).keys()
+
+def test_tables_match_the_cached_dicts(basic_stats):
+    # Resultat relu du cache : listes simples, tables reconstruites depuis les dicts
+    cached = {"kpis": list(basic_stats["kpis"]), "charts": list(basic_stats["charts"])}
+    sections = [("", basic_stats), ("Feuille 2", basic_stats)]
+    cached_sections = [("", cached), ("Feuille 2", cached)]
+    assert serialization.kpi_table(sections).equals(serialization.kpi_table(cached_sections))
+    assert serialization.chart_table(sections).equals(serialization.chart_table(cached_sections))
+    assert serialization.kpi_table(sections).column("total").to_pylist() == [kpi["total"] for _, s in sections for kpi in s["kpis"]]
@@ -0,0 +1,83 @@
+import os
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import sessions
+
+SESSION_ID = "0" * 32
+
+def sales_csv(rows, total=300):
+    # Les fichiers plus courts sont des prefixes exacts des plus longs (ajout de lignes en fin de fichier)
+    rng = np.random.default_rng(3)
+    frame = pd.DataFrame({
+        "Date": pd.date_range("2024-01-13", periods=total, freq="D").strftime("%d/%m/%Y"),
+        "Region": rng.choice(["Nord", "Sud", "Est"], total),
+        "Actif": rng.choice(["oui", "non"], total),
+        "Montant": rng.integers(10, 500, total),
+        "Remise": rng.random(total).round(2),
+    })
+    return frame.head(rows).to_csv(index=False, sep=";").encode("utf-8")
+
+def codes_xlsx(rows, text_from=150):
+    # Colonne Code : chiffres en texte sur les premieres lignes, codes alphanumeriques ensuite
+    frame = pd.DataFrame({
+        "Montant": np.arange(rows) * 10 + 5,
+        "Code": [str(i) if i < text_from else f"C{i}" for i in range(rows)],
+    })
+    buffer = BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+@pytest.fixture(params=["zscore", "mad"])
+def method(request, monkeypatch, cache_dir):
+    monkeypatch.setattr(main, "ANOMALY_METHOD", request.param)
+    return request.param
+
+def test_session_is_stored_without_pickle(method):
+    main.update_session_state(sales_csv(120), SESSION_ID)
+    folder = main.cache.entry_dir(SESSION_ID)
+    assert sorted(f for f in os.listdir(folder) if f.startswith("session")) == ["session.json", "session.npz"]
+    saved = sessions.load(SESSION_ID)
+    assert saved["state"]["rows"] == 120
+    assert saved["state"]["schema"]["date_formats"]["Date"] == "%d/%m/%Y"
+
+def test_incremental_update_matches_full_analysis(method, monkeypatch):
+    # Ancien fichier plus long qu un bloc : meme schema que le recalcul complet
+    monkeypatch.setattr(main, "STREAM_CHUNK_ROWS", 100)
+    main.update_session_state(sales_csv(200), SESSION_ID)
+    stats, summary, info = main.update_session_state(sales_csv(260), SESSION_ID)
+    assert info["mode"] == "incremental" and info["appended_rows"] == 60
+    full_stats, full_summary, _ = main.update_session_state(sales_csv(260), "1" * 32)
+    assert stats == full_stats
+    assert summary == full_summary
+
+def test_unreadable_state_falls_back_to_full(cache_dir):
+    main.update_session_state(sales_csv(50), SESSION_ID)
+    with open(main.cache.entry_path(SESSION_ID, "session.json"), "w") as f:
+        f.write("{")
+    assert sessions.load(SESSION_ID) is None
+    assert main.update_session_state(sales_csv(60), SESSION_ID)[2]["mode"] == "full"
+
+def test_short_prefix_is_recomputed_when_types_change(cache_dir):
+    main.update_session_state(codes_xlsx(100), SESSION_ID)
+    stats, summary, info = main.update_session_state(codes_xlsx(1000), SESSION_ID)
+    assert info["mode"] == "full"
+    assert stats["number_cols"] == ["Montant"]
+    assert summary["missing_values"] == 0
+    full_stats, full_summary, _ = main.update_session_state(codes_xlsx(1000), "1" * 32)
+    assert stats == full_stats
+    assert summary == full_summary
+
+@pytest.mark.parametrize("text_from, mode", [(150, "full"), (2000, "incremental")])
+def test_appended_rows_changing_a_column_kind_fall_back_to_full(cache_dir, monkeypatch, text_from, mode):
+    monkeypatch.setattr(main, "STREAM_CHUNK_ROWS", 50)
+    main.update_session_state(codes_xlsx(100, text_from), SESSION_ID)
+    stats, summary, info = main.update_session_state(codes_xlsx(1000, text_from), SESSION_ID)
+    assert info["mode"] == mode
+    full_stats, full_summary, _ = main.update_session_state(codes_xlsx(1000, text_from), "1" * 32)
+    assert stats == full_stats
+    assert summary == full_summary
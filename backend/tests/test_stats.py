@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+def skewed_frame():
+    # Queue lourde : les trois methodes ne signalent pas le meme nombre de valeurs
+    rng = np.random.default_rng(7)
+    return pd.DataFrame({
+        "Montant": np.concatenate([rng.normal(1000, 50, 400), [1300, 1400, 1600, 2500, 9000]]),
+        "Region": rng.choice(["Nord", "Sud"], 405),
+    })
+
+def expected_outliers(values, method):
+    values = pd.Series(values).dropna()
+    if method == "mad":
+        median = values.median()
+        mad = (values - median).abs().median()
+        return int(((values - median).abs() > main.MAD_LIMIT * main.MAD_SCALE * mad).sum())
+    if method == "iqr":
+        q1, q3 = values.quantile([0.25, 0.75])
+        iqr = q3 - q1
+        return int(((values < q1 - main.IQR_FACTOR * iqr) | (values > q3 + main.IQR_FACTOR * iqr)).sum())
+    return int(((values - values.mean()).abs() > main.ZSCORE_LIMIT * values.std()).sum())
+
+@pytest.mark.parametrize("method", ["zscore", "mad", "iqr"])
+def test_extract_basic_stats_follows_anomaly_method(monkeypatch, method):
+    monkeypatch.setattr(main, "ANOMALY_METHOD", method)
+    df = skewed_frame()
+    stats = main.extract_basic_stats(df.copy())
+    assert stats["anomalies"] == [main.build_anomaly("Montant", expected_outliers(df["Montant"], method))]
+
+def test_methods_flag_different_counts():
+    values = skewed_frame()["Montant"]
+    assert len({expected_outliers(values, m) for m in ("zscore", "mad", "iqr")}) == 3
+
+@pytest.mark.parametrize("value", [
+    12345678901234.567, 1e13, np.nextafter(1e13, 0), main.ROUND_EXACT_LIMIT,
+    np.nextafter(main.ROUND_EXACT_LIMIT, 0), -np.nextafter(main.ROUND_EXACT_LIMIT, 0),
+    np.nextafter(main.ROUND_EXACT_LIMIT, np.inf), 1e17, 2.675, 1.005, 0.125, -0.125, 123456789.125,
+])
+def test_round2_matches_round_at_boundaries(value):
+    assert main.round2([value])[0] == round(float(value), 2)
+
+def test_round2_matches_round_across_magnitudes():
+    rng = np.random.default_rng(1)
+    values = np.concatenate([rng.uniform(-1, 1, 2000) * 10.0 ** e for e in range(-2, 18)])
+    values = np.concatenate([values, np.round(values, 3) + 0.005])
+    assert main.round2(values).tolist() == [round(float(v), 2) for v in values]
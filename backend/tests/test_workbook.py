@@ -0,0 +1,63 @@
+import asyncio
+import shutil
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import jobs
+import main
+import uploads
+import workers
+
+SHEETS = ("Janvier", "Fevrier", "Mars")
+
+@pytest.fixture
+def workbook_upload(tmp_path, cache_dir, monkeypatch):
+    # Pool en threads : les taches soumises restent comptees dans workers.metrics()
+    monkeypatch.setattr(workers, "WORKER_PROCESSES", 0)
+    rng = np.random.default_rng(5)
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        for name in SHEETS:
+            pd.DataFrame({
+                "Region": rng.choice(["Nord", "Sud", "Est"], 60),
+                "Montant": rng.integers(10, 500, 60),
+            }).to_excel(writer, sheet_name=name, index=False)
+        pd.DataFrame().to_excel(writer, sheet_name="Vide", index=False)
+    path = tmp_path / "classeur.xlsx"
+    path.write_bytes(buffer.getvalue())
+    spool = tmp_path / "spool.xlsx"
+    shutil.copy(path, spool)
+    upload = uploads.SpooledUpload(str(spool), path.stat().st_size, "ab" * 32, "classeur.xlsx")
+    yield upload
+    upload.release()
+
+def submitted():
+    # Une tache par feuille listee (la feuille vide comprise), aucune pour la feuille active en plus
+    return workers.metrics()["submitted"]
+
+def test_analyze_order_parses_each_sheet_once(workbook_upload):
+    before = submitted()
+
+    async def run():
+        workbook = await main.cached_workbook(workbook_upload)
+        return workbook, await main.cached_pipeline(workbook_upload)
+    workbook, (_, _, basic_stats, summary) = asyncio.run(run())
+    assert submitted() - before == len(SHEETS) + 1
+    assert [sheet["name"] for sheet in workbook["sheets"]] == list(SHEETS)
+    assert [sheet["active"] for sheet in workbook["sheets"]] == [True, False, False]
+    assert workbook["sheets"][0]["summary"] == summary
+
+def test_analysis_job_parses_each_sheet_once(workbook_upload, monkeypatch):
+    async def no_insights(*args):
+        return {}
+    monkeypatch.setattr(main, "stream_job_insights", no_insights)
+    job = jobs.store.create("analyze", {"filename": "classeur.xlsx"})
+    before = submitted()
+    asyncio.run(main.run_analysis_job(job["id"], workbook_upload.retain()))
+    assert submitted() - before == len(SHEETS) + 1
+    result = jobs.store.get(job["id"])
+    assert result["status"] == "done"
+    assert len(result["result"]["sheets"]) == len(SHEETS)
@@ -0,0 +1,139 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Les sommes sont tenues au jour (une passe sur les lignes, cumulable en streaming),
+# puis regroupees a la granularite retenue
+BASE_FREQ = "D"
+GRANULARITIES = ("D", "W", "M", "Q")
+GRANULARITY_LABELS = {"D": "jour", "W": "semaine", "M": "mois", "Q": "trimestre"}
+TIMESERIES_FREQ = os.environ.get("TIMESERIES_FREQ", "auto")
+TIMESERIES_MAX_POINTS = int(os.environ.get("TIMESERIES_MAX_POINTS", "60"))
+TIMESERIES_MIN_COVERAGE = int(os.environ.get("TIMESERIES_MIN_COVERAGE_PCT", "80")) / 100
+TREND_DROP_PCT = int(os.environ.get("TREND_DROP_PCT", "20"))
+TREND_BREAK_LIMIT = 3.0
+ROLLING_WINDOWS = {"D": 14, "W": 8, "M": 6, "Q": 4}
+SEASON_LENGTHS = {"D": 7, "W": 52, "M": 12, "Q": 4}
+ALERT_PRIORITY = ("drop", "seasonal", "break")
+
+# ============================================
+# Reechantillonnage
+# ============================================
+def daily_sums(dates, block):
+    # Sommes de toutes les colonnes numeriques par jour, lignes sans date ignorees
+    codes, uniques = pd.factorize(dates.dt.to_period(BASE_FREQ), sort=True)
+    valid = codes >= 0
+    block = block if valid.all() else block.loc[valid]
+    # float64 : les colonnes compactees (int8, float32...) ne doivent ni deborder ni perdre en precision
+    sums = block.astype(np.float64).groupby(codes[valid]).sum()
+    sums.index = pd.PeriodIndex(uniques[sums.index], freq=BASE_FREQ)
+    return sums
+
+def period_span(days, freq):
+    periods = days.asfreq(freq)
+    return (periods[-1] - periods[0]).n + 1, periods.nunique()
+
+def choose_granularity(days):
+    # La plus fine qui tient en TIMESERIES_MAX_POINTS points et dont les periodes sont presque toutes renseignees
+    # (donnees en jours ouvres -> semaines) ; sinon le mois, comme les graphiques d origine
+    if TIMESERIES_FREQ in GRANULARITIES:
+        return TIMESERIES_FREQ
+    for freq in GRANULARITIES:
+        span, filled = period_span(days, freq)
+        if span <= TIMESERIES_MAX_POINTS and filled >= span * TIMESERIES_MIN_COVERAGE:
+            return freq
+    return "M" if period_span(days, "M")[0] <= TIMESERIES_MAX_POINTS else "Q"
+
+def resample(daily, freq):
+    # Toutes les periodes entre la premiere et la derniere : les trous restent NaN
+    sums = daily.groupby(daily.index.asfreq(freq)).sum()
+    periods = pd.period_range(sums.index[0], sums.index[-1], freq=freq)
+    return periods, sums.reindex(periods).to_numpy(dtype=np.float64)
+
+def last_complete(days, freq):
+    # Index de la derniere periode a evaluer. La derniere est jugee entamee seulement (export en cours de mois...)
+    # quand ses donnees s arretent nettement plus tot dans la periode que d habitude : exclue des alertes, pas du graphique
+    owners = days.asfreq(freq)
+    offsets = pd.Series(days.asi8 - owners.asfreq(BASE_FREQ, how="start").asi8).groupby(owners.asi8).max().to_numpy()
+    last = (owners[-1] - owners[0]).n
+    if len(offsets) >= 3 and offsets[-1] < np.median(offsets[:-1]) * TIMESERIES_MIN_COVERAGE:
+        return last - 1
+    return last
+
+def period_labels(periods):
+    if periods.freqstr.startswith("W"):
+        return periods.start_time.strftime("%Y-%m-%d").tolist()
+    return periods.astype(str).tolist()
+
+# ============================================
+# Statistiques par periode : toutes les colonnes a la fois (periodes x colonnes)
+# ============================================
+def rolling_baseline(values, window):
+    # Moyenne et ecart-type glissants des periodes precedentes (la periode courante exclue)
+    previous = pd.DataFrame(values).shift(1).rolling(window)
+    return previous.mean().to_numpy(), previous.std().to_numpy()
+
+def seasonal_baseline(values, slots):
+    # Moyenne des periodes anterieures de meme rang saisonnier (meme mois, trimestre, jour de semaine...)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = pd.DataFrame(filled).groupby(slots).cumsum().to_numpy() - filled
+    counts = pd.DataFrame(present.astype(np.float64)).groupby(slots).cumsum().to_numpy() - present
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def period_change(values):
+    previous = np.vstack([np.full((1, values.shape[1]), np.nan), values[:-1]])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(previous > 0, values / previous - 1, np.nan), previous
+
+def analyze(daily, freq=None):
+    # daily : DataFrame des sommes par jour (index PeriodIndex journalier trie), une colonne par colonne numerique
+    freq = freq or choose_granularity(daily.index)
+    periods, values = resample(daily, freq)
+    window = ROLLING_WINDOWS[freq]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        rolling_mean, rolling_std = rolling_baseline(values, window)
+    seasonal = seasonal_baseline(values, periods.asi8 % SEASON_LENGTHS[freq])
+    change, previous = period_change(values)
+    labels = period_labels(periods)
+    return {
+        "freq": freq,
+        "columns": list(daily.columns),
+        "labels": labels,
+        "values": values,
+        "present": ~np.isnan(values),
+        "alerts": detect_alerts(values, change, previous, rolling_mean, rolling_std, seasonal,
+                                last_complete(daily.index, freq), labels, list(daily.columns)),
+    }
+
+def detect_alerts(values, change, previous, rolling_mean, rolling_std, seasonal, t, labels, columns):
+    # Trois tests sur la derniere periode complete, evalues pour toutes les colonnes ensemble ;
+    # une seule alerte par colonne, la plus grave d abord
+    if t < 1:
+        return []
+    current = values[t]
+    drop = TREND_DROP_PCT / 100
+    with np.errstate(invalid="ignore"):
+        tests = {
+            "drop": change[t] < -drop,
+            "seasonal": (seasonal[t] > 0) & (current < seasonal[t] * (1 - drop)),
+            "break": (rolling_std[t] > 0) & (np.abs(current - rolling_mean[t]) > TREND_BREAK_LIMIT * rolling_std[t]),
+        }
+    references = {"drop": previous[t], "seasonal": seasonal[t], "break": rolling_mean[t]}
+    kinds = np.select([tests[k] for k in ALERT_PRIORITY], list(range(len(ALERT_PRIORITY))), -1)
+    alerts = []
+    for i in np.flatnonzero(kinds >= 0):
+        kind = ALERT_PRIORITY[kinds[i]]
+        alerts.append({
+            "column": columns[i],
+            "kind": kind,
+            "period": labels[t],
+            "previous_period": labels[t - 1],
+            "value": float(current[i]),
+            "reference": float(references[kind][i]),
+        })
+    return alerts
@@ -0,0 +1,170 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+TRACE_MEMORY = os.environ.get("TRACE_MEMORY", "0") == "1"
+TRACE_LOG = os.environ.get("TRACE_LOG", "1") != "0"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "smart_excel"
+
+_current = contextvars.ContextVar("trace", default=None)
+_lock = threading.Lock()
+_stages = {}
+_requests = {}
+
+def start_trace(**attrs):
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    trace = {"attrs": attrs, "spans": [], "stack": [], "started": time.perf_counter()}
+    return trace, _current.set(trace)
+
+def stop_trace(token):
+    trace = _current.get()
+    _current.reset(token)
+    return trace
+
+def end_trace(token, observe_request=True):
+    trace = stop_trace(token)
+    if trace is None:
+        return None
+    elapsed = time.perf_counter() - trace["started"]
+    label = trace["attrs"].get("format", "unknown")
+    for record in trace["spans"]:
+        observe(record, label)
+    if observe_request and "path" in trace["attrs"]:
+        with _lock:
+            observe_histogram(_requests, (trace["attrs"]["path"],), elapsed)
+    if TRACE_LOG and trace["spans"]:
+        print(f"[TRACE] {json.dumps(summarize(trace, elapsed), ensure_ascii=True, default=str)}")
+    return trace
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        trace["attrs"].update(attrs)
+
+def annotate_file(name, size, fmt):
+    # Le format du premier fichier sert de label aux histogrammes
+    trace = _current.get()
+    if trace is not None:
+        trace["attrs"].setdefault("format", fmt)
+        trace["attrs"].setdefault("files", []).append({"name": name, "bytes": size, "format": fmt})
+
+@contextmanager
+def span(name, **attrs):
+    trace = _current.get()
+    record = {"name": name, **attrs}
+    frame = {"peak": 0}
+    if trace is not None and TRACE_MEMORY and tracemalloc.is_tracing():
+        peak = tracemalloc.get_traced_memory()[1]
+        for parent in trace["stack"]:
+            parent["peak"] = max(parent["peak"], peak)
+        tracemalloc.reset_peak()
+        trace["stack"].append(frame)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        if frame in (trace["stack"] if trace is not None else ()):
+            trace["stack"].remove(frame)
+            record["peak_memory_bytes"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            for parent in trace["stack"]:
+                parent["peak"] = max(parent["peak"], record["peak_memory_bytes"])
+        if trace is not None:
+            trace["spans"].append(record)
+        else:
+            observe(record, "unknown")
+
+def record(name, seconds, **attrs):
+    entry = {"name": name, "seconds": seconds, **attrs}
+    trace = _current.get()
+    if trace is not None:
+        trace["spans"].append(entry)
+    else:
+        observe(entry, "unknown")
+
+def merge(spans):
+    # Spans remontes par un processus du pool
+    trace = _current.get()
+    for entry in spans:
+        if trace is not None:
+            trace["spans"].append(entry)
+        else:
+            observe(entry, "unknown")
+
+def observe_histogram(table, labels, seconds):
+    stats = table.get(labels)
+    if stats is None:
+        stats = table[labels] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0,
+                                 "rows": 0, "bytes": 0, "peak": 0}
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            stats["buckets"][i] += 1
+    stats["sum"] += seconds
+    stats["count"] += 1
+    return stats
+
+def observe(entry, label):
+    with _lock:
+        stats = observe_histogram(_stages, (entry["name"], label), entry["seconds"])
+        stats["rows"] += int(entry.get("rows") or 0)
+        stats["bytes"] += int(entry.get("bytes") or 0)
+        stats["peak"] = max(stats["peak"], int(entry.get("peak_memory_bytes") or 0))
+
+def summarize(trace, elapsed):
+    stages = {}
+    for entry in trace["spans"]:
+        stage = stages.setdefault(entry["name"], {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += entry["seconds"]
+        stage["calls"] += 1
+        for key in ("rows", "columns", "bytes", "peak_memory_bytes"):
+            if entry.get(key) is not None:
+                stage[key] = max(stage.get(key, 0), int(entry[key]))
+    for stage in stages.values():
+        stage["seconds"] = round(stage["seconds"], 4)
+    return {**trace["attrs"], "seconds": round(elapsed, 4), "stages": stages}
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", " ")
+
+def labels_text(pairs):
+    return ",".join(f'{key}="{escape(value)}"' for key, value in pairs)
+
+def histogram_lines(name, help_text, table, label_names):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, stats in sorted(table.items()):
+        base = labels_text(zip(label_names, labels))
+        for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+            lines.append(f'{name}_bucket{{{base},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{base},le="+Inf"}} {stats["count"]}')
+        lines.append(f"{name}_sum{{{base}}} {stats['sum']:.6f}")
+        lines.append(f"{name}_count{{{base}}} {stats['count']}")
+    return lines
+
+def gauge_lines(name, help_text, kind, values):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in values:
+        lines.append(f"{name}{{{labels_text(labels)}}} {value}" if labels else f"{name} {value}")
+    return lines
+
+def render_metrics(extra=()):
+    with _lock:
+        stages = {k: {**v, "buckets": list(v["buckets"])} for k, v in _stages.items()}
+        requests = {k: {**v, "buckets": list(v["buckets"])} for k, v in _requests.items()}
+    stage_labels = ("stage", "format")
+    lines = histogram_lines(f"{METRIC_PREFIX}_stage_seconds", "Duree de chaque etape du pipeline", stages, stage_labels)
+    lines += histogram_lines(f"{METRIC_PREFIX}_request_seconds", "Duree totale des requetes", requests, ("path",))
+    lines += gauge_lines(f"{METRIC_PREFIX}_stage_rows_total", "Lignes traitees par etape", "counter",
+                         [(zip(stage_labels, k), v["rows"]) for k, v in sorted(stages.items()) if v["rows"]])
+    lines += gauge_lines(f"{METRIC_PREFIX}_stage_bytes_total", "Octets traites par etape", "counter",
+                         [(zip(stage_labels, k), v["bytes"]) for k, v in sorted(stages.items()) if v["bytes"]])
+    lines += gauge_lines(f"{METRIC_PREFIX}_stage_peak_memory_bytes", "Pic memoire Python observe par etape (TRACE_MEMORY=1)", "gauge",
+                         [(zip(stage_labels, k), v["peak"]) for k, v in sorted(stages.items()) if v["peak"]])
+    for name, help_text, kind, value in extra:
+        lines += gauge_lines(f"{METRIC_PREFIX}_{name}", help_text, kind, [((), value)])
+    return "\n".join(lines) + "\n"
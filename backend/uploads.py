@@ -0,0 +1,143 @@
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", tempfile.gettempdir())
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_KB", "1024")) * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+class UploadRejected(ValueError):
+    # Fichier refuse (vide, trop volumineux, pas un tableur...) : l endpoint repond avec status_code au lieu de 200
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Garde status_code quand l exception remonte d un processus du pool
+        return type(self), (str(self), self.status_code)
+
+class MappedReader(io.RawIOBase):
+    # Fichier en lecture seule sur un tampon (mmap, bytes) : position propre a chaque lecteur, sans copie du tampon
+    def __init__(self, buffer):
+        self.view = memoryview(buffer)
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: len(self.view)}[whence]
+        self.pos = max(base + offset, 0)
+        return self.pos
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(self.pos + size, len(self.view))
+        data = self.view[self.pos:end].tobytes()
+        self.pos = max(end, self.pos)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+def open_buffer(data):
+    # BytesIO partage deja le tampon d un objet bytes ; un mmap passe par une vue memoire
+    return io.BytesIO(data) if isinstance(data, bytes) else MappedReader(data)
+
+def map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def close_map(data):
+    if isinstance(data, mmap.mmap):
+        try:
+            data.close()
+        except BufferError:
+            # Un DataFrame pointe encore dans le fichier (Arrow sans copie) : liberation au ramasse-miettes
+            pass
+
+@contextmanager
+def mapped(source):
+    # Les taches du pool recoivent le chemin du fichier, les appels directs des bytes
+    if not isinstance(source, str):
+        yield source
+        return
+    data = map_file(source)
+    try:
+        yield data
+    finally:
+        close_map(data)
+
+class SpooledUpload:
+    # Fichier recu sur disque, hache au fil de l eau ; supprime quand plus personne ne le retient
+    def __init__(self, path, size, digest, name=None):
+        self.path = path
+        self.size = size
+        self.digest = digest
+        self.name = name
+        self.refs = 1
+        self._data = None
+
+    def data(self):
+        if self._data is None:
+            self._data = map_file(self.path)
+        return self._data
+
+    def retain(self):
+        self.refs += 1
+        return self
+
+    def release(self):
+        self.refs -= 1
+        if self.refs > 0:
+            return
+        if self._data is not None:
+            close_map(self._data)
+            self._data = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+async def spool(file, check=None):
+    # Copie par blocs vers un fichier temporaire : memoire bornee a un bloc, SHA-256 calcule en route.
+    # check(premier_bloc) peut lever ValueError pour refuser le fichier avant de lire la suite.
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix="upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if size == 0 and check is not None:
+                    check(chunk)
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadRejected(f"Fichier trop volumineux (maximum {MAX_UPLOAD_BYTES // (1024 * 1024)} Mo)", 413)
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise UploadRejected("Fichier vide")
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest(), getattr(file, "filename", None))
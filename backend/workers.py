@@ -0,0 +1,149 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import tracing
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", str(min(os.cpu_count() or 1, 4))))
+WORKER_START_METHOD = os.environ.get("WORKER_START_METHOD", "spawn")
+
+_executor = None
+_manager = None
+_metrics = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "in_flight": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "run_seconds_total": 0.0,
+    "run_seconds_max": 0.0,
+}
+
+def preload(module_name):
+    importlib.import_module(module_name)
+
+def start_pool(preload_modules=()):
+    global _executor
+    if _executor is None and WORKER_PROCESSES > 0:
+        _executor = ProcessPoolExecutor(
+            max_workers=WORKER_PROCESSES,
+            mp_context=multiprocessing.get_context(WORKER_START_METHOD)
+        )
+        for _ in range(WORKER_PROCESSES):
+            for module_name in preload_modules:
+                _executor.submit(preload, module_name)
+        print(f"[WORKERS] Pool demarre ({WORKER_PROCESSES} processus, {WORKER_START_METHOD})")
+    return _executor
+
+def shutdown_pool():
+    global _executor, _manager
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    if _manager is not None:
+        _manager.shutdown()
+    _executor = None
+    _manager = None
+
+def frame_to_ipc(df):
+    if df is None:
+        return None
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return ("arrow", sink.getvalue())
+        except Exception:
+            pass
+    return ("pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+
+def frame_from_ipc(payload):
+    if payload is None:
+        return None
+    kind, data = payload
+    if kind == "arrow":
+        with pa.ipc.open_stream(data) as reader:
+            return reader.read_all().to_pandas()
+    return pickle.loads(data)
+
+def timed_call(fn, submitted_at, progress_queue, *args):
+    started_at = time.time()
+    # Les spans du processus enfant remontent avec le resultat
+    _, token = tracing.start_trace()
+    try:
+        if progress_queue is None:
+            result = fn(*args)
+        else:
+            result = fn(*args, progress=lambda stage, data: progress_queue.put((stage, data)))
+    finally:
+        trace = tracing.stop_trace(token)
+    return result, started_at - submitted_at, time.time() - started_at, trace["spans"]
+
+def new_progress_queue():
+    global _manager
+    if _executor is None:
+        return queue.Queue()
+    if _manager is None:
+        _manager = multiprocessing.get_context(WORKER_START_METHOD).Manager()
+    return _manager.Queue()
+
+async def pump_progress(progress_queue, future, progress):
+    while True:
+        try:
+            stage, data = await asyncio.to_thread(progress_queue.get, True, 0.2)
+        except queue.Empty:
+            if future.done():
+                break
+            continue
+        progress(stage, data)
+
+def metrics():
+    done = _metrics["completed"] + _metrics["failed"]
+    return {
+        **_metrics,
+        "workers": WORKER_PROCESSES,
+        "queue_depth": max(0, _metrics["in_flight"] - max(WORKER_PROCESSES, 1)),
+        "wait_seconds_avg": _metrics["wait_seconds_total"] / done if done else 0.0,
+        "run_seconds_avg": _metrics["run_seconds_total"] / done if done else 0.0,
+    }
+
+async def run_in_pool(fn, *args, progress=None):
+    loop = asyncio.get_running_loop()
+    executor = start_pool()
+    _metrics["submitted"] += 1
+    _metrics["in_flight"] += 1
+    submitted_at = time.time()
+    progress_queue = new_progress_queue() if progress else None
+    try:
+        future = loop.run_in_executor(executor, timed_call, fn, submitted_at, progress_queue, *args)
+        if progress_queue is not None:
+            await pump_progress(progress_queue, future, progress)
+        result, wait, elapsed, spans = await future
+    except Exception:
+        _metrics["failed"] += 1
+        raise
+    else:
+        _metrics["completed"] += 1
+        _metrics["wait_seconds_total"] += wait
+        _metrics["wait_seconds_max"] = max(_metrics["wait_seconds_max"], wait)
+        _metrics["run_seconds_total"] += elapsed
+        _metrics["run_seconds_max"] = max(_metrics["run_seconds_max"], elapsed)
+        tracing.record("worker_queue", wait)
+        tracing.merge(spans)
+        if wait > 1:
+            print(f"[WORKERS] Attente file: {wait:.2f}s (en cours: {_metrics['in_flight']})")
+        return result
+    finally:
+        _metrics["in_flight"] -= 1
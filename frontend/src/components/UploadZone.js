@@ -9,7 +9,7 @@ const translations = {
     subtitle: "Uploadez n'importe quel fichier Excel — notre IA analyse tout automatiquement et génère un dashboard professionnel en quelques secondes.",
     button: "Analyser mon fichier Excel",
     drag: "ou glissez-déposez votre fichier ici",
-    formats: "Formats acceptés : .xlsx, .xls",
+    formats: "Formats acceptés : .xlsx, .xls, .ods, .csv, .parquet, .arrow",
     dragging: "Relâchez pour analyser !",
     stats: [
       { value: "100%", label: "Automatique" },
@@ -34,7 +34,7 @@ const translations = {
     subtitle: "Upload any Excel file — our AI analyzes everything automatically and generates a professional dashboard in seconds.",
     button: "Analyze my Excel file",
     drag: "or drag and drop your file here",
-    formats: "Accepted formats: .xlsx, .xls",
+    formats: "Accepted formats: .xlsx, .xls, .ods, .csv, .parquet, .arrow",
     dragging: "Release to analyze!",
     stats: [
       { value: "100%", label: "Automatic" },
@@ -137,7 +137,7 @@ function UploadZone({ onUpload, language }) {
         <input
           id="fileInput"
           type="file"
-          accept=".xlsx,.xls"
+          accept=".xlsx,.xls,.ods,.csv,.parquet,.arrow"
           className="hidden"
           onChange={handleChange}
         />
@@ -19,7 +19,7 @@ const translations = {
     compare: "Comparer",
     selectTwo: "Sélectionnez un 2ème fichier",
     files: "fichier(s)",
-    formats: "Formats acceptés : .xlsx, .xls",
+    formats: "Formats acceptés : .xlsx, .xls, .ods, .csv, .parquet, .arrow",
     search: "Rechercher un fichier...",
     sortDate: "Date",
     sortName: "Nom",
@@ -37,7 +37,7 @@ const translations = {
     compare: "Compare",
     selectTwo: "Select a 2nd file",
     files: "file(s)",
-    formats: "Accepted formats: .xlsx, .xls",
+    formats: "Accepted formats: .xlsx, .xls, .ods, .csv, .parquet, .arrow",
     search: "Search a file...",
     sortDate: "Date",
     sortName: "Name",
@@ -248,7 +248,7 @@ function WorkspaceDetail({ workspace, language, onBack }) {
           <input
             id="wsFileInput"
             type="file"
-            accept=".xlsx,.xls"
+            accept=".xlsx,.xls,.ods,.csv,.parquet,.arrow"
             className="hidden"
             onChange={e => { if (e.target.files[0]) handleUpload(e.target.files[0]); }}
           />